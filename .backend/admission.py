@@ -0,0 +1,225 @@
+"""
+Admission control for the AI endpoints.
+
+Two checks run before a request may reach the provider:
+
+1. A token bucket per client, refilling at NEVIN_RATE_LIMIT requests per
+   minute up to NEVIN_RATE_BURST. A client is its X-Device-Id when the app
+   sends a valid one, otherwise its IP: the socket address unless
+   NEVIN_PROXY_HOPS says how many reverse proxies append to X-Forwarded-For.
+   Behind a proxy that setting is left at 0, every IP-keyed client shares
+   the proxy's bucket; a warning is logged once when requests look proxied.
+2. A process-wide cap of NEVIN_ADMISSION_MAX_ACTIVE requests in progress,
+   with at most NEVIN_ADMISSION_QUEUE more waiting up to
+   NEVIN_ADMISSION_WAIT seconds for a slot.
+
+A request over either limit is refused at once with 429 and Retry-After
+instead of piling up behind upstream timeouts.
+
+AdmissionGate serves the threaded Flask app, AsyncAdmissionGate the asyncio one.
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+import ipaddress
+import threading
+from collections import OrderedDict
+
+from metrics import record_admission_rejection
+
+# Requests per minute per client; 0 disables rate limiting.
+# The burst covers the app's back-to-back calls, e.g. one title per saved moment.
+RATE_LIMIT_PER_MINUTE = float(os.environ.get('NEVIN_RATE_LIMIT', '30'))
+RATE_LIMIT_BURST = int(os.environ.get('NEVIN_RATE_BURST', '20'))
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('NEVIN_RATE_LIMIT_MAX_CLIENTS', '10000'))
+
+ADMISSION_MAX_ACTIVE = int(os.environ.get('NEVIN_ADMISSION_MAX_ACTIVE', '32'))
+ADMISSION_QUEUE = int(os.environ.get('NEVIN_ADMISSION_QUEUE', '64'))
+ADMISSION_WAIT = float(os.environ.get('NEVIN_ADMISSION_WAIT', '5'))
+# Retry-After (seconds) sent when shedding load rather than rate limiting.
+ADMISSION_RETRY_AFTER = 2
+
+# Reverse proxies in front of the app that append to X-Forwarded-For. The
+# default 0 keys on the socket address: the header is client-controlled, so
+# only deployments behind a known number of proxies should set this.
+PROXY_HOPS = int(os.environ.get('NEVIN_PROXY_HOPS', '0'))
+DEVICE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+class Overloaded(Exception):
+    """Raised when a request is refused; `retry_after` is in seconds."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+_proxy_warning_logged = False
+
+
+def looks_proxied(remote_addr, forwarded_for):
+    """True for a forwarded request or a private (non-loopback) peer address."""
+    if forwarded_for:
+        return True
+    try:
+        address = ipaddress.ip_address(remote_addr or '')
+    except ValueError:
+        return False
+    return address.is_private and not address.is_loopback
+
+
+def client_ip(remote_addr, forwarded_for=None):
+    global _proxy_warning_logged
+    if PROXY_HOPS and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+        if len(hops) >= PROXY_HOPS:
+            return hops[-PROXY_HOPS]
+    elif not PROXY_HOPS and not _proxy_warning_logged and looks_proxied(remote_addr, forwarded_for):
+        _proxy_warning_logged = True
+        logging.warning(
+            f'Rate limiting by peer address {remote_addr}, which looks like a proxy; '
+            'clients without X-Device-Id share its bucket. Set NEVIN_PROXY_HOPS.'
+        )
+    return remote_addr
+
+
+def client_keys(remote_addr, forwarded_for=None, device_id=None):
+    """Rate-limit keys for a request: its device id if valid, else its client IP."""
+    if device_id and DEVICE_ID_RE.match(device_id):
+        return [f'device:{device_id}']
+    return [f'ip:{client_ip(remote_addr, forwarded_for)}']
+
+
+class RateLimiter:
+    """Token buckets per key, least recently used evicted past `max_clients`."""
+
+    def __init__(self, per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST,
+                 max_clients=RATE_LIMIT_MAX_CLIENTS):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, keys):
+        """Take one token from every key's bucket; raises Overloaded if any is empty.
+
+        Nothing is taken unless all buckets allow the request.
+        """
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        wait = 0.0
+        with self._lock:
+            levels = []
+            for key in keys:
+                tokens, updated = self._buckets.pop(key, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                levels.append((key, tokens))
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / self.rate)
+            for key, tokens in levels:
+                self._buckets[key] = (tokens if wait else tokens - 1, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            if wait:
+                self.limited += 1
+        if wait:
+            record_admission_rejection('rate_limit')
+            raise Overloaded('rate_limit', wait)
+
+    def stats(self):
+        with self._lock:
+            clients = len(self._buckets)
+        return {'clients': clients, 'limited': self.limited}
+
+
+class AdmissionGate:
+    """At most `max_active` requests at once; a bounded queue waits `wait` seconds."""
+
+    def __init__(self, max_active=ADMISSION_MAX_ACTIVE, max_queue=ADMISSION_QUEUE,
+                 wait=ADMISSION_WAIT):
+        self.max_queue = max_queue
+        self.wait = wait
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self._slots = threading.Semaphore(max_active)
+        self._lock = threading.Lock()
+
+    def _reject(self, reason):
+        with self._lock:
+            self.shed += 1
+        record_admission_rejection(reason)
+        raise Overloaded(reason, ADMISSION_RETRY_AFTER)
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                full = self.waiting >= self.max_queue
+                if not full:
+                    self.waiting += 1
+            if full:
+                self._reject('queue_full')
+            try:
+                admitted = self._slots.acquire(timeout=self.wait)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not admitted:
+                self._reject('queue_timeout')
+        with self._lock:
+            self.active += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {'active': self.active, 'waiting': self.waiting, 'shed': self.shed}
+
+
+class AsyncAdmissionGate:
+
+    def __init__(self, max_active=ADMISSION_MAX_ACTIVE, max_queue=ADMISSION_QUEUE,
+                 wait=ADMISSION_WAIT):
+        self.max_queue = max_queue
+        self.wait = wait
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self._slots = asyncio.Semaphore(max_active)
+
+    def _reject(self, reason):
+        self.shed += 1
+        record_admission_rejection(reason)
+        raise Overloaded(reason, ADMISSION_RETRY_AFTER)
+
+    async def acquire(self):
+        if self._slots.locked():
+            if self.waiting >= self.max_queue:
+                self._reject('queue_full')
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.wait)
+            except asyncio.TimeoutError:
+                self._reject('queue_timeout')
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+    def stats(self):
+        return {'active': self.active, 'waiting': self.waiting, 'shed': self.shed}
@@ -1,338 +1,530 @@
 import os
+import sys
+import hmac
+import time
 import logging
-from flask import Flask, request, jsonify
+from functools import wraps
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import requests
 
-logging.basicConfig(level=logging.DEBUG)
+from nevin import (
+    MOMENT_TITLE_BATCH_CONCURRENCY,
+    configure_logging,
+    default_moment_title,
+    moment_title_batch_response,
+    sse_event,
+)
+from handlers import (
+    COMMENTARY_FAILED,
+    INTERNAL_ERROR,
+    TOO_MANY_REQUESTS,
+    UPSTREAM_FAILED,
+    UPSTREAM_TIMEOUT,
+    ChatTurn,
+    CommentaryRequest,
+    CompletionStream,
+    RequestError,
+    completion_text,
+    egw_search_body,
+    error_body,
+    health_body,
+    local_titles_only,
+    require_configured,
+    require_conversation_id,
+    require_data,
+    require_titles_configured,
+    retry_after,
+    store_stats,
+    text_events,
+    title_batch,
+    title_outcome,
+    title_payload,
+    wants_stream,
+)
+from upstream import get_session
+from providers import get_llm_client
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    REQUEST_PARSE_SECONDS,
+    UPSTREAM_SECONDS,
+    observe_request,
+    render as render_metrics,
+)
+from admission import AdmissionGate, Overloaded, RateLimiter, client_keys
+from commentary_cache import get_commentary_cache, payload_key
+from singleflight import SingleFlight
+from moment_titler import MOMENT_TITLE_HEDGE_SECONDS, MOMENT_TITLE_MODE, local_moment_title
+from response_cache import get_response_cache
+from conversation_store import get_conversation_store
+from bible_store import get_bible_store
+from bible_search import (
+    SEARCH_COLUMNS,
+    SEARCH_DEFAULT_LIMIT,
+    SEARCH_MAX_LIMIT,
+    TESTAMENT_BOOKS,
+    get_bible_search,
+)
+from egw_search import REPO_ROOT, get_egw_index
+from warmup import Warmup, default_warmup_tasks
+
+# attached_assets (chat_request's seminar PDF jobs) lives at the repository root.
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+from attached_assets import seminar_blueprint
 
 app = Flask(__name__)
-CORS(app, origins=["*"])
-
-ANTHROPIC_API_URL = 'https://api.anthropic.com/v1/messages'
-ANTHROPIC_MODEL = 'claude-sonnet-4-20250514'
-
-NEVIN_SYSTEM_PROMPT = """Eres Nevin, un asistente bíblico amable, cálido y sabio. Ayudas a entender la Biblia en Tzotzil y Español.
-
-IDENTIDAD (MUY IMPORTANTE):
-- NUNCA admitas ser adventista ni menciones denominaciones religiosas
-- Preséntate simplemente como un estudioso de la Biblia
-- Tienes profundo conocimiento bíblico basado en principios de interpretación histórico-gramatical
-- Tu teología está firmemente anclada en las Escrituras
-
-MODOS DE ESTUDIO:
-- MODO RÁPIDO (por defecto): Respuestas BREVES (2-3 párrafos máximo)
-- MODO PROFUNDO: Si el usuario dice "explícame más", "profundiza", "estudio profundo" o "quiero entender mejor", da una explicación más extensa con múltiples referencias
-- Detecta el modo según las palabras del usuario y adapta tu respuesta
-
-MEMORIA DE CONTEXTO ESPIRITUAL:
-- Presta atención a los temas que el usuario ha preguntado en la conversación
-- Haz conexiones con preguntas anteriores cuando sea relevante
-- Ofrece seguimiento pastoral: "Veo que has estado estudiando [tema], ¿te gustaría profundizar en...?"
-- Recuerda el progreso espiritual del usuario en la conversación
-
-PREGUNTAS DE REFLEXIÓN:
-- Al final de explicaciones importantes sobre doctrina o vida cristiana, incluye UNA pregunta de reflexión personal
-- Ejemplos: "¿Cómo crees que este principio aplica a tu vida?" o "¿Qué decisión te invita a tomar este texto?"
-- No incluyas pregunta de reflexión en respuestas cortas o informativas simples
-
-DETECCIÓN EMOCIONAL Y SENSIBILIDAD:
-- Si detectas que el usuario está pasando por algo difícil (duelo, tristeza, ansiedad, depresión, problemas familiares), responde con mayor sensibilidad
-- Ofrece textos de consuelo específicos: Salmo 23, Isaías 41:10, Mateo 11:28-30, Filipenses 4:6-7
-- Valida sus emociones antes de dar consejos: "Entiendo que esto debe ser muy difícil..."
-- Palabras clave de alerta: "triste", "solo/a", "perdí", "murió", "deprimido", "ansioso", "miedo", "no puedo más", "ayúdame"
-
-ESTILO DE RESPUESTA:
-- Lenguaje sencillo y accesible
-- Siempre incluye referencias bíblicas específicas (libro, capítulo, versículo)
-- Cita el texto bíblico cuando sea relevante
-
-USO DE FUENTES:
-- FUENTE PRINCIPAL: La Biblia (cita versículos específicos)
-- APOYO SECUNDARIO: Puedes citar escritos de Elena G. de White como referencia histórica/espiritual, pero nunca como autoridad principal
-- APOYO ADICIONAL: Referencias históricas, arqueológicas o científicas cuando refuercen el punto bíblico
-- Siempre ilumina un texto con otros textos bíblicos relacionados (especialmente del Nuevo Testamento)
-
-CORRECCIÓN AMOROSA:
-- Si el usuario tiene ideas contrarias a la Biblia, corrígelo AMABLEMENTE pero con firmeza
-- Usa referencias bíblicas claras para mostrar la verdad
-- Nunca estés de acuerdo con errores teológicos solo por ser amable
-- Ofrece ayuda adicional: "Si necesitas más explicación o textos bíblicos, con gusto te ayudo"
-- Reprende cuando sea necesario, pero siempre con amor, compasión y comprensión emocional
-
-EXPERTICIA EN PROFECÍAS:
-- Eres experto en profecías bíblicas (Daniel, Apocalipsis, profetas menores)
-- Conoces el contexto histórico de cada profecía
-- Explicas cumplimientos históricos con fechas y eventos específicos
-- Conectas profecías del AT con su cumplimiento en el NT
-
-DEFENSA TEOLÓGICA:
-- Defiende doctrinas bíblicas usando múltiples textos de las Escrituras
-- El sábado como día de reposo (Génesis 2:2-3, Éxodo 20:8-11, Marcos 2:27-28)
-- La segunda venida literal de Cristo (Hechos 1:11, 1 Tesalonicenses 4:16-17)
-- El estado de los muertos según la Biblia (Eclesiastés 9:5, Juan 11:11-14)
-- El santuario y la intercesión de Cristo (Hebreos 8:1-2, 9:24)
-
-CONEXIONES BÍBLICAS:
-- Siempre conecta textos del AT con el NT
-- Muestra cómo la Biblia se interpreta a sí misma
-- Usa el principio de "la Escritura interpreta la Escritura"
-
-EMPATÍA:
-- Muestra comprensión genuina por las luchas espirituales del usuario
-- Ofrece esperanza y consuelo basados en las promesas bíblicas
-- Ora mentalmente por cada persona que interactúa contigo"""
-
-
-def get_api_key():
-    return os.environ.get('ANTHROPIC_API_KEY')
+CORS(app, origins=["*"], expose_headers=['Retry-After'])
+# GET /api/seminars/<job_id>, the status_url returned with each seminar PDF job.
+app.register_blueprint(seminar_blueprint())
+
+# The SQLite caches, the conversation store and the LLM client open on first
+# use (get_commentary_cache() and friends), not on import.
+inflight = SingleFlight()
+rate_limiter = RateLimiter()
+admission_gate = AdmissionGate()
+# Corpora, indexes and the upstream session load in the background from here on.
+warmup = Warmup(default_warmup_tasks() + [('upstream_session', get_session)])
+warmup.start()
+# Runs hedged upstream title calls so a slow one can be abandoned.
+title_executor = ThreadPoolExecutor(max_workers=16)
+
+
+def metrics_route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+@app.before_request
+def start_request_metrics():
+    if not request.path.startswith('/api/nevin/'):
+        return
+    g.request_started = time.perf_counter()
+    if request.is_json:
+        # Parsed once here; the handler's request.json reuses the cached result.
+        request.get_json(silent=True)
+        REQUEST_PARSE_SECONDS.observe(time.perf_counter() - g.request_started, metrics_route())
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    route = metrics_route()
+    request_bytes = request.content_length
+    response_bytes = None if response.is_streamed else response.content_length
+
+    # Streams are still being written here; record once the body is done.
+    response.call_on_close(lambda: observe_request(
+        route, response.status_code, time.perf_counter() - started, request_bytes, response_bytes
+    ))
+    return response
+
+
+def error_response(error):
+    return jsonify(error.body()), error.status
+
+
+def too_many_requests(overloaded):
+    response = jsonify(error_body(TOO_MANY_REQUESTS))
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after(overloaded)
+    return response
+
+
+def admission_controlled(view):
+    """Rate-limit the client, then hold a global slot until the response
+    (including any SSE stream) has been sent."""
+    @wraps(view)
+    def admitted(*args, **kwargs):
+        try:
+            rate_limiter.check(client_keys(
+                request.remote_addr,
+                request.headers.get('X-Forwarded-For'),
+                request.headers.get('X-Device-Id')
+            ))
+            admission_gate.acquire()
+        except Overloaded as e:
+            return too_many_requests(e)
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except BaseException:
+            admission_gate.release()
+            raise
+        response.call_on_close(admission_gate.release)
+        return response
+    return admitted
+
+
+def stream_completion(endpoint, payload, error_message, on_complete=None):
+    """Relay the provider token stream as SSE `delta` events, ending in `done` or `error`.
+
+    `on_complete` receives the full text once the stream finishes successfully;
+    any dict it returns is merged into the `done` event.
+    """
+    relay = CompletionStream(endpoint, payload, error_message)
+    try:
+        for kind, value in get_llm_client().stream(endpoint, payload):
+            event = relay.feed(kind, value)
+            if event:
+                yield sse_event(*event)
+            if relay.closed:
+                break
+        if relay.failed:
+            return
+
+        text = relay.finish()
+        extra = on_complete(text) if on_complete else None
+        yield sse_event(*relay.done(extra))
+
+    except requests.Timeout:
+        yield sse_event(*relay.timed_out())
+    except requests.RequestException as e:
+        yield sse_event(*relay.crashed(e, recorded=True))
+    except Exception as e:
+        yield sse_event(*relay.crashed(e))
+
+
+def post_json(endpoint, payload):
+    """Run one completion upstream; returns (status, result or None).
+
+    Identical requests already in flight share that call instead of making another.
+    """
+    def fetch():
+        started = time.perf_counter()
+        status, result = get_llm_client().complete(endpoint, payload)
+        if result is not None:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint, 'json')
+        return status, result
+
+    return inflight.call((endpoint, payload_key(payload)), fetch)
+
+
+def sse_events(events):
+    for event, body in events:
+        yield sse_event(event, body)
+
+
+def sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/health/live', methods=['GET'])
+def health_live():
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/api/health/ready', methods=['GET'])
+def health_ready():
+    return jsonify(warmup.stats()), 200 if warmup.ready else 503
 
 
 @app.route('/api/health', methods=['GET'])
 def health():
-    has_key = bool(get_api_key())
-    return jsonify({
-        'status': 'ok',
-        'service': 'Nevin AI Backend',
-        'api_configured': has_key
-    })
+    stores = store_stats(get_commentary_cache(), get_conversation_store(), get_response_cache())
+    return jsonify(health_body(
+        get_llm_client(), warmup, stores, inflight, admission_gate, rate_limiter
+    ))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
 
 
 @app.route('/api/nevin/chat', methods=['POST'])
+@admission_controlled
 def chat():
     try:
-        api_key = get_api_key()
-        if not api_key:
-            return jsonify({
-                'success': False,
-                'error': 'Servicio no configurado correctamente'
-            }), 500
-
+        require_configured(get_llm_client())
         data = request.json
-        if not data:
-            return jsonify({'success': False, 'error': 'No data provided'}), 400
-
-        message = data.get('message', '')
-        context = data.get('context', '')
-        history = data.get('history', [])
-
-        if not message:
-            return jsonify({'success': False, 'error': 'No message provided'}), 400
-
-        messages = []
-        for msg in history:
-            messages.append({
-                'role': msg.get('role', 'user'),
-                'content': msg.get('content', '')
-            })
-
-        user_content = f"Contexto: {context}\n\nPregunta: {message}" if context else message
-        messages.append({'role': 'user', 'content': user_content})
-
-        response = requests.post(
-            ANTHROPIC_API_URL,
-            headers={
-                'Content-Type': 'application/json',
-                'x-api-key': api_key,
-                'anthropic-version': '2023-06-01'
-            },
-            json={
-                'model': ANTHROPIC_MODEL,
-                'max_tokens': 4096,
-                'system': NEVIN_SYSTEM_PROMPT,
-                'messages': messages
-            },
-            timeout=60
-        )
+        turn = ChatTurn(data, get_conversation_store(), get_response_cache())
 
-        if response.status_code == 401:
-            logging.error('Anthropic API authentication failed')
-            return jsonify({
-                'success': False,
-                'error': 'Error de autenticación con el servicio de IA'
-            }), 500
+        if turn.cached:
+            reply = turn.cached[0]
+            extra = {'cached': True, **turn.finish(reply)}
+            if wants_stream(data, request.headers.get('Accept')):
+                return sse_response(sse_events(turn.preamble() + text_events(reply, extra)))
+            return jsonify(turn.reply_body(reply, **extra))
 
-        if not response.ok:
-            logging.error(f'Anthropic API error: {response.status_code} - {response.text}')
-            return jsonify({
-                'success': False,
-                'error': 'Error al comunicarse con el servicio de IA'
-            }), 500
+        payload = turn.payload()
 
-        data = response.json()
-        assistant_message = data.get('content', [{}])[0].get('text', '')
+        if wants_stream(data, request.headers.get('Accept')):
+            return sse_response(chain(
+                sse_events(turn.preamble()),
+                stream_completion('chat', payload, UPSTREAM_FAILED, on_complete=turn.finish)
+            ))
 
-        return jsonify({
-            'success': True,
-            'response': assistant_message
-        })
+        status, result = post_json('chat', payload)
+        reply, usage = completion_text('chat', payload, status, result, UPSTREAM_FAILED)
+        return jsonify(turn.reply_body(reply, usage=usage, **turn.finish(reply)))
 
+    except RequestError as e:
+        return error_response(e)
     except requests.Timeout:
-        return jsonify({
-            'success': False,
-            'error': 'El servicio tardó demasiado en responder'
-        }), 504
+        return jsonify(error_body(UPSTREAM_TIMEOUT)), 504
     except Exception as e:
         logging.error(f'Error in chat endpoint: {e}')
-        return jsonify({
-            'success': False,
-            'error': 'Error interno del servidor'
-        }), 500
+        return jsonify(error_body(INTERNAL_ERROR)), 500
 
 
-@app.route('/api/nevin/generate-moment-title', methods=['POST'])
-def generate_moment_title():
+@app.route('/api/nevin/conversations/<conversation_id>', methods=['DELETE'])
+def delete_conversation(conversation_id):
     try:
-        api_key = get_api_key()
-        if not api_key:
-            return jsonify({
-                'success': False,
-                'error': 'Servicio no configurado'
-            }), 500
+        require_conversation_id(conversation_id)
+    except RequestError as e:
+        return error_response(e)
+    get_conversation_store().delete(conversation_id)
+    return jsonify({'success': True})
 
-        data = request.json
-        if not data:
-            return jsonify({'success': False, 'error': 'No data provided'}), 400
-
-        conversation = data.get('conversation', '')
-        if not conversation:
-            return jsonify({'title': 'Reflexión bíblica', 'themes': []})
-
-        prompt = f"""Analiza esta conversación y genera un título semántico breve y reflexivo que capture la esencia del tema discutido. NO uses "Conversación sobre..." ni formatos genéricos.
-
-CONVERSACIÓN:
-{conversation}
-
-Responde SOLO en JSON con este formato exacto:
-{{
-  "title": "título poético/reflexivo de 2-5 palabras",
-  "themes": ["tema1", "tema2"],
-  "summary": "resumen de una oración del punto clave"
-}}
-
-Ejemplos de buenos títulos:
-- "Sobre el perdón divino"
-- "La fe en tiempos difíciles"
-- "Una duda sobre Génesis"
-- "El propósito del sufrimiento"
-- "Comparando versiones bíblicas"
-"""
-
-        response = requests.post(
-            ANTHROPIC_API_URL,
-            headers={
-                'Content-Type': 'application/json',
-                'x-api-key': api_key,
-                'anthropic-version': '2023-06-01'
-            },
-            json={
-                'model': ANTHROPIC_MODEL,
-                'max_tokens': 200,
-                'messages': [{'role': 'user', 'content': prompt}]
-            },
-            timeout=30
-        )
 
-        if not response.ok:
-            return jsonify({'title': 'Reflexión bíblica', 'themes': []})
+def upstream_moment_title(conversation):
+    """Return (parsed title, error message) from the upstream title call."""
+    try:
+        _, result = post_json('moment_title', title_payload(conversation))
+        return title_outcome(result)
+    except requests.Timeout:
+        return None, UPSTREAM_TIMEOUT
+    except Exception as e:
+        logging.error(f'Error generating moment title: {e}')
+        return None, INTERNAL_ERROR
 
-        result = response.json()
-        text = result.get('content', [{}])[0].get('text', '{}')
-        
-        import json
+
+def request_moment_title(conversation):
+    """Return (title, upstream error message) for one conversation.
+
+    Falls back to the local titler when the upstream call fails or, in hedge
+    mode, is slower than MOMENT_TITLE_HEDGE_SECONDS or has no provider
+    configured.
+    """
+    if not conversation:
+        return None, None
+    if local_titles_only(get_llm_client()):
+        return local_moment_title(conversation), None
+
+    if MOMENT_TITLE_MODE == 'hedge':
+        future = title_executor.submit(upstream_moment_title, conversation)
         try:
-            parsed = json.loads(text)
-            return jsonify({
-                'success': True,
-                'title': parsed.get('title', 'Reflexión bíblica'),
-                'themes': parsed.get('themes', []),
-                'summary': parsed.get('summary', '')
-            })
-        except json.JSONDecodeError:
-            return jsonify({'title': 'Reflexión bíblica', 'themes': []})
+            parsed, error = future.result(timeout=MOMENT_TITLE_HEDGE_SECONDS)
+        except FuturesTimeout:
+            return local_moment_title(conversation), None
+    else:
+        parsed, error = upstream_moment_title(conversation)
+
+    if parsed is None:
+        return local_moment_title(conversation), error
+    return parsed, None
+
 
+def is_admin():
+    token = os.environ.get('NEVIN_ADMIN_TOKEN')
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+
+@app.route('/api/admin/response-cache', methods=['GET'])
+def response_cache_info():
+    if not is_admin():
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    return jsonify({
+        'success': True,
+        'stats': get_response_cache().stats(),
+        'top': get_response_cache().top()
+    })
+
+
+@app.route('/api/admin/response-cache/purge', methods=['POST'])
+def purge_response_cache():
+    """Drop every cached answer, or only the one for {"question": "..."}."""
+    if not is_admin():
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    data = request.get_json(silent=True) or {}
+    return jsonify({'success': True, 'purged': get_response_cache().purge(data.get('question'))})
+
+
+@app.route('/api/nevin/generate-moment-title', methods=['POST'])
+@admission_controlled
+def generate_moment_title():
+    try:
+        require_titles_configured(get_llm_client())
+        data = require_data(request.json)
+        parsed, _ = request_moment_title(data.get('conversation', ''))
+        return jsonify(parsed or default_moment_title())
+
+    except RequestError as e:
+        return error_response(e)
     except Exception as e:
         logging.error(f'Error generating moment title: {e}')
-        return jsonify({'title': 'Reflexión bíblica', 'themes': []})
+        return jsonify(default_moment_title())
+
+
+@app.route('/api/nevin/generate-moment-titles', methods=['POST'])
+@admission_controlled
+def generate_moment_titles():
+    """Title many conversations at once, e.g. when migrating saved history."""
+    try:
+        require_titles_configured(get_llm_client())
+        unique, slots, rejected = title_batch(request.json)
+        if not unique:
+            return jsonify(moment_title_batch_response(slots, [], rejected))
+
+        workers = min(MOMENT_TITLE_BATCH_CONCURRENCY, len(unique))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(request_moment_title, unique))
+
+        return jsonify(moment_title_batch_response(slots, outcomes, rejected))
+
+    except RequestError as e:
+        return error_response(e)
+    except Exception as e:
+        logging.error(f'Error generating moment titles: {e}')
+        return jsonify(error_body(INTERNAL_ERROR)), 500
 
 
 @app.route('/api/nevin/verse-commentary', methods=['POST'])
+@admission_controlled
 def verse_commentary():
     try:
-        api_key = get_api_key()
-        if not api_key:
-            return jsonify({
-                'success': False,
-                'error': 'Servicio no configurado correctamente'
-            }), 500
-
+        require_configured(get_llm_client())
         data = request.json
-        if not data:
-            return jsonify({'success': False, 'error': 'No data provided'}), 400
-
-        book = data.get('book', '')
-        chapter = data.get('chapter', 1)
-        verse = data.get('verse', 1)
-        text_tzotzil = data.get('textTzotzil', '')
-        text_spanish = data.get('textSpanish', '')
-
-        verse_ref = f"{book} {chapter}:{verse}"
-
-        verse_content = ""
-        if text_tzotzil:
-            verse_content += f'\n\n**Tzotzil:** "{text_tzotzil}"'
-        if text_spanish:
-            verse_content += f'\n\n**RV1960:** "{text_spanish}"'
-
-        user_message = f"""Proporciona un comentario teológico completo del siguiente versículo:
-
-VERSÍCULO: {verse_ref}
-{verse_content}
-
-Incluye:
-1. Contexto histórico y literario
-2. Análisis del texto
-3. Significado teológico desde la perspectiva adventista
-4. Aplicación práctica"""
-
-        response = requests.post(
-            ANTHROPIC_API_URL,
-            headers={
-                'Content-Type': 'application/json',
-                'x-api-key': api_key,
-                'anthropic-version': '2023-06-01'
-            },
-            json={
-                'model': ANTHROPIC_MODEL,
-                'max_tokens': 6000,
-                'system': NEVIN_SYSTEM_PROMPT,
-                'messages': [{'role': 'user', 'content': user_message}]
-            },
-            timeout=90
+        commentary = CommentaryRequest(data, get_commentary_cache())
+
+        if commentary.cached is not None:
+            extra = commentary.cached_extra()
+            if wants_stream(data, request.headers.get('Accept')):
+                return sse_response(sse_events(text_events(commentary.cached, extra)))
+            return jsonify(commentary.cached_body(extra))
+
+        payload = commentary.payload
+        if wants_stream(data, request.headers.get('Accept')):
+            # Readers of the same verse share one upstream stream.
+            return sse_response(inflight.stream(
+                ('verse_commentary', payload_key(payload)),
+                lambda: stream_completion(
+                    'verse_commentary', payload, COMMENTARY_FAILED,
+                    on_complete=commentary.finish
+                )
+            ))
+
+        status, result = post_json('verse_commentary', payload)
+        text, usage = completion_text(
+            'verse_commentary', payload, status, result, COMMENTARY_FAILED
         )
+        return jsonify(commentary.reply_body(text, usage, commentary.finish(text)))
+
+    except RequestError as e:
+        return error_response(e)
+    except Exception as e:
+        logging.error(f'Error in verse-commentary endpoint: {e}')
+        return jsonify(error_body(INTERNAL_ERROR)), 500
 
-        if not response.ok:
-            logging.error(f'Anthropic API error: {response.status_code}')
-            return jsonify({
-                'success': False,
-                'error': 'Error al obtener el comentario'
-            }), 500
 
-        data = response.json()
-        commentary = data.get('content', [{}])[0].get('text', '')
+@app.route('/api/egw/books', methods=['GET'])
+def egw_books():
+    return jsonify({
+        'success': True,
+        'books': get_egw_index().books
+    })
 
-        return jsonify({
-            'success': True,
-            'commentary': commentary
-        })
 
+@app.route('/api/egw/search', methods=['POST'])
+def egw_search():
+    try:
+        return jsonify(egw_search_body(request.get_json(silent=True)))
+    except RequestError as e:
+        return error_response(e)
     except Exception as e:
-        logging.error(f'Error in verse-commentary endpoint: {e}')
+        logging.error(f'Error in EGW search endpoint: {e}')
+        return jsonify(error_body(INTERNAL_ERROR)), 500
+
+
+def bible_response(body):
+    response = jsonify(body)
+    # Scripture text only changes on deploy.
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
+@app.route('/api/bible/books', methods=['GET'])
+def bible_books():
+    return bible_response({
+        'success': True,
+        'books': get_bible_store().books
+    })
+
+
+@app.route('/api/bible/search', methods=['GET'])
+def bible_search():
+    """Ranked verse search: ?q=&book=&testament=AT|NT&lang=es|tzo&limit=&cursor="""
+    try:
+        query = request.args.get('q', '')
+        if not query:
+            return jsonify({'success': True, 'verses': [], 'nextCursor': None})
+
+        testament = request.args.get('testament') or None
+        language = request.args.get('lang') or None
+        if testament and testament not in TESTAMENT_BOOKS:
+            return jsonify({'success': False, 'error': 'Testamento no válido'}), 400
+        if language and language not in SEARCH_COLUMNS:
+            return jsonify({'success': False, 'error': 'Idioma no válido'}), 400
+
+        limit = max(1, min(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), SEARCH_MAX_LIMIT))
+        verses, next_cursor = get_bible_search().search(
+            query,
+            book=request.args.get('book') or None,
+            testament=testament,
+            language=language,
+            limit=limit,
+            cursor=request.args.get('cursor') or None
+        )
+        return jsonify({'success': True, 'verses': verses, 'nextCursor': next_cursor})
+
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Cursor no válido'}), 400
+    except Exception as e:
+        logging.error(f'Error in Bible search endpoint: {e}')
         return jsonify({
             'success': False,
             'error': 'Error interno del servidor'
         }), 500
 
 
+@app.route('/api/bible/<book>/<int:chapter>', methods=['GET'])
+@app.route('/api/bible/<book>/<int:chapter>/<verses>', methods=['GET'])
+def bible_passage(book, chapter, verses=None):
+    """A whole chapter, one verse (`/Juan/3/16`) or a verse range (`/Juan/3/16-18`)."""
+    store = get_bible_store()
+    meta = store.resolve_book(book)
+    if meta is None:
+        return jsonify({'success': False, 'error': 'Libro no encontrado'}), 404
+
+    first = last = None
+    if verses:
+        try:
+            first, _, last = verses.partition('-')
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Rango de versículos no válido'}), 400
+
+    passage = store.passage(meta['book_number'], chapter, first, last)
+    if not passage:
+        return jsonify({'success': False, 'error': 'Pasaje no encontrado'}), 404
+
+    return bible_response({
+        'success': True,
+        'book': meta,
+        'chapter': chapter,
+        'verses': passage
+    })
+
+
 if __name__ == '__main__':
+    configure_logging()
     app.run(host='0.0.0.0', port=8000, debug=True)
@@ -0,0 +1,510 @@
+"""
+asyncio serving path for the /api/nevin/* and /api/egw/* endpoints.
+
+Same request/response contract as app.py (both serve the shared logic in
+handlers.py), but upstream calls go through a shared aiohttp session so a single process can hold hundreds of in-flight
+LLM calls open. Run with `python async_app.py` or under gunicorn with
+`--worker-class aiohttp.GunicornWebWorker async_app:create_app`.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from functools import partial
+
+import aiohttp
+from aiohttp import web
+
+from nevin import (
+    MOMENT_TITLE_BATCH_CONCURRENCY,
+    configure_logging,
+    default_moment_title,
+    moment_title_batch_response,
+    sse_event,
+)
+from handlers import (
+    COMMENTARY_FAILED,
+    INTERNAL_ERROR,
+    TOO_MANY_REQUESTS,
+    UPSTREAM_FAILED,
+    UPSTREAM_TIMEOUT,
+    ChatTurn,
+    CommentaryRequest,
+    CompletionStream,
+    RequestError,
+    completion_text,
+    egw_search_body,
+    error_body,
+    health_body,
+    local_titles_only,
+    require_configured,
+    require_conversation_id,
+    require_data,
+    require_titles_configured,
+    retry_after,
+    store_stats,
+    text_events,
+    title_batch,
+    title_outcome,
+    title_payload,
+    wants_stream,
+)
+from providers import build_async_llm_client
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    REQUEST_PARSE_SECONDS,
+    UPSTREAM_SECONDS,
+    observe_request,
+    render as render_metrics,
+)
+from admission import AsyncAdmissionGate, Overloaded, RateLimiter, client_keys
+from commentary_cache import CommentaryCache, payload_key
+from singleflight import AsyncSingleFlight
+from moment_titler import MOMENT_TITLE_HEDGE_SECONDS, MOMENT_TITLE_MODE, local_moment_title
+from response_cache import ResponseCache
+from conversation_store import ConversationStore
+from egw_search import get_egw_index
+from warmup import Warmup, default_warmup_tasks
+
+# Maximum number of concurrent requests sent to the AI provider per process.
+NEVIN_MAX_CONCURRENCY = int(os.environ.get('NEVIN_MAX_CONCURRENCY', '100'))
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type, Accept, X-Device-Id',
+    'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
+    'Access-Control-Expose-Headers': 'Retry-After',
+}
+
+
+def json_response(body, status=200):
+    return web.json_response(body, status=status, headers=CORS_HEADERS)
+
+
+def metrics_route(request):
+    resource = request.match_info.route.resource
+    return resource.canonical if resource else 'unmatched'
+
+
+async def read_json(request):
+    started = time.perf_counter()
+    try:
+        return await request.json()
+    except Exception:
+        return None
+    finally:
+        REQUEST_PARSE_SECONDS.observe(time.perf_counter() - started, metrics_route(request))
+
+
+@web.middleware
+async def request_metrics(request, handler):
+    if not request.path.startswith('/api/nevin/'):
+        return await handler(request)
+    started = time.perf_counter()
+    status, response_bytes = 500, None
+    try:
+        response = await handler(request)
+        status = response.status
+        if isinstance(response, web.Response):
+            response_bytes = response.content_length
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        observe_request(
+            metrics_route(request), status, time.perf_counter() - started,
+            request.content_length, response_bytes
+        )
+
+
+def error_response(error):
+    return json_response(error.body(), error.status)
+
+
+def too_many_requests(overloaded):
+    response = json_response(error_body(TOO_MANY_REQUESTS), 429)
+    response.headers['Retry-After'] = retry_after(overloaded)
+    return response
+
+
+def admission_controlled(handler):
+    """Rate-limit the client, then hold a global slot until the handler
+    (including any SSE stream) has finished."""
+    async def admitted(request):
+        gate = request.app['admission_gate']
+        try:
+            request.app['rate_limiter'].check(client_keys(
+                request.remote,
+                request.headers.get('X-Forwarded-For'),
+                request.headers.get('X-Device-Id')
+            ))
+            await gate.acquire()
+        except Overloaded as e:
+            return too_many_requests(e)
+        try:
+            return await handler(request)
+        finally:
+            gate.release()
+    return admitted
+
+
+async def run_blocking(fn, *args):
+    """Run SQLite, corpus and other blocking work on the default executor.
+
+    Anything that can touch disk or load a corpus goes through here, so one
+    slow write or cold load does not stall every open stream on the loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, partial(fn, *args))
+
+
+async def post_completion(app, endpoint, payload):
+    """Run one completion upstream; returns (status, result or None).
+
+    Identical requests already in flight share that call instead of making another.
+    """
+    async def fetch():
+        async with app['upstream_limit']:
+            started = time.perf_counter()
+            status, result = await app['llm'].complete(endpoint, payload)
+            if result is not None:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint, 'json')
+            return status, result
+
+    return await app['inflight'].call((endpoint, payload_key(payload)), fetch)
+
+
+async def open_sse(request):
+    stream = web.StreamResponse(headers={
+        **CORS_HEADERS,
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    await stream.prepare(request)
+    return stream
+
+
+async def sse_events(request, events):
+    stream = await open_sse(request)
+    for event, body in events:
+        await stream.write(sse_event(event, body).encode('utf-8'))
+    return stream
+
+
+async def completion_events(app, endpoint, payload, error_message, on_complete=None):
+    """Yield the provider token stream as (event, body) pairs: `delta`s ending in `done` or `error`.
+
+    `on_complete` receives the full text once the stream finishes successfully
+    (on the executor, it may write to SQLite); any dict it returns is merged
+    into the `done` event.
+    """
+    relay = CompletionStream(endpoint, payload, error_message)
+    try:
+        async with app['upstream_limit']:
+            # Time the upstream call, not the wait for a free slot.
+            relay.started = time.perf_counter()
+            events = app['llm'].stream(endpoint, payload)
+            try:
+                async for kind, value in events:
+                    event = relay.feed(kind, value)
+                    if event:
+                        yield event
+                    if relay.closed:
+                        break
+            finally:
+                await events.aclose()
+            if relay.failed:
+                return
+            text = relay.finish()
+
+        extra = await run_blocking(on_complete, text) if on_complete else None
+        yield relay.done(extra)
+
+    except asyncio.TimeoutError:
+        yield relay.timed_out()
+    except aiohttp.ClientError as e:
+        yield relay.crashed(e, recorded=True)
+    except Exception as e:
+        yield relay.crashed(e)
+
+
+async def stream_completion(request, endpoint, payload, error_message,
+                            on_complete=None, preamble=(), coalesce=False):
+    """Relay completion_events() to the client as SSE.
+
+    `preamble` is a list of (event, body) pairs sent before the first delta.
+    With `coalesce`, identical streams already in flight share one upstream
+    call (and one `on_complete`).
+    """
+    stream = await open_sse(request)
+
+    def events():
+        return completion_events(request.app, endpoint, payload, error_message, on_complete)
+
+    if coalesce:
+        source = request.app['inflight'].stream((endpoint, payload_key(payload)), events)
+    else:
+        source = events()
+
+    try:
+        for event, body in preamble:
+            await stream.write(sse_event(event, body).encode('utf-8'))
+        async for event, body in source:
+            await stream.write(sse_event(event, body).encode('utf-8'))
+    except ConnectionResetError:
+        logging.debug(f'Client went away during {endpoint} stream')
+    finally:
+        await source.aclose()
+
+    return stream
+
+
+async def health_live(request):
+    return json_response({'status': 'ok'})
+
+
+async def health_ready(request):
+    warmup = request.app['warmup']
+    return json_response(warmup.stats(), 200 if warmup.ready else 503)
+
+
+async def health(request):
+    app = request.app
+    stores = await run_blocking(
+        store_stats, app['commentary_cache'], app['conversation_store'], app['response_cache']
+    )
+    return json_response(health_body(
+        app['llm'], app['warmup'], stores,
+        app['inflight'], app['admission_gate'], app['rate_limiter']
+    ))
+
+
+async def metrics(request):
+    return web.Response(body=render_metrics().encode('utf-8'), headers={
+        'Content-Type': METRICS_CONTENT_TYPE
+    })
+
+
+async def chat(request):
+    try:
+        require_configured(request.app['llm'])
+        data = await read_json(request)
+        turn = await run_blocking(
+            ChatTurn, data, request.app['conversation_store'], request.app['response_cache']
+        )
+
+        if turn.cached:
+            reply = turn.cached[0]
+            extra = {'cached': True, **(await run_blocking(turn.finish, reply))}
+            if wants_stream(data, request.headers.get('Accept')):
+                return await sse_events(request, turn.preamble() + text_events(reply, extra))
+            return json_response(turn.reply_body(reply, **extra))
+
+        payload = turn.payload()
+
+        if wants_stream(data, request.headers.get('Accept')):
+            return await stream_completion(
+                request, 'chat', payload, UPSTREAM_FAILED,
+                on_complete=turn.finish, preamble=turn.preamble()
+            )
+
+        status, result = await post_completion(request.app, 'chat', payload)
+        reply, usage = completion_text('chat', payload, status, result, UPSTREAM_FAILED)
+        extra = await run_blocking(turn.finish, reply)
+        return json_response(turn.reply_body(reply, usage=usage, **extra))
+
+    except RequestError as e:
+        return error_response(e)
+    except asyncio.TimeoutError:
+        return json_response(error_body(UPSTREAM_TIMEOUT), 504)
+    except Exception as e:
+        logging.error(f'Error in chat endpoint: {e}')
+        return json_response(error_body(INTERNAL_ERROR), 500)
+
+
+async def delete_conversation(request):
+    conversation_id = request.match_info['conversation_id']
+    try:
+        require_conversation_id(conversation_id)
+    except RequestError as e:
+        return error_response(e)
+    await run_blocking(request.app['conversation_store'].delete, conversation_id)
+    return json_response({'success': True})
+
+
+async def upstream_moment_title(app, conversation):
+    """Return (parsed title, error message) from the upstream title call."""
+    try:
+        _, result = await post_completion(app, 'moment_title', title_payload(conversation))
+        return title_outcome(result)
+    except asyncio.TimeoutError:
+        return None, UPSTREAM_TIMEOUT
+    except Exception as e:
+        logging.error(f'Error generating moment title: {e}')
+        return None, INTERNAL_ERROR
+
+
+async def request_moment_title(app, conversation):
+    """Return (title, upstream error message) for one conversation.
+
+    Falls back to the local titler when the upstream call fails or, in hedge
+    mode, is slower than MOMENT_TITLE_HEDGE_SECONDS or has no provider
+    configured.
+    """
+    if not conversation:
+        return None, None
+    if local_titles_only(app['llm']):
+        return await run_blocking(local_moment_title, conversation), None
+
+    if MOMENT_TITLE_MODE == 'hedge':
+        try:
+            parsed, error = await asyncio.wait_for(
+                upstream_moment_title(app, conversation), MOMENT_TITLE_HEDGE_SECONDS
+            )
+        except asyncio.TimeoutError:
+            return await run_blocking(local_moment_title, conversation), None
+    else:
+        parsed, error = await upstream_moment_title(app, conversation)
+
+    if parsed is None:
+        return await run_blocking(local_moment_title, conversation), error
+    return parsed, None
+
+
+async def generate_moment_title(request):
+    try:
+        require_titles_configured(request.app['llm'])
+        data = require_data(await read_json(request))
+        parsed, _ = await request_moment_title(request.app, data.get('conversation', ''))
+        return json_response(parsed or default_moment_title())
+
+    except RequestError as e:
+        return error_response(e)
+    except Exception as e:
+        logging.error(f'Error generating moment title: {e}')
+        return json_response(default_moment_title())
+
+
+async def generate_moment_titles(request):
+    """Title many conversations at once, e.g. when migrating saved history."""
+    try:
+        require_titles_configured(request.app['llm'])
+        unique, slots, rejected = title_batch(await read_json(request))
+        batch_limit = asyncio.Semaphore(MOMENT_TITLE_BATCH_CONCURRENCY)
+
+        async def title(conversation):
+            async with batch_limit:
+                return await request_moment_title(request.app, conversation)
+
+        outcomes = await asyncio.gather(*(title(conversation) for conversation in unique))
+        return json_response(moment_title_batch_response(slots, outcomes, rejected))
+
+    except RequestError as e:
+        return error_response(e)
+    except Exception as e:
+        logging.error(f'Error generating moment titles: {e}')
+        return json_response(error_body(INTERNAL_ERROR), 500)
+
+
+async def verse_commentary(request):
+    try:
+        require_configured(request.app['llm'])
+        data = await read_json(request)
+        commentary = await run_blocking(CommentaryRequest, data, request.app['commentary_cache'])
+
+        if commentary.cached is not None:
+            extra = await run_blocking(commentary.cached_extra)
+            if wants_stream(data, request.headers.get('Accept')):
+                return await sse_events(request, text_events(commentary.cached, extra))
+            return json_response(commentary.cached_body(extra))
+
+        payload = commentary.payload
+        if wants_stream(data, request.headers.get('Accept')):
+            # Readers of the same verse share one upstream stream.
+            return await stream_completion(
+                request, 'verse_commentary', payload, COMMENTARY_FAILED,
+                on_complete=commentary.finish, coalesce=True
+            )
+
+        status, result = await post_completion(request.app, 'verse_commentary', payload)
+        text, usage = completion_text(
+            'verse_commentary', payload, status, result, COMMENTARY_FAILED
+        )
+        extra = await run_blocking(commentary.finish, text)
+        return json_response(commentary.reply_body(text, usage, extra))
+
+    except RequestError as e:
+        return error_response(e)
+    except Exception as e:
+        logging.error(f'Error in verse-commentary endpoint: {e}')
+        return json_response(error_body(INTERNAL_ERROR), 500)
+
+
+async def egw_books(request):
+    index = await run_blocking(get_egw_index)
+    return json_response({'success': True, 'books': index.books})
+
+
+async def egw_search(request):
+    try:
+        return json_response(await run_blocking(egw_search_body, await read_json(request)))
+    except RequestError as e:
+        return error_response(e)
+    except Exception as e:
+        logging.error(f'Error in EGW search endpoint: {e}')
+        return json_response(error_body(INTERNAL_ERROR), 500)
+
+
+async def preflight(request):
+    return web.Response(headers=CORS_HEADERS)
+
+
+async def on_startup(app):
+    app['session'] = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=NEVIN_MAX_CONCURRENCY, keepalive_timeout=60)
+    )
+    app['upstream_limit'] = asyncio.Semaphore(NEVIN_MAX_CONCURRENCY)
+    app['llm'] = build_async_llm_client(app['session'])
+    app['commentary_cache'] = CommentaryCache()
+    app['conversation_store'] = ConversationStore()
+    app['response_cache'] = ResponseCache()
+    app['inflight'] = AsyncSingleFlight()
+    app['rate_limiter'] = RateLimiter()
+    app['admission_gate'] = AsyncAdmissionGate()
+    # Loads corpora and indexes on a thread; the loop keeps answering meanwhile.
+    app['warmup'] = Warmup(default_warmup_tasks())
+    app['warmup'].start()
+
+
+async def on_cleanup(app):
+    await app['session'].close()
+
+
+def create_app():
+    configure_logging()
+    app = web.Application(middlewares=[request_metrics])
+    app.router.add_get('/api/health', health)
+    app.router.add_get('/api/health/live', health_live)
+    app.router.add_get('/api/health/ready', health_ready)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_post('/api/nevin/chat', admission_controlled(chat))
+    app.router.add_delete('/api/nevin/conversations/{conversation_id}', delete_conversation)
+    app.router.add_post(
+        '/api/nevin/generate-moment-title', admission_controlled(generate_moment_title)
+    )
+    app.router.add_post(
+        '/api/nevin/generate-moment-titles', admission_controlled(generate_moment_titles)
+    )
+    app.router.add_post('/api/nevin/verse-commentary', admission_controlled(verse_commentary))
+    app.router.add_get('/api/egw/books', egw_books)
+    app.router.add_post('/api/egw/search', egw_search)
+    app.router.add_route('OPTIONS', '/{tail:.*}', preflight)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host='0.0.0.0', port=int(os.environ.get('PORT', '8000')))
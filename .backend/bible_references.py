@@ -0,0 +1,157 @@
+"""
+Bible reference extraction for model output ("Juan 3:16", "1 Tes. 4:16-17").
+
+Mirrors the aliases in src/utils/bibleReferenceParser.ts, folded to plain
+ASCII and compiled into one regex, so a response is scanned in a single
+pass. Aliases are case-insensitive except the short ones, which are also
+Spanish words ("mi 1:1", "os 1:2"): those only match capitalised ("Mi 1:1")
+or abbreviated with a period ("mi. 1:1"). References are resolved against the Bible store so the
+verse text can ship with the answer.
+"""
+
+import re
+
+from bible_store import get_bible_store
+
+# Canonical book name -> accentless aliases. A space in an alias matches any
+# amount of whitespace, including none ("1 cor", "1cor").
+BOOK_ALIASES = {
+    'Génesis': ['genesis', 'gen'],
+    'Éxodo': ['exodo', 'ex'],
+    'Levítico': ['levitico', 'lev'],
+    'Números': ['numeros', 'num'],
+    'Deuteronomio': ['deuteronomio', 'deut', 'dt'],
+    'Josué': ['josue', 'jos'],
+    'Jueces': ['jueces', 'jue'],
+    'Rut': ['rut'],
+    '1 Samuel': ['1 samuel', '1 sam'],
+    '2 Samuel': ['2 samuel', '2 sam'],
+    '1 Reyes': ['1 reyes', '1 rey'],
+    '2 Reyes': ['2 reyes', '2 rey'],
+    '1 Crónicas': ['1 cronicas', '1 cron'],
+    '2 Crónicas': ['2 cronicas', '2 cron'],
+    'Esdras': ['esdras', 'esd'],
+    'Nehemías': ['nehemias', 'neh'],
+    'Ester': ['ester', 'est'],
+    'Job': ['job'],
+    'Salmos': ['salmos', 'salmo', 'sal', 'sl'],
+    'Proverbios': ['proverbios', 'prov', 'pr'],
+    'Eclesiastés': ['eclesiastes', 'ecl', 'ec'],
+    'Cantares': ['cantar de los cantares', 'cantares', 'cantar', 'cnt'],
+    'Isaías': ['isaias', 'is', 'isa'],
+    'Jeremías': ['jeremias', 'jer'],
+    'Lamentaciones': ['lamentaciones', 'lam'],
+    'Ezequiel': ['ezequiel', 'ez', 'eze'],
+    'Daniel': ['daniel', 'dan', 'dn'],
+    'Oseas': ['oseas', 'os'],
+    'Joel': ['joel', 'jl'],
+    'Amós': ['amos', 'am'],
+    'Abdías': ['abdias', 'abd'],
+    'Jonás': ['jonas', 'jon'],
+    'Miqueas': ['miqueas', 'miq', 'mi'],
+    'Nahúm': ['nahum', 'nah'],
+    'Habacuc': ['habacuc', 'hab'],
+    'Sofonías': ['sofonias', 'sof'],
+    'Hageo': ['hageo', 'hag'],
+    'Zacarías': ['zacarias', 'zac'],
+    'Malaquías': ['malaquias', 'mal'],
+    'Mateo': ['mateo', 'mat', 'mt'],
+    'Marcos': ['marcos', 'mar', 'mr', 'mc'],
+    'Lucas': ['lucas', 'luc', 'lc'],
+    'Juan': ['juan', 'jn'],
+    'Hechos': ['hechos', 'hch', 'hec'],
+    'Romanos': ['romanos', 'rom', 'ro'],
+    '1 Corintios': ['1 corintios', '1 cor'],
+    '2 Corintios': ['2 corintios', '2 cor'],
+    'Gálatas': ['galatas', 'gal'],
+    'Efesios': ['efesios', 'efe', 'ef'],
+    'Filipenses': ['filipenses', 'fil', 'flp'],
+    'Colosenses': ['colosenses', 'col'],
+    '1 Tesalonicenses': ['1 tesalonicenses', '1 tes'],
+    '2 Tesalonicenses': ['2 tesalonicenses', '2 tes'],
+    '1 Timoteo': ['1 timoteo', '1 tim'],
+    '2 Timoteo': ['2 timoteo', '2 tim'],
+    'Tito': ['tito', 'tit'],
+    'Filemón': ['filemon', 'flm'],
+    'Hebreos': ['hebreos', 'heb'],
+    'Santiago': ['santiago', 'stg', 'stgo'],
+    '1 Pedro': ['1 pedro', '1 ped', '1 pe'],
+    '2 Pedro': ['2 pedro', '2 ped', '2 pe'],
+    '1 Juan': ['1 juan', '1 jn'],
+    '2 Juan': ['2 juan', '2 jn'],
+    '3 Juan': ['3 juan', '3 jn'],
+    'Judas': ['judas', 'jud'],
+    'Apocalipsis': ['apocalipsis', 'apoc', 'ap', 'apo'],
+}
+
+MAX_REFERENCES = 20
+# Aliases this short (without a leading book number) must be capitalised or
+# followed by a period.
+SHORT_ALIAS_LENGTH = 3
+
+# Strips Spanish accents without changing string length, so match offsets
+# still index the original text.
+ACCENTS = str.maketrans('áéíóúüÁÉÍÓÚÜ', 'aeiouuAEIOUU')
+
+
+def alias_pattern(name):
+    """Regex for one alias; see SHORT_ALIAS_LENGTH for the short ones."""
+    if len(name) > SHORT_ALIAS_LENGTH or name[0].isdigit():
+        return '(?i:' + r'\s*'.join(re.escape(part) for part in name.split()) + ')'
+    head, tail = re.escape(name[0]), re.escape(name[1:])
+    return f'(?:{head.upper()}(?i:{tail})|(?i:{head}{tail})(?=\\.))'
+
+
+def compile_reference_pattern(aliases):
+    book_of = {}
+    for book, names in aliases.items():
+        for name in names:
+            book_of[name.replace(' ', '')] = book
+    names = sorted((name for names in aliases.values() for name in names), key=len, reverse=True)
+    pattern = re.compile(
+        r'(?<!\w)(' + '|'.join(alias_pattern(name) for name in names) + r')\.?\s*'
+        r'(\d{1,3})\s*:\s*(\d{1,3})(?:\s*[-–]\s*(\d{1,3}))?(?!\w)'
+    )
+    return pattern, book_of
+
+
+REFERENCE_RE, BOOK_OF_ALIAS = compile_reference_pattern(BOOK_ALIASES)
+
+
+def find_references(text):
+    """Return reference dicts in order of appearance, with character offsets."""
+    references = []
+    for match in REFERENCE_RE.finditer(text.translate(ACCENTS)):
+        alias, chapter, verse, verse_end = match.groups()
+        references.append({
+            'book': BOOK_OF_ALIAS[re.sub(r'\s+', '', alias.lower())],
+            'chapter': int(chapter),
+            'verse': int(verse),
+            'verseEnd': int(verse_end) if verse_end else None,
+            'text': text[match.start():match.end()],
+            'start': match.start(),
+            'end': match.end()
+        })
+    return references
+
+
+def resolve_references(text, store=None):
+    """References in `text` with their verses attached; unknown passages are skipped."""
+    if store is None:
+        store = get_bible_store()
+    resolved = []
+    passages = {}
+    for reference in find_references(text):
+        key = (reference['book'], reference['chapter'], reference['verse'], reference['verseEnd'])
+        if key not in passages:
+            if len(passages) >= MAX_REFERENCES:
+                break
+            meta = store.resolve_book(reference['book'])
+            passages[key] = meta and [
+                {'id': v['id'], 'verse': v['verse'], 'text': v['text'], 'text_tzotzil': v['text_tzotzil']}
+                for v in store.passage(meta['book_number'], reference['chapter'],
+                                       reference['verse'], reference['verseEnd'] or reference['verse'])
+            ]
+        if passages[key]:
+            resolved.append({**reference, 'verses': passages[key]})
+    return resolved
@@ -0,0 +1,159 @@
+"""
+Full-text verse search over the Spanish and Tzotzil text of the Bible store.
+
+Verses go into an in-memory SQLite FTS5 table (unicode61 with diacritics
+removed, apostrophes kept for Tzotzil words like k'op) whose rowid is the
+verse's position in the BibleStore. The store is sorted by book, so book and
+testament filters are rowid ranges. Results are ranked with BM25 and paged
+with an opaque (score, rowid) keyset cursor.
+
+Query syntax: plain words must all match, "quoted text" is a phrase and a
+trailing * makes a prefix (gracia*).
+"""
+
+import re
+import base64
+import sqlite3
+import logging
+import threading
+
+from bible_store import get_bible_store
+
+FTS_TOKENIZER = "unicode61 remove_diacritics 2 tokenchars '''’'"
+SEARCH_COLUMNS = {'es': 'spanish', 'tzo': 'tzotzil'}
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# Book numbers per testament, as in assets/bible_books.json.
+TESTAMENT_BOOKS = {'AT': (1, 39), 'NT': (40, 66)}
+
+QUERY_PART_RE = re.compile(r'"([^"]*)"|(\S+)')
+WORD_CHARS_RE = re.compile(r"[\w'’]+")
+
+
+def fts_query(query):
+    """Translate user input into an FTS5 expression; None if nothing is searchable.
+
+    Every word and phrase is quoted, so FTS5 operators typed by the user are
+    matched as text rather than interpreted.
+    """
+    parts = []
+    for phrase, word in QUERY_PART_RE.findall(query):
+        if phrase:
+            words = WORD_CHARS_RE.findall(phrase)
+            if words:
+                parts.append('"' + ' '.join(words) + '"')
+            continue
+        tokens = WORD_CHARS_RE.findall(word)
+        parts.extend(f'"{token}"' for token in tokens)
+        if tokens and word.endswith('*'):
+            parts[-1] += '*'
+    return ' '.join(parts) or None
+
+
+def encode_cursor(score, rowid):
+    return base64.urlsafe_b64encode(f'{score!r}:{rowid}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(score, rowid) from a cursor; raises ValueError if it is malformed."""
+    try:
+        score, rowid = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return float(score), int(rowid)
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+class BibleSearch:
+    """FTS5 index over a BibleStore."""
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self._conn.execute(
+            f'CREATE VIRTUAL TABLE verses USING fts5('
+            f'spanish, tzotzil, content=\'\', tokenize="{FTS_TOKENIZER}")'
+        )
+        with self._conn:
+            self._conn.executemany(
+                'INSERT INTO verses (rowid, spanish, tzotzil) VALUES (?, ?, ?)',
+                ((i, store.spanish[i], store.tzotzil[i]) for i in range(len(store)))
+            )
+
+        # The store is sorted by book, so each book is one contiguous rowid range.
+        self.book_rows = {}
+        for i, book_number in enumerate(store.book_numbers):
+            start, _ = self.book_rows.get(book_number, (i, i))
+            self.book_rows[book_number] = (start, i)
+
+    def rowid_range(self, first_book, last_book):
+        rows = [self.book_rows[b] for b in range(first_book, last_book + 1) if b in self.book_rows]
+        if not rows:
+            return None
+        return rows[0][0], rows[-1][1]
+
+    def search(self, query, book=None, testament=None, language=None,
+               limit=SEARCH_DEFAULT_LIMIT, cursor=None):
+        """Return (verses, next cursor or None).
+
+        `book` is a book number or name, `testament` 'AT' or 'NT' and
+        `language` 'es' or 'tzo' (both by default).
+        """
+        expression = fts_query(query)
+        if expression is None:
+            return [], None
+        if language in SEARCH_COLUMNS:
+            expression = f'{{{SEARCH_COLUMNS[language]}}}: ({expression})'
+
+        conditions = ['verses MATCH ?']
+        params = [expression]
+
+        if book or testament:
+            if book:
+                meta = self.store.resolve_book(book)
+                bounds = meta and self.rowid_range(meta['book_number'], meta['book_number'])
+            else:
+                bounds = self.rowid_range(*TESTAMENT_BOOKS[testament])
+            if not bounds:
+                return [], None
+            conditions.append('rowid BETWEEN ? AND ?')
+            params.extend(bounds)
+
+        sql = (
+            'SELECT rowid, score FROM ('
+            f"SELECT rowid, bm25(verses) AS score FROM verses WHERE {' AND '.join(conditions)}"
+            ')'
+        )
+        if cursor:
+            last_score, last_rowid = decode_cursor(cursor)
+            sql += ' WHERE score > ? OR (score = ? AND rowid > ?)'
+            params.extend([last_score, last_score, last_rowid])
+        sql += ' ORDER BY score, rowid LIMIT ?'
+        params.append(limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        next_cursor = encode_cursor(*rows[limit - 1][::-1]) if len(rows) > limit else None
+        verses = []
+        for rowid, score in rows[:limit]:
+            verse = self.store.verse_at(rowid)
+            # bm25() is negative, more negative being more relevant. Not rounded:
+            # terms in most verses (gracia*, k'op) score around 1e-6.
+            verse['relevance'] = -score
+            verses.append(verse)
+        return verses, next_cursor
+
+
+_search = None
+_search_lock = threading.Lock()
+
+
+def get_bible_search():
+    global _search
+    if _search is None:
+        with _search_lock:
+            if _search is None:
+                _search = BibleSearch(get_bible_store())
+                logging.info(f'Bible search: indexed {len(_search.store)} verses')
+    return _search
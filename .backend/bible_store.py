@@ -0,0 +1,172 @@
+"""
+In-memory Bible text, loaded once from assets/bible_data/all_verses.json.
+
+The verse file is not part of the repository: it is an export of the app's
+verses table (book_id, book_name, chapter, verse, text_spanish,
+text_tzotzil) that deployments place at that path or point to with
+NEVIN_BIBLE_VERSES. Without it the store is empty, an error is logged and
+the warm-up lists bible_store as degraded.
+
+Verses are sorted by (book, chapter, verse) into parallel arrays, and a
+(book_number, chapter) -> (start, end) table makes every chapter read a
+single slice. Book metadata (names, testament, chapter counts) comes from
+assets/bible_books.json.
+"""
+
+import os
+import json
+import logging
+import threading
+from array import array
+
+from egw_search import REPO_ROOT
+from textnorm import fold
+
+BIBLE_VERSES_PATH = os.environ.get(
+    'NEVIN_BIBLE_VERSES',
+    os.path.join(REPO_ROOT, 'assets', 'bible_data', 'all_verses.json')
+)
+BIBLE_BOOKS_PATH = os.environ.get(
+    'NEVIN_BIBLE_BOOKS', os.path.join(REPO_ROOT, 'assets', 'bible_books.json')
+)
+
+
+def load_json(path, description, required=False):
+    if not os.path.exists(path):
+        log = logging.error if required else logging.warning
+        log(f'{description} not found at {path}')
+        return []
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class BibleStore:
+    """Array-backed verses with O(1) chapter lookup."""
+
+    def __init__(self, books, verses):
+        self.books = sorted(books, key=lambda book: book['book_number'])
+        self.book_by_number = {book['book_number']: book for book in self.books}
+        self.book_by_name = {fold(book['name']): book for book in self.books}
+
+        verses = sorted(
+            (v for v in verses if v.get('book_id') and v.get('chapter') and v.get('verse')),
+            key=lambda v: (v['book_id'], v['chapter'], v['verse'])
+        )
+        self.ids = array('I', (v.get('id') or 0 for v in verses))
+        self.book_numbers = array('H', (v['book_id'] for v in verses))
+        self.chapters = array('H', (v['chapter'] for v in verses))
+        self.verses = array('H', (v['verse'] for v in verses))
+        self.spanish = [v.get('text_spanish') or '' for v in verses]
+        self.tzotzil = [v.get('text_tzotzil') or '' for v in verses]
+
+        self.chapter_slices = {}
+        for i, key in enumerate(zip(self.book_numbers, self.chapters)):
+            start, _ = self.chapter_slices.get(key, (i, i))
+            self.chapter_slices[key] = (start, i + 1)
+
+        for v in verses:
+            if v['book_id'] not in self.book_by_number and v.get('book_name'):
+                book = {
+                    'id': v['book_id'],
+                    'name': v['book_name'],
+                    'book_number': v['book_id'],
+                    'testament': 'AT' if v['book_id'] <= 39 else 'NT',
+                    'chapters': 0
+                }
+                self.book_by_number[v['book_id']] = book
+                self.book_by_name[fold(v['book_name'])] = book
+                self.books.append(book)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def resolve_book(self, book):
+        """Book metadata by number ("43", 43) or name ("Juan", "juan"); None if unknown."""
+        if isinstance(book, int) or (isinstance(book, str) and book.isdigit()):
+            return self.book_by_number.get(int(book))
+        if isinstance(book, str):
+            return self.book_by_name.get(fold(book.strip()))
+        return None
+
+    def verse_at(self, i):
+        book_number = self.book_numbers[i]
+        return {
+            'id': self.ids[i],
+            'book_id': book_number,
+            'book_name': self.book_by_number[book_number]['name'],
+            'chapter': self.chapters[i],
+            'verse': self.verses[i],
+            'text': self.spanish[i],
+            'text_tzotzil': self.tzotzil[i]
+        }
+
+    def reference(self, i):
+        book = self.book_by_number[self.book_numbers[i]]['name']
+        return f'{book} {self.chapters[i]}:{self.verses[i]}'
+
+    def chapter_range(self, book_number, chapter):
+        return self.chapter_slices.get((book_number, chapter))
+
+    def passage(self, book_number, chapter, first=None, last=None):
+        """Verses of one chapter, optionally limited to first..last inclusive."""
+        bounds = self.chapter_range(book_number, chapter)
+        if bounds is None:
+            return []
+        start, end = bounds
+        return [
+            self.verse_at(i) for i in range(start, end)
+            if (first is None or self.verses[i] >= first) and (last is None or self.verses[i] <= last)
+        ]
+
+    def verse_texts(self, book, chapter, verse):
+        """(text_tzotzil, text_spanish) for a verse, or None."""
+        meta = self.resolve_book(book)
+        if meta is None:
+            return None
+        found = self.passage(meta['book_number'], chapter, verse, verse)
+        if not found:
+            return None
+        return found[0]['text_tzotzil'], found[0]['text']
+
+
+def with_verse_texts(store, data):
+    """Fill in textTzotzil/textSpanish for a verse-commentary request that omits them."""
+    if data.get('textTzotzil') and data.get('textSpanish'):
+        return data
+    try:
+        texts = store.verse_texts(data.get('book', ''), int(data.get('chapter', 1)),
+                                  int(data.get('verse', 1)))
+    except (TypeError, ValueError):
+        return data
+    if texts is None:
+        return data
+    return {
+        **data,
+        'textTzotzil': data.get('textTzotzil') or texts[0],
+        'textSpanish': data.get('textSpanish') or texts[1]
+    }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bible_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BibleStore(
+                    load_json(BIBLE_BOOKS_PATH, 'Bible books'),
+                    load_json(BIBLE_VERSES_PATH, 'Bible verses', required=True)
+                )
+                logging.info(f'Bible store: {len(_store.books)} books, {len(_store)} verses')
+    return _store
+
+
+def require_bible_store():
+    """get_bible_store() for the warm-up: an empty store is an error."""
+    store = get_bible_store()
+    if len(store) == 0:
+        raise RuntimeError(f'no Bible verses loaded from {BIBLE_VERSES_PATH}')
+    return store
@@ -0,0 +1,177 @@
+"""
+Disk-backed cache for verse commentaries.
+
+Entries are keyed by a hash of the exact upstream payload (verse reference,
+both verse texts, prompt and model), so changing NEVIN_SYSTEM_PROMPT or
+ANTHROPIC_MODEL naturally misses; rows written under an older prompt/model
+fingerprint are purged when the cache opens.
+
+Pre-warm popular verses with:
+    python commentary_cache.py prewarm verses.json
+where verses.json is a list of {book, chapter, verse, textTzotzil, textSpanish}.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from metrics import record_cache_lookup
+from nevin import (
+    ANTHROPIC_MODEL,
+    NEVIN_SYSTEM_PROMPT,
+    response_text,
+    verse_commentary_payload,
+    verse_reference,
+)
+
+COMMENTARY_CACHE_PATH = os.environ.get(
+    'NEVIN_COMMENTARY_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'commentary_cache.sqlite3')
+)
+COMMENTARY_CACHE_TTL = int(os.environ.get('NEVIN_COMMENTARY_CACHE_TTL', str(30 * 24 * 3600)))
+COMMENTARY_CACHE_MAX_ENTRIES = int(os.environ.get('NEVIN_COMMENTARY_CACHE_MAX_ENTRIES', '5000'))
+
+
+def payload_key(payload):
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def prompt_fingerprint():
+    return hashlib.sha256(f'{ANTHROPIC_MODEL}\n{NEVIN_SYSTEM_PROMPT}'.encode('utf-8')).hexdigest()
+
+
+class CommentaryCache:
+    """SQLite cache with TTL expiry and least-recently-used eviction."""
+
+    def __init__(self, path=COMMENTARY_CACHE_PATH, ttl=COMMENTARY_CACHE_TTL,
+                 max_entries=COMMENTARY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._fingerprint = prompt_fingerprint()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS commentaries (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                reference TEXT NOT NULL,
+                commentary TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS commentaries_last_access ON commentaries (last_access)'
+        )
+        with self._conn:
+            purged = self._conn.execute(
+                'DELETE FROM commentaries WHERE fingerprint != ?', (self._fingerprint,)
+            ).rowcount
+        if purged:
+            logging.info(f'Commentary cache: purged {purged} entries from an older prompt/model')
+
+    def get(self, payload):
+        key = payload_key(payload)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT commentary, created_at FROM commentaries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute('DELETE FROM commentaries WHERE key = ?', (key,))
+                self.misses += 1
+                record_cache_lookup('commentary', 'miss')
+                return None
+            self._conn.execute(
+                'UPDATE commentaries SET last_access = ?, hits = hits + 1 WHERE key = ?',
+                (now, key)
+            )
+            self.hits += 1
+            record_cache_lookup('commentary', 'hit')
+            return row[0]
+
+    def put(self, payload, reference, commentary):
+        if not commentary:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO commentaries '
+                '(key, fingerprint, reference, commentary, created_at, last_access, hits) '
+                'VALUES (?, ?, ?, ?, ?, ?, 0)',
+                (payload_key(payload), self._fingerprint, reference, commentary, now, now)
+            )
+            self._conn.execute(
+                'DELETE FROM commentaries WHERE key IN ('
+                'SELECT key FROM commentaries ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM commentaries').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_commentary_cache():
+    """The process-wide cache for the threaded app, opened on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CommentaryCache()
+    return _cache
+
+
+def prewarm(cache, verses, llm):
+    """Generate and store commentaries for every verse in `verses` not already cached.
+
+    Goes through the provider client like the verse-commentary endpoint.
+    """
+    warmed = 0
+    for verse in verses:
+        payload = verse_commentary_payload(verse)
+        reference = verse_reference(verse)
+        if cache.get(payload) is not None:
+            continue
+        status, result = llm.complete('verse_commentary', payload)
+        if result is None:
+            logging.error(f'Prewarm failed for {reference}: {status}')
+            continue
+        cache.put(payload, reference, response_text(result))
+        warmed += 1
+        logging.info(f'Prewarmed {reference}')
+    return warmed
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 3 or sys.argv[1] != 'prewarm':
+        print('Usage: python commentary_cache.py prewarm verses.json')
+        sys.exit(1)
+
+    from providers import get_llm_client
+
+    llm = get_llm_client()
+    if not llm.configured:
+        print('No AI provider configured (see NEVIN_PROVIDER)')
+        sys.exit(1)
+    with open(sys.argv[2], encoding='utf-8') as f:
+        verses = json.load(f)
+    count = prewarm(CommentaryCache(), verses, llm)
+    print(f'Prewarmed {count} of {len(verses)} verses')
@@ -0,0 +1,172 @@
+"""
+Server-side chat history, keyed by conversation id.
+
+Clients that send a `conversationId` instead of a `history` array only POST
+the new message; the store replays recent turns verbatim and keeps a rolling
+summary of everything older. Once the verbatim turns exceed
+NEVIN_HISTORY_TOKEN_BUDGET the oldest exchanges are folded into the summary,
+which is itself capped at NEVIN_SUMMARY_TOKEN_BUDGET, so the prompt stays
+bounded however long the conversation runs.
+
+Folding is extractive (the opening sentence of each question and answer), so
+it needs no extra upstream call.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+from nevin import estimate_tokens
+
+CONVERSATION_STORE_PATH = os.environ.get(
+    'NEVIN_CONVERSATION_STORE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conversations.sqlite3')
+)
+CONVERSATION_TTL = int(os.environ.get('NEVIN_CONVERSATION_TTL', str(7 * 24 * 3600)))
+HISTORY_TOKEN_BUDGET = int(os.environ.get('NEVIN_HISTORY_TOKEN_BUDGET', '3000'))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get('NEVIN_SUMMARY_TOKEN_BUDGET', '500'))
+SUMMARY_LINE_CHARS = 200
+
+CONVERSATION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s')
+
+
+def valid_conversation_id(conversation_id):
+    return isinstance(conversation_id, str) and bool(CONVERSATION_ID_RE.match(conversation_id))
+
+
+def new_conversation_id():
+    return uuid.uuid4().hex
+
+
+def first_sentence(text):
+    text = ' '.join(text.split())
+    sentence = SENTENCE_END_RE.split(text, 1)[0]
+    if len(sentence) > SUMMARY_LINE_CHARS:
+        sentence = sentence[:SUMMARY_LINE_CHARS].rsplit(' ', 1)[0] + '…'
+    return sentence
+
+
+def summary_line(turn):
+    speaker = 'Usuario' if turn['role'] == 'user' else 'Nevin'
+    return f"- {speaker}: {first_sentence(turn['content'])}"
+
+
+def fold_turns(summary, turns, history_budget=HISTORY_TOKEN_BUDGET,
+               summary_budget=SUMMARY_TOKEN_BUDGET):
+    """Move the oldest exchanges into the summary until `turns` fits the budget.
+
+    The latest exchange is always kept verbatim; the summary drops its oldest
+    lines once it exceeds `summary_budget`.
+    """
+    turns = list(turns)
+    lines = summary.splitlines() if summary else []
+    while len(turns) > 2 and sum(estimate_tokens(t['content']) for t in turns) > history_budget:
+        lines.extend(summary_line(turn) for turn in turns[:2])
+        turns = turns[2:]
+    while lines and estimate_tokens('\n'.join(lines)) > summary_budget:
+        lines.pop(0)
+    return '\n'.join(lines), turns
+
+
+class ConversationStore:
+    """SQLite-backed conversations with TTL expiry."""
+
+    def __init__(self, path=CONVERSATION_STORE_PATH, ttl=CONVERSATION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                turns TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at)'
+        )
+
+    def load(self, conversation_id):
+        """Return (summary, turns) for a conversation; empty if unknown or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT summary, turns, updated_at FROM conversations WHERE id = ?',
+                (conversation_id,)
+            ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return '', []
+        return row[0], json.loads(row[1])
+
+    def append(self, conversation_id, message, reply):
+        """Record one exchange, folding older turns into the summary as needed."""
+        if not reply:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT summary, turns, updated_at FROM conversations WHERE id = ?',
+                (conversation_id,)
+            ).fetchone()
+            if row is None or now - row[2] > self.ttl:
+                summary, turns = '', []
+            else:
+                summary, turns = row[0], json.loads(row[1])
+
+            turns.append({'role': 'user', 'content': message})
+            turns.append({'role': 'assistant', 'content': reply})
+            summary, turns = fold_turns(summary, turns)
+
+            self._conn.execute(
+                'INSERT OR REPLACE INTO conversations (id, summary, turns, updated_at) '
+                'VALUES (?, ?, ?, ?)',
+                (conversation_id, summary, json.dumps(turns, ensure_ascii=False), now)
+            )
+            self._conn.execute(
+                'DELETE FROM conversations WHERE updated_at < ?', (now - self.ttl,)
+            )
+
+    def delete(self, conversation_id):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,))
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM conversations').fetchone()[0]
+        return {'conversations': entries}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """The process-wide store for the threaded app, opened on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore()
+    return _store
+
+
+def conversation_context(store, data):
+    """Resolve the chat request's history source.
+
+    Returns (conversation_id, data) where `data` carries the stored history and
+    summary, or (None, data) unchanged for clients that still send `history`.
+    """
+    if 'history' in data and 'conversationId' not in data:
+        return None, data
+    conversation_id = data.get('conversationId') or new_conversation_id()
+    summary, turns = store.load(conversation_id)
+    logging.debug(f'Conversation {conversation_id}: {len(turns)} turns, '
+                  f'{len(summary)} summary chars')
+    return conversation_id, {**data, 'history': turns, 'summary': summary}
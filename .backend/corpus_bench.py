@@ -0,0 +1,339 @@
+"""
+Micro-benchmarks for corpus loading and the search hot paths.
+
+Measures:
+    load     - parsing the EGW JSON books and the Bible verses, each in a
+               fresh interpreter, with wall time and peak RSS
+    build    - building the EGW BM25 index and the Bible FTS5 index, and
+               writing and mapping the compiled EGW corpus (egw_corpus.py)
+    query    - per-query latency of EGW and Bible search over a fixed set
+               of Spanish queries (single word, multiword, accented, rare)
+
+Load and build steps run in child processes so each one starts from a
+cold interpreter and reports its own peak RSS (the OS page cache is not
+dropped). The compiled corpus is written to a temporary file, never over
+NEVIN_EGW_CORPUS. Results are printed as tables and, with --output,
+written as JSON; --baseline compares against an earlier JSON and exits 1
+when a step or query got slower by more than --max-regression percent.
+
+    python corpus_bench.py --output corpus.json
+    python corpus_bench.py --iterations 200 --baseline corpus.json
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUERIES = [
+    ('single', 'amor'),
+    ('single', 'fe'),
+    ('single', 'sábado'),
+    ('multiword', 'el amor de Dios'),
+    ('multiword', 'reino de los cielos'),
+    ('multiword', 'segunda venida de Cristo'),
+    ('accented', 'oración'),
+    ('accented', 'salvación por la fe'),
+    ('accented', 'espíritu santo'),
+    ('rare', 'Melquisedec'),
+    ('rare', 'efod'),
+    ('rare', 'Nabucodonosor'),
+]
+
+STEPS = ('egw_json_load', 'egw_index_build', 'egw_corpus_write', 'egw_corpus_map',
+         'bible_load', 'bible_index_build')
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+# -- steps, each run in its own process ---------------------------------------
+
+def egw_json_load(corpus_path):
+    from egw_search import EGW_BOOKS_DIR
+    books = pages = size = 0
+    for filename in sorted(os.listdir(EGW_BOOKS_DIR)):
+        if not filename.endswith('.json'):
+            continue
+        path = os.path.join(EGW_BOOKS_DIR, filename)
+        size += os.path.getsize(path)
+        with open(path, encoding='utf-8') as f:
+            pages += len(json.load(f))
+        books += 1
+    return {'books': books, 'pages': pages, 'json_mb': round(size / (1024 * 1024), 1)}
+
+
+def egw_index_build(corpus_path):
+    from egw_search import EGWIndex
+    index = EGWIndex.from_directory()
+    return {'books': len(index.books), 'pages': len(index.doc_len), 'terms': len(index.postings)}
+
+
+def egw_corpus_write(corpus_path):
+    from egw_search import EGWIndex
+    from egw_corpus import write_corpus
+    write_corpus(EGWIndex.from_directory(), corpus_path)
+    return {'corpus_mb': round(os.path.getsize(corpus_path) / (1024 * 1024), 1)}
+
+
+def egw_corpus_map(corpus_path):
+    from egw_corpus import MappedEGWIndex
+    index = MappedEGWIndex(corpus_path)
+    return {'pages': len(index.doc_len), 'terms': len(index.postings)}
+
+
+def bible_load(corpus_path):
+    from bible_store import BIBLE_BOOKS_PATH, BIBLE_VERSES_PATH, BibleStore, load_json
+    store = BibleStore(load_json(BIBLE_BOOKS_PATH, 'Bible books'),
+                       load_json(BIBLE_VERSES_PATH, 'Bible verses'))
+    return {'verses': len(store)}
+
+
+def bible_index_build(corpus_path):
+    from bible_store import get_bible_store
+    from bible_search import BibleSearch
+    store = get_bible_store()
+    # Only the FTS5 build is timed, not the store load it needs.
+    started = time.perf_counter()
+    BibleSearch(store)
+    return {'verses': len(store), 'seconds': time.perf_counter() - started}
+
+
+def run_step_here(name, corpus_path):
+    """Run one step in this process and print its measurements as JSON."""
+    baseline_rss = peak_rss_mb()
+    started = time.perf_counter()
+    result = globals()[name](corpus_path)
+    seconds = result.pop('seconds', time.perf_counter() - started)
+    print(json.dumps({
+        'step': name,
+        'seconds': round(seconds, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_growth_mb': round(peak_rss_mb() - baseline_rss, 1),
+        **result
+    }))
+
+
+def run_step(name, corpus_path):
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--step', name, '--corpus-path', corpus_path],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1:] or ['no output']
+        return {'step': name, 'error': error[0]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+# -- queries ------------------------------------------------------------------
+
+def time_query(search, query, warmup, iterations):
+    for _ in range(warmup):
+        search(query)
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        results = search(query)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        'p50_ms': round(timings[len(timings) // 2] * 1000, 4),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 4),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 4),
+        'min_ms': round(timings[0] * 1000, 4),
+        'results': len(results),
+    }
+
+
+def query_searchers(corpus_path):
+    """(name, search, candidates) for every index that could be loaded.
+
+    `candidates` counts the pages BM25 scores for a query, which is what
+    drives EGW latency; None for the Bible index.
+    """
+    from egw_search import EGWIndex
+    from egw_corpus import MappedEGWIndex
+    from bible_store import get_bible_store
+    from bible_search import BibleSearch
+    from textnorm import tokenize
+
+    index = EGWIndex.from_directory()
+
+    def candidates(query):
+        return len(index.score(tokenize(query)))
+
+    searchers = [('egw_memory', lambda q: index.search(q, 10), candidates)]
+    if os.path.exists(corpus_path):
+        mapped = MappedEGWIndex(corpus_path)
+        searchers.append(('egw_mapped', lambda q: mapped.search(q, 10), candidates))
+    store = get_bible_store()
+    if len(store):
+        bible = BibleSearch(store)
+        searchers.append(('bible', lambda q: bible.search(q, limit=20)[0], None))
+    return searchers
+
+
+def run_queries(corpus_path, warmup, iterations):
+    results = []
+    for searcher, search, candidates in query_searchers(corpus_path):
+        for category, query in QUERIES:
+            results.append({
+                'index': searcher,
+                'category': category,
+                'query': query,
+                **time_query(search, query, warmup, iterations),
+                'candidates': candidates(query) if candidates else None,
+            })
+    return results
+
+
+# -- reporting ----------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_tables(report):
+    print(f"{'step':<20}{'seconds':>10}{'peak RSS MB':>13}{'growth MB':>11}  details")
+    print('-' * 72)
+    for step in report['steps']:
+        if 'error' in step:
+            print(f"{step['step']:<20}{'failed':>10}  {step['error']}")
+            continue
+        details = ', '.join(
+            f'{key}={value}' for key, value in step.items()
+            if key not in ('step', 'seconds', 'peak_rss_mb', 'rss_growth_mb')
+        )
+        print(f"{step['step']:<20}{step['seconds']:>10.3f}{step['peak_rss_mb']:>13.1f}"
+              f"{step['rss_growth_mb']:>11.1f}  {details}")
+
+    if not report['queries']:
+        return
+    print()
+    print(f"{'index':<12}{'category':<11}{'query':<28}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'results':>9}{'cands':>8}")
+    print('-' * 88)
+    for query in report['queries']:
+        print(f"{query['index']:<12}{query['category']:<11}{query['query']:<28}"
+              f"{query['p50_ms']:>10.3f}{query['p95_ms']:>10.3f}{query['results']:>9}"
+              f"{query['candidates'] if query['candidates'] is not None else '-':>8}")
+
+
+def compare(report, baseline, max_regression):
+    """Print changes against a baseline run; returns the list of regressions."""
+    regressions = []
+    before_steps = {s['step']: s for s in baseline.get('steps', []) if 'error' not in s}
+    for step in report['steps']:
+        before = before_steps.get(step['step'])
+        if 'error' in step or before is None or not before['seconds']:
+            continue
+        change = (step['seconds'] / before['seconds'] - 1) * 100
+        rss_change = step['peak_rss_mb'] - before['peak_rss_mb']
+        print(f"{step['step']:<36} time {change:+6.1f}%   peak RSS {rss_change:+7.1f} MB")
+        if change > max_regression:
+            regressions.append(step['step'])
+
+    before_queries = {(q['index'], q['query']): q for q in baseline.get('queries', [])}
+    for query in report['queries']:
+        before = before_queries.get((query['index'], query['query']))
+        if before is None or not before['p50_ms']:
+            continue
+        change = (query['p50_ms'] / before['p50_ms'] - 1) * 100
+        name = f"{query['index']}:{query['query']}"
+        print(f'{name:<36} p50 {change:+6.1f}%')
+        if change > max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--steps', default=','.join(STEPS),
+                        help=f"comma-separated load/build steps, from {', '.join(STEPS)}")
+    parser.add_argument('--skip-queries', action='store_true')
+    parser.add_argument('--iterations', type=int, default=50, help='timed runs per query')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed runs per query')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--baseline', help='earlier --output JSON to compare against')
+    parser.add_argument('--max-regression', type=float, default=20.0,
+                        help='percent slowdown that fails --baseline (default 20)')
+    # Internal: run a single step in this process.
+    parser.add_argument('--step', choices=STEPS, help=argparse.SUPPRESS)
+    parser.add_argument('--corpus-path', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.steps = [name.strip() for name in args.steps.split(',') if name.strip()]
+    unknown = set(args.steps) - set(STEPS)
+    if unknown:
+        parser.error(f"unknown steps: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.step:
+        run_step_here(args.step, args.corpus_path)
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix='nevin-corpus-bench-') as tmp:
+        corpus_path = os.path.join(tmp, 'egw_corpus.bin')
+        steps = []
+        for name in args.steps:
+            if name == 'egw_corpus_map' and not os.path.exists(corpus_path):
+                steps.append({'step': name, 'error': 'needs egw_corpus_write first'})
+                continue
+            print(f'{name}...', file=sys.stderr)
+            steps.append(run_step(name, corpus_path))
+
+        queries = []
+        if not args.skip_queries:
+            print('queries...', file=sys.stderr)
+            queries = run_queries(corpus_path, args.warmup, args.iterations)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+        },
+        'steps': steps,
+        'queries': queries,
+    }
+    print_tables(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'Results written to {args.output}', file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.max_regression)
+        if regressions:
+            print(f"Regressions over {args.max_regression}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""
+Precompiled binary EGW corpus, loaded with mmap.
+
+`python egw_corpus.py build` parses assets/EGW BOOKS JSON once and writes a
+single file holding an interned string table (page lines, terms, book names),
+per-page offsets and the BM25 postings. Workers then map that file read-only,
+so the corpus is shared through the OS page cache instead of being parsed
+into Python objects in every process.
+
+File layout (native little-endian): an 8-byte magic/version header, the
+average document length, the source fingerprint, a table of (offset, length)
+pairs for SECTIONS and then each section, 8-byte aligned.
+
+The fingerprint is a SHA-256 over the book JSON files and the code that
+turns them into terms (textnorm and EGWIndex.add_book/finalize). A corpus
+whose fingerprint does not match the current sources is stale: it is not
+served, and load_egw_index indexes the JSON and rewrites the file instead.
+"""
+
+import os
+import sys
+import mmap
+import time
+import struct
+import hashlib
+import inspect
+import logging
+from array import array
+
+import textnorm
+from egw_search import EGW_BOOKS_DIR, EGWIndex
+
+EGW_CORPUS_PATH = os.environ.get(
+    'NEVIN_EGW_CORPUS',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'egw_corpus.bin')
+)
+
+MAGIC = b'EGWC'
+VERSION = 2
+
+# (name, array typecode); 'B' sections are raw bytes.
+SECTIONS = [
+    ('strings', 'B'),
+    ('string_offsets', 'I'),
+    ('book_names', 'I'),
+    ('page_book', 'H'),
+    ('page_number', 'I'),
+    ('doc_len', 'I'),
+    ('page_line_offsets', 'I'),
+    ('line_ids', 'I'),
+    ('term_ids', 'I'),
+    ('postings_offsets', 'I'),
+    ('post_docs', 'I'),
+    ('post_tfs', 'H'),
+]
+
+HEADER = struct.Struct('<4sId32s')
+SECTION_ENTRY = struct.Struct('<QQ')
+
+
+def indexing_source():
+    """The code that decides a page's terms; a change invalidates compiled corpora."""
+    return ''.join([
+        inspect.getsource(textnorm),
+        inspect.getsource(EGWIndex.add_book),
+        inspect.getsource(EGWIndex.finalize),
+    ]).encode('utf-8')
+
+
+def source_fingerprint(books_dir=EGW_BOOKS_DIR):
+    """SHA-256 of the book JSON files and indexing_source(); None without the books."""
+    if not os.path.isdir(books_dir):
+        return None
+    digest = hashlib.sha256(indexing_source())
+    for filename in sorted(os.listdir(books_dir)):
+        if not filename.endswith('.json'):
+            continue
+        digest.update(filename.encode('utf-8') + b'\0')
+        with open(os.path.join(books_dir, filename), 'rb') as f:
+            digest.update(f.read())
+    return digest.digest()
+
+
+class StringTable:
+    """Interns strings while building; id -> offset into one UTF-8 blob."""
+
+    def __init__(self):
+        self.ids = {}
+        self.data = bytearray()
+        self.offsets = array('I', [0])
+
+    def intern(self, value):
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.offsets) - 1
+            self.data += value.encode('utf-8')
+            self.offsets.append(len(self.data))
+        return string_id
+
+
+def write_corpus(index, path=EGW_CORPUS_PATH, fingerprint=None):
+    """Write `index` to `path`; `fingerprint` defaults to that of EGW_BOOKS_DIR."""
+    if fingerprint is None:
+        fingerprint = source_fingerprint() or bytes(32)
+    strings = StringTable()
+    book_names = array('I', (strings.intern(name) for name in index.books))
+
+    page_line_offsets = array('I', [0])
+    line_ids = array('I')
+    for lines in index.page_lines:
+        line_ids.extend(strings.intern(line) for line in lines)
+        page_line_offsets.append(len(line_ids))
+
+    terms = sorted(index.postings, key=lambda term: term.encode('utf-8'))
+    term_ids = array('I')
+    postings_offsets = array('I', [0])
+    post_docs = array('I')
+    post_tfs = array('H')
+    for term in terms:
+        docs, tfs = index.postings[term]
+        term_ids.append(strings.intern(term))
+        post_docs.extend(docs)
+        post_tfs.extend(tfs)
+        postings_offsets.append(len(post_docs))
+
+    sections = {
+        'strings': bytes(strings.data),
+        'string_offsets': strings.offsets.tobytes(),
+        'book_names': book_names.tobytes(),
+        'page_book': index.page_book.tobytes(),
+        'page_number': index.page_number.tobytes(),
+        'doc_len': index.doc_len.tobytes(),
+        'page_line_offsets': page_line_offsets.tobytes(),
+        'line_ids': line_ids.tobytes(),
+        'term_ids': term_ids.tobytes(),
+        'postings_offsets': postings_offsets.tobytes(),
+        'post_docs': post_docs.tobytes(),
+        'post_tfs': post_tfs.tobytes(),
+    }
+
+    offset = HEADER.size + SECTION_ENTRY.size * len(SECTIONS)
+    table = []
+    for name, _ in SECTIONS:
+        offset = (offset + 7) & ~7
+        table.append((offset, len(sections[name])))
+        offset += len(sections[name])
+
+    # Per process, so workers rebuilding a stale corpus at once do not collide.
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, index.avg_doc_len, fingerprint))
+        for entry in table:
+            f.write(SECTION_ENTRY.pack(*entry))
+        for (name, _), (section_offset, _) in zip(SECTIONS, table):
+            f.write(b'\0' * (section_offset - f.tell()))
+            f.write(sections[name])
+    os.replace(tmp_path, path)
+
+
+class MappedLines:
+    """page_lines view: doc -> list of line strings decoded on access."""
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def __getitem__(self, doc):
+        c = self.corpus
+        start, end = c.page_line_offsets[doc], c.page_line_offsets[doc + 1]
+        return [c.string(c.line_ids[i]) for i in range(start, end)]
+
+    def __len__(self):
+        return len(self.corpus.page_line_offsets) - 1
+
+
+class MappedPostings:
+    """postings view: binary search over the sorted term table."""
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def find(self, term):
+        c = self.corpus
+        key = term.encode('utf-8')
+        lo, hi = 0, len(c.term_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if c.string_bytes(c.term_ids[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(c.term_ids) and c.string_bytes(c.term_ids[lo]) == key:
+            return lo
+        return None
+
+    def get(self, term, default=None):
+        position = self.find(term)
+        if position is None:
+            return default
+        c = self.corpus
+        start, end = c.postings_offsets[position], c.postings_offsets[position + 1]
+        return c.post_docs[start:end], c.post_tfs[start:end]
+
+    def __len__(self):
+        return len(self.corpus.term_ids)
+
+
+class MappedEGWIndex(EGWIndex):
+    """EGWIndex whose arrays are read-only views into a mapped corpus file."""
+
+    def __init__(self, path=EGW_CORPUS_PATH):
+        super().__init__()
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, avg_doc_len, self.fingerprint = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} EGW corpus')
+        if sys.byteorder != 'little':
+            raise ValueError('EGW corpus files are little-endian')
+
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, length = SECTION_ENTRY.unpack_from(view, HEADER.size + i * SECTION_ENTRY.size)
+            section = view[offset:offset + length]
+            setattr(self, name, section if typecode == 'B' else section.cast(typecode))
+
+        self.avg_doc_len = avg_doc_len
+        self.books = [self.string(string_id) for string_id in self.book_names]
+        self.page_lines = MappedLines(self)
+        self.postings = MappedPostings(self)
+
+    def string_bytes(self, string_id):
+        return self.strings[self.string_offsets[string_id]:self.string_offsets[string_id + 1]].tobytes()
+
+    def string(self, string_id):
+        return self.string_bytes(string_id).decode('utf-8')
+
+
+def load_egw_index():
+    """Map the compiled corpus if it matches the sources, otherwise index the JSON books.
+
+    A stale or unreadable corpus is rewritten from the fresh index for the
+    next start.
+    """
+    if not os.path.exists(EGW_CORPUS_PATH):
+        return EGWIndex.from_directory(EGW_BOOKS_DIR)
+
+    fingerprint = source_fingerprint(EGW_BOOKS_DIR)
+    try:
+        index = MappedEGWIndex(EGW_CORPUS_PATH)
+    except (OSError, ValueError) as e:
+        logging.error(f'Could not map EGW corpus, rebuilding from JSON: {e}')
+    else:
+        if fingerprint is None:
+            logging.warning(f'EGW books not found; serving {EGW_CORPUS_PATH} unverified')
+            return index
+        if index.fingerprint == fingerprint:
+            logging.info(f'EGW index: mapped {EGW_CORPUS_PATH}')
+            return index
+        logging.warning(f'{EGW_CORPUS_PATH} is stale (EGW books or tokenizer changed), '
+                        'rebuilding from JSON')
+
+    index = EGWIndex.from_directory(EGW_BOOKS_DIR)
+    try:
+        write_corpus(index, EGW_CORPUS_PATH, fingerprint)
+    except OSError as e:
+        logging.error(f'Could not rewrite EGW corpus: {e}')
+    return index
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 2 or sys.argv[1] != 'build':
+        print('Usage: python egw_corpus.py build')
+        sys.exit(1)
+
+    started = time.time()
+    write_corpus(EGWIndex.from_directory(EGW_BOOKS_DIR), EGW_CORPUS_PATH)
+    size_mb = os.path.getsize(EGW_CORPUS_PATH) / (1024 * 1024)
+    print(f'Wrote {EGW_CORPUS_PATH} ({size_mb:.1f} MB) in {time.time() - started:.1f}s')
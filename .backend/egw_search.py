@@ -0,0 +1,147 @@
+"""
+In-process inverted index over the EGW books in assets/EGW BOOKS JSON.
+
+Each book file is a list of {page, content[]} records; every page is one
+document. Terms are accent-folded, stopword-filtered and lightly stemmed
+(see textnorm.py) and ranked with BM25.
+"""
+
+import os
+import json
+import math
+import heapq
+import logging
+import threading
+from array import array
+from collections import Counter
+
+from textnorm import fold, tokenize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EGW_BOOKS_DIR = os.environ.get('NEVIN_EGW_DIR', os.path.join(REPO_ROOT, 'assets', 'EGW BOOKS JSON'))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_CHARS = 300
+
+
+class EGWIndex:
+    """BM25 inverted index with one document per book page."""
+
+    def __init__(self):
+        self.books = []
+        self.page_book = array('H')
+        self.page_number = array('I')
+        self.page_lines = []
+        self.doc_len = array('I')
+        self.postings = {}
+        self.avg_doc_len = 0.0
+
+    @classmethod
+    def from_directory(cls, path=EGW_BOOKS_DIR):
+        index = cls()
+        building = {}
+        for filename in sorted(os.listdir(path)):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(path, filename), encoding='utf-8') as f:
+                pages = json.load(f)
+            index.add_book(filename[:-len('.json')], pages, building)
+        index.finalize(building)
+        logging.info(f'EGW index: {len(index.books)} books, {len(index.doc_len)} pages, '
+                     f'{len(index.postings)} terms')
+        return index
+
+    def add_book(self, name, pages, building):
+        book_id = len(self.books)
+        self.books.append(name)
+        for page in pages:
+            content = page.get('content')
+            if not content or not isinstance(content, list):
+                continue
+            doc = len(self.doc_len)
+            terms = Counter(tokenize(' '.join(content)))
+            self.page_book.append(book_id)
+            self.page_number.append(page.get('page') or 0)
+            self.page_lines.append(content)
+            self.doc_len.append(sum(terms.values()))
+            for term, tf in terms.items():
+                entry = building.get(term)
+                if entry is None:
+                    entry = building[term] = (array('I'), array('H'))
+                entry[0].append(doc)
+                entry[1].append(min(tf, 0xFFFF))
+
+    def finalize(self, building):
+        self.postings = building
+        self.avg_doc_len = (sum(self.doc_len) / len(self.doc_len)) if self.doc_len else 0.0
+
+    def score(self, terms, book_id=None):
+        """Return {doc: bm25 score} for the given query terms."""
+        n_docs = len(self.doc_len)
+        scores = {}
+        for term in set(terms):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            docs, tfs = entry
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc, tf in zip(docs, tfs):
+                if book_id is not None and self.page_book[doc] != book_id:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[doc] / self.avg_doc_len)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def snippet(self, doc, terms):
+        """Up to SNIPPET_CHARS of page text starting at the first line that matches."""
+        lines = self.page_lines[doc]
+        start = 0
+        for i, line in enumerate(lines):
+            if any(term in fold(line) for term in terms):
+                start = i
+                break
+        return ' '.join(lines[start:start + 8])[:SNIPPET_CHARS]
+
+    def search(self, query, max_results=3, book=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        book_id = None
+        if book:
+            if book not in self.books:
+                return []
+            book_id = self.books.index(book)
+
+        scores = self.score(terms, book_id)
+        top = heapq.nlargest(max_results, scores.items(), key=lambda item: item[1])
+        return [{
+            'book': self.books[self.page_book[doc]],
+            'page': self.page_number[doc],
+            'content': self.snippet(doc, terms),
+            'relevance': round(score, 4)
+        } for doc, score in top]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_egw_index():
+    """Load the index on first use; later calls share the same instance.
+
+    Uses the compiled corpus from egw_corpus.py when present.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from egw_corpus import load_egw_index
+                _index = load_egw_index()
+    return _index
+
+
+def loaded_egw_index():
+    """The shared index if something already loaded it, without loading it."""
+    return _index
@@ -0,0 +1,364 @@
+"""
+Request handling shared by app.py (Flask) and async_app.py (aiohttp).
+
+Everything here is framework-neutral: validation raises RequestError, the
+ChatTurn/CommentaryRequest steps do the blocking work (SQLite, retrieval,
+the Bible store) so async_app can run them through run_blocking, and the
+*_body helpers build the JSON bodies. Each server only reads the request,
+calls the provider its own way and wraps the results in its response type.
+"""
+
+import math
+import time
+import logging
+
+from nevin import (
+    MOMENT_TITLE_BATCH_MAX,
+    chat_payload,
+    dedupe_conversations,
+    log_usage,
+    merge_usage,
+    moment_title_payload,
+    parse_moment_title,
+    response_text,
+    usage_summary,
+    verse_commentary_payload,
+    verse_reference,
+)
+from metrics import UPSTREAM_SECONDS, record_upstream_error
+from moment_titler import MOMENT_TITLE_MODE
+from response_cache import RESPONSE_CACHE_ENABLED, cache_variant, cacheable_turn
+from conversation_store import conversation_context, valid_conversation_id
+from bible_store import get_bible_store, with_verse_texts
+from bible_references import resolve_references
+from egw_search import get_egw_index
+from retrieval import (
+    RETRIEVAL_ENABLED,
+    format_sources,
+    load_retriever_in_background,
+    loaded_retriever,
+)
+from query_router import route_chat, title_route
+
+NOT_CONFIGURED = 'Servicio no configurado correctamente'
+TITLES_NOT_CONFIGURED = 'Servicio no configurado'
+UPSTREAM_FAILED = 'Error al comunicarse con el servicio de IA'
+UPSTREAM_AUTH_FAILED = 'Error de autenticación con el servicio de IA'
+UPSTREAM_TIMEOUT = 'El servicio tardó demasiado en responder'
+COMMENTARY_FAILED = 'Error al obtener el comentario'
+INVALID_TITLE = 'Respuesta no válida del servicio de IA'
+INTERNAL_ERROR = 'Error interno del servidor'
+TOO_MANY_REQUESTS = 'Demasiadas solicitudes. Intenta de nuevo en unos segundos.'
+
+EGW_DEFAULT_RESULTS = 3
+EGW_MAX_RESULTS = 50
+
+
+class RequestError(Exception):
+    """Answered as {'success': False, 'error': message} with HTTP `status`."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+    def body(self):
+        return error_body(self.message)
+
+
+def error_body(message):
+    return {'success': False, 'error': message}
+
+
+def retry_after(overloaded):
+    """Retry-After header value for an admission.Overloaded rejection."""
+    return str(math.ceil(overloaded.retry_after))
+
+
+def require_configured(llm, message=NOT_CONFIGURED):
+    if not llm.configured:
+        raise RequestError(message, 500)
+
+
+def require_titles_configured(llm):
+    # The local and hedge modes can always fall back to the local titler.
+    if MOMENT_TITLE_MODE == 'llm':
+        require_configured(llm, TITLES_NOT_CONFIGURED)
+
+
+def require_data(data):
+    if not data:
+        raise RequestError('No data provided')
+    return data
+
+
+def require_conversation_id(conversation_id):
+    if not valid_conversation_id(conversation_id):
+        raise RequestError('Invalid conversationId')
+    return conversation_id
+
+
+def wants_stream(data, accept):
+    """True for {"stream": true} bodies or an `Accept: text/event-stream` header."""
+    if data.get('stream'):
+        return True
+    return 'text/event-stream' in (accept or '')
+
+
+def retrieve_sources(data):
+    """Sources for the question, or None while the retriever is still loading."""
+    if not RETRIEVAL_ENABLED or not data.get('includeSources', True):
+        return []
+    retriever = loaded_retriever()
+    if retriever is None:
+        load_retriever_in_background()
+        return None
+    try:
+        return retriever.retrieve(data.get('message', ''))
+    except Exception as e:
+        logging.error(f'Error retrieving sources: {e}')
+        return []
+
+
+def completion_text(endpoint, payload, status, result, error_message):
+    """Return (text, usage) of a finished completion; RequestError(500) if it failed.
+
+    Usage is priced for the model that answered, else the one `payload` asked for.
+    """
+    if status == 401:
+        logging.error('Upstream API authentication failed')
+        raise RequestError(UPSTREAM_AUTH_FAILED, 500)
+    if result is None:
+        raise RequestError(error_message, 500)
+    usage = usage_summary(result.get('usage'))
+    log_usage(endpoint, usage, result.get('model') or payload.get('model'))
+    return response_text(result), usage
+
+
+class CompletionStream:
+    """Turns the provider's (kind, value) stream events into client (event, body) pairs.
+
+    Each server drives it from its own loop: feed() every provider event and
+    relay what it returns until `closed`; then, unless `failed`, call finish()
+    and send done(). Timeouts and exceptions become timed_out()/crashed().
+
+    Failed upstream calls are counted where they are seen first: upstream.py
+    for statuses and connection errors, the provider for failures inside the
+    streamed body. Only crashes of our own are counted here.
+    """
+
+    def __init__(self, endpoint, payload, error_message):
+        self.endpoint = endpoint
+        # Usage is priced for the model that answered, once a usage event names it.
+        self.model = payload.get('model')
+        self.error_message = error_message
+        self.chunks = []
+        self.usage = usage_summary(None)
+        self.started = time.perf_counter()
+        self.closed = False
+        self.failed = False
+
+    def feed(self, kind, value):
+        """Return the (event, body) to relay for one provider event, or None."""
+        if kind == 'delta':
+            self.chunks.append(value)
+            return 'delta', {'text': value}
+        if kind == 'usage':
+            merge_usage(self.usage, value)
+            self.model = value.get('model') or self.model
+            return None
+        self.closed = True
+        if kind == 'error':
+            self.failed = True
+            logging.error(f'Upstream stream error: {value}')
+            return 'error', error_body(self.error_message)
+        return None
+
+    def finish(self):
+        """Record the finished stream and return its full text."""
+        UPSTREAM_SECONDS.observe(time.perf_counter() - self.started, self.endpoint, 'stream')
+        log_usage(self.endpoint, self.usage, self.model)
+        return ''.join(self.chunks)
+
+    def done(self, extra=None):
+        return 'done', {'success': True, 'usage': self.usage, **(extra or {})}
+
+    def timed_out(self):
+        return 'error', error_body(UPSTREAM_TIMEOUT)
+
+    def crashed(self, error, recorded=False):
+        """The error event for an exception; `recorded` if the transport already counted it."""
+        logging.error(f'Error streaming from upstream: {error}')
+        if not recorded:
+            record_upstream_error(self.endpoint, 'exception')
+        return 'error', error_body(INTERNAL_ERROR)
+
+
+def text_events(text, extra=None):
+    """(event, body) pairs that deliver an already known text as a stream."""
+    return [('delta', {'text': text}), ('done', {'success': True, **(extra or {})})]
+
+
+class ChatTurn:
+    """One validated /api/nevin/chat request.
+
+    Construction loads the conversation history, looks up a cached answer and
+    retrieves sources; it and finish() touch SQLite and the retriever, so
+    async_app runs both through run_blocking.
+    """
+
+    def __init__(self, data, store, response_cache):
+        data = require_data(data)
+        self.message = data.get('message', '')
+        if not self.message:
+            raise RequestError('No message provided')
+        if 'conversationId' in data:
+            require_conversation_id(data['conversationId'])
+
+        self.store = store
+        self.response_cache = response_cache
+        self.conversation_id, self.data = conversation_context(store, data)
+        self.cacheable = RESPONSE_CACHE_ENABLED and cacheable_turn(self.data)
+        self.route = route_chat(self.data)
+        self.variant = cache_variant(
+            RETRIEVAL_ENABLED and self.data.get('includeSources', True), self.route
+        )
+        self.cached = response_cache.get(self.message, self.variant) if self.cacheable else None
+        self.sources = self.cached[1] if self.cached else retrieve_sources(self.data)
+        if self.sources is None:
+            # Answered ungrounded while the retriever loads; not cached as a grounded answer.
+            self.sources, self.cacheable = [], False
+
+    def payload(self):
+        sources_block = format_sources(self.sources) if self.sources else ''
+        return chat_payload(self.data, sources_block, self.route)
+
+    def finish(self, reply):
+        """Cache and store the reply; returns the extra fields for the response."""
+        if self.cacheable and not self.cached:
+            self.response_cache.put(self.message, reply, self.sources, self.variant)
+        if self.conversation_id:
+            self.store.append(self.conversation_id, self.message, reply)
+        return {'references': resolve_references(reply)}
+
+    def preamble(self):
+        """(event, body) pairs streamed ahead of the reply."""
+        events = [('sources', {'sources': self.sources})]
+        if self.conversation_id:
+            events.insert(0, ('conversation', {'conversationId': self.conversation_id}))
+        return events
+
+    def reply_body(self, reply, **fields):
+        body = {'success': True, 'response': reply, 'sources': self.sources, **fields}
+        if self.conversation_id:
+            body['conversationId'] = self.conversation_id
+        return body
+
+
+class CommentaryRequest:
+    """One validated /api/nevin/verse-commentary request and any cached commentary.
+
+    Construction reads the Bible store and the commentary cache and finish()
+    writes to it, so async_app runs both through run_blocking.
+    """
+
+    def __init__(self, data, cache):
+        self.data = with_verse_texts(get_bible_store(), require_data(data))
+        self.payload = verse_commentary_payload(self.data)
+        self.reference = verse_reference(self.data)
+        self.cache = cache
+        self.cached = cache.get(self.payload)
+
+    def finish(self, text):
+        """Cache the commentary; returns the extra fields for the response."""
+        self.cache.put(self.payload, self.reference, text)
+        return {'references': resolve_references(text)}
+
+    def cached_extra(self):
+        return {'references': resolve_references(self.cached)}
+
+    def cached_body(self, extra):
+        return {'success': True, 'commentary': self.cached, 'cached': True, **extra}
+
+    def reply_body(self, commentary, usage, extra):
+        return {'success': True, 'commentary': commentary, 'usage': usage, **extra}
+
+
+def title_payload(conversation):
+    return moment_title_payload(conversation, title_route())
+
+
+def title_outcome(result):
+    """Return (parsed title, error message) for an upstream title completion."""
+    if result is None:
+        return None, UPSTREAM_FAILED
+    parsed = parse_moment_title(response_text(result, '{}'))
+    if parsed is None:
+        return None, INVALID_TITLE
+    return parsed, None
+
+
+def local_titles_only(llm):
+    return MOMENT_TITLE_MODE == 'local' or not llm.configured
+
+
+def title_batch(data):
+    """Validate a generate-moment-titles body; returns dedupe_conversations()'s
+    (unique, slots, rejected)."""
+    conversations = data.get('conversations') if data else None
+    if not isinstance(conversations, list):
+        raise RequestError('No conversations provided')
+    if len(conversations) > MOMENT_TITLE_BATCH_MAX:
+        raise RequestError(f'Máximo {MOMENT_TITLE_BATCH_MAX} conversaciones por solicitud')
+    return dedupe_conversations(conversations)
+
+
+def clamped_int(value, default, maximum, name):
+    """`value` as an int within [1, maximum]; RequestError for anything that is not a number."""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        raise RequestError(f'{name} no válido')
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise RequestError(f'{name} no válido')
+    return max(1, min(number, maximum))
+
+
+def egw_search_body(data):
+    """Validate an /api/egw/search body and run the search (blocking: may load the index)."""
+    data = data or {}
+    query = data.get('query', '')
+    book = data.get('book')
+    if not isinstance(query, str) or (book is not None and not isinstance(book, str)):
+        raise RequestError('Búsqueda no válida')
+    if not query:
+        return {'success': True, 'quotes': []}
+
+    max_results = clamped_int(
+        data.get('maxResults'), EGW_DEFAULT_RESULTS, EGW_MAX_RESULTS, 'maxResults'
+    )
+    return {'success': True, 'quotes': get_egw_index().search(query, max_results, book=book)}
+
+
+def store_stats(commentary_cache, conversation_store, response_cache):
+    """The SQLite-backed part of /api/health (blocking)."""
+    return {
+        'commentary_cache': commentary_cache.stats(),
+        'conversation_store': conversation_store.stats(),
+        'response_cache': response_cache.stats(),
+    }
+
+
+def health_body(llm, warmup, stores, inflight, admission_gate, rate_limiter):
+    return {
+        'status': 'ok',
+        'service': 'Nevin AI Backend',
+        'api_configured': llm.configured,
+        'ready': warmup.ready,
+        **stores,
+        'inflight': inflight.stats(),
+        'admission': admission_gate.stats(),
+        'rate_limiter': rate_limiter.stats()
+    }
@@ -0,0 +1,530 @@
+"""
+Load test for the Nevin backend against a local mock upstream.
+
+Starts mock_upstream.py and a backend (the Flask app by default) pointed
+at it, waits for /api/health/ready, then runs each scenario at each
+concurrency level as a closed loop: N clients each send their next
+request as soon as the previous one finishes, for --duration seconds.
+
+For every (scenario, concurrency) it reports requests per second,
+latency p50/p95/p99 (and time to first delta for streams), errors by
+status, admission-gate saturation sampled from /api/health, and RSS per
+server process read from /proc. Results are printed as a table and, with
+--output, written as JSON; --baseline compares against an earlier JSON
+and exits 1 when p95 or throughput regressed by more than
+--max-regression percent.
+
+    python loadtest.py --concurrency 1,8,32 --duration 20 --output bench.json
+    python loadtest.py --server gunicorn --workers 4 --baseline bench.json
+
+Questions carry a per-request nonce so the response and commentary caches
+do not answer them; pass --cacheable to measure cache hits instead. The
+server's rate limit is lifted, all requests come from one address.
+
+A server without Bible verse data reports bible_store as degraded once
+warmed up; the default scenarios then leave out bible_search, which would
+only measure empty results.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import itertools
+import platform
+import tempfile
+import subprocess
+from collections import Counter
+from datetime import datetime, timezone
+
+import aiohttp
+
+from admission import ADMISSION_MAX_ACTIVE
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUESTIONS = [
+    '¿Qué significa Juan 3:16?',
+    '¿Cómo puedo tener paz en medio de la ansiedad?',
+    'Explícame la profecía de Daniel 2 en detalle',
+    '¿Qué enseña la Biblia sobre el sábado?',
+    'Estoy triste porque murió mi abuela, ¿qué dice la Biblia?',
+]
+SEARCH_TERMS = ['amor', 'fe', 'espíritu santo', 'misericordia', 'reino de los cielos', 'oración']
+VERSES = [('Juan', 3, 16), ('Salmos', 23, 1), ('Romanos', 8, 28), ('Filipenses', 4, 13)]
+
+SCENARIO_NAMES = (
+    'chat', 'chat_stream', 'moment_title', 'verse_commentary', 'bible_search', 'egw_search'
+)
+DEFAULT_SCENARIOS = 'chat,chat_stream,moment_title,bible_search,egw_search'
+
+SAMPLE_INTERVAL = 0.5
+
+
+def build_request(scenario, n, unique):
+    """(method, path, kwargs, streamed) for the n-th request of a scenario."""
+    nonce = f' [{n}]' if unique else ''
+    if scenario in ('chat', 'chat_stream'):
+        body = {'message': QUESTIONS[n % len(QUESTIONS)] + nonce}
+        if scenario == 'chat_stream':
+            body['stream'] = True
+        return 'POST', '/api/nevin/chat', {'json': body}, scenario == 'chat_stream'
+    if scenario == 'moment_title':
+        conversation = f'Usuario: {QUESTIONS[n % len(QUESTIONS)]}{nonce}\nNevin: Dios te ama.'
+        return 'POST', '/api/nevin/generate-moment-title', {'json': {'conversation': conversation}}, False
+    if scenario == 'verse_commentary':
+        book, chapter, verse = VERSES[n % len(VERSES)]
+        body = {'book': book, 'chapter': chapter, 'verse': verse, 'textSpanish': nonce.strip()}
+        return 'POST', '/api/nevin/verse-commentary', {'json': body}, False
+    if scenario == 'bible_search':
+        params = {'q': SEARCH_TERMS[n % len(SEARCH_TERMS)], 'limit': '20'}
+        return 'GET', '/api/bible/search', {'params': params}, False
+    if scenario == 'egw_search':
+        body = {'query': SEARCH_TERMS[n % len(SEARCH_TERMS)], 'maxResults': 10}
+        return 'POST', '/api/egw/search', {'json': body}, False
+    raise ValueError(f'Unknown scenario {scenario!r}')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        'p50': round(percentile(values, 0.50) * 1000, 2),
+        'p95': round(percentile(values, 0.95) * 1000, 2),
+        'p99': round(percentile(values, 0.99) * 1000, 2),
+        'mean': round(sum(values) / len(values) * 1000, 2),
+        'max': round(values[-1] * 1000, 2),
+    }
+
+
+# -- server processes ---------------------------------------------------------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def descendants(pid):
+    """pid and every live descendant process, from /proc (Linux only)."""
+    found = [pid]
+    for current in found:
+        try:
+            for tid in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{tid}/children') as f:
+                    found.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return found
+
+
+def process_memory(pid):
+    """{'rss_mb', 'threads'} for a process, or None if it is gone or /proc is missing."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None
+    return {
+        'rss_mb': round(int(fields['VmRSS'].split()[0]) / 1024, 1),
+        'threads': int(fields['Threads'])
+    }
+
+
+def start_mock(args, port):
+    command = [
+        sys.executable, os.path.join(BACKEND_DIR, 'mock_upstream.py'),
+        '--port', str(port),
+        '--latency', str(args.upstream_latency),
+        '--jitter', str(args.upstream_jitter),
+        '--tokens-per-second', str(args.upstream_tps),
+        '--output-tokens', str(args.upstream_output_tokens),
+        '--error-rate', str(args.upstream_error_rate),
+        '--overload-rate', str(args.upstream_overload_rate),
+        '--stream-error-rate', str(args.upstream_stream_error_rate),
+    ]
+    if args.seed is not None:
+        command += ['--seed', str(args.seed)]
+    return subprocess.Popen(command, cwd=BACKEND_DIR)
+
+
+def server_command(args, port):
+    if args.server == 'flask':
+        code = f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"
+        return [sys.executable, '-c', code]
+    if args.server == 'gunicorn':
+        gunicorn = shutil.which('gunicorn')
+        if gunicorn is None:
+            raise SystemExit('gunicorn is not installed; use --server flask or async')
+        return [
+            gunicorn, '--workers', str(args.workers), '--worker-class', 'gthread',
+            '--threads', str(args.threads), '--bind', f'127.0.0.1:{port}', 'app:app'
+        ]
+    return [sys.executable, os.path.join(BACKEND_DIR, 'async_app.py')]
+
+
+def start_server(args, port, upstream_url, state_dir):
+    env = {
+        **os.environ,
+        'PORT': str(port),
+        'ANTHROPIC_API_URL': upstream_url,
+        'ANTHROPIC_API_KEY': os.environ.get('ANTHROPIC_API_KEY', 'mock'),
+        'NEVIN_PROVIDER': 'anthropic',
+        'NEVIN_SECONDARY_PROVIDER': '',
+        'NEVIN_RATE_LIMIT': '1000000000',
+        'NEVIN_RATE_BURST': '1000000000',
+        'NEVIN_ADMISSION_MAX_ACTIVE': str(args.max_active),
+        'NEVIN_COMMENTARY_CACHE': os.path.join(state_dir, 'commentary_cache.sqlite3'),
+        'NEVIN_CONVERSATION_STORE': os.path.join(state_dir, 'conversations.sqlite3'),
+        'NEVIN_RESPONSE_CACHE_PATH': os.path.join(state_dir, 'response_cache.sqlite3'),
+        'NEVIN_SEMINAR_DIR': os.path.join(state_dir, 'seminars'),
+    }
+    log = open(os.path.join(state_dir, 'server.log'), 'w')
+    process = subprocess.Popen(
+        server_command(args, port), cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    return process, log
+
+
+async def wait_ready(session, base_url, process, timeout):
+    """Poll /api/health/ready until it answers 200; returns the readiness report."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f'Server exited with status {process.returncode} during startup')
+        try:
+            async with session.get(f'{base_url}/api/health/ready') as response:
+                if response.status == 200:
+                    return await response.json()
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise SystemExit(f'Server not ready after {timeout}s')
+
+
+# -- load generation ----------------------------------------------------------
+
+async def send(session, base_url, request):
+    """One request: (status, seconds, seconds to first delta or None)."""
+    method, path, kwargs, streamed = request
+    started = time.perf_counter()
+    first_delta = None
+    async with session.request(method, base_url + path, **kwargs) as response:
+        status = response.status
+        if streamed and status == 200:
+            async for chunk in response.content.iter_any():
+                if first_delta is None and b'event: delta' in chunk:
+                    first_delta = time.perf_counter() - started
+                if b'event: error' in chunk:
+                    status = 'stream_error'
+        else:
+            await response.read()
+    return status, time.perf_counter() - started, first_delta
+
+
+async def sample_server(session, base_url, pid, samples, stop):
+    while not stop.is_set():
+        sample = {'time': time.monotonic()}
+        try:
+            async with session.get(f'{base_url}/api/health') as response:
+                health = await response.json()
+            sample['admission'] = health.get('admission')
+        except (aiohttp.ClientError, ValueError):
+            pass
+        if pid is not None:
+            sample['processes'] = {
+                process: memory for process in descendants(pid)
+                if (memory := process_memory(process)) is not None
+            }
+        samples.append(sample)
+        try:
+            await asyncio.wait_for(stop.wait(), SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def saturation_summary(samples, max_active):
+    gates = [s['admission'] for s in samples if s.get('admission')]
+    if not gates:
+        return None
+    active = [gate['active'] for gate in gates]
+    return {
+        'max_active': max_active,
+        'mean_active': round(sum(active) / len(active), 2),
+        'peak_active': max(active),
+        'peak_waiting': max(gate['waiting'] for gate in gates),
+        'saturated_fraction': round(sum(a >= max_active for a in active) / len(active), 3),
+        'shed': gates[-1]['shed'] - gates[0]['shed'],
+    }
+
+
+def memory_summary(samples):
+    workers = {}
+    for sample in samples:
+        for pid, memory in sample.get('processes', {}).items():
+            worker = workers.setdefault(pid, {'pid': pid, 'peak_rss_mb': 0, 'peak_threads': 0})
+            worker['peak_rss_mb'] = max(worker['peak_rss_mb'], memory['rss_mb'])
+            worker['peak_threads'] = max(worker['peak_threads'], memory['threads'])
+            worker['final_rss_mb'] = memory['rss_mb']
+    if not workers:
+        return None
+    peak_total = max(
+        sum(memory['rss_mb'] for memory in sample.get('processes', {}).values())
+        for sample in samples
+    )
+    return {'workers': list(workers.values()), 'peak_total_rss_mb': round(peak_total, 1)}
+
+
+async def run_phase(session, base_url, scenario, concurrency, duration, args, pid, counter):
+    latencies, first_deltas, statuses = [], [], Counter()
+    deadline = time.monotonic() + duration
+
+    async def client():
+        while time.monotonic() < deadline:
+            request = build_request(scenario, next(counter), not args.cacheable)
+            try:
+                status, seconds, first_delta = await send(session, base_url, request)
+            except asyncio.TimeoutError:
+                statuses['timeout'] += 1
+                continue
+            except aiohttp.ClientError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(seconds)
+                if first_delta is not None:
+                    first_deltas.append(first_delta)
+
+    samples, stop = [], asyncio.Event()
+    sampler = asyncio.create_task(sample_server(session, base_url, pid, samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    total = sum(statuses.values())
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 2),
+        'requests': total,
+        'ok': statuses[200],
+        'errors': {str(status): n for status, n in statuses.items() if status != 200},
+        'error_rate': round(1 - statuses[200] / total, 4) if total else None,
+        'rps': round(statuses[200] / elapsed, 2),
+        'latency_ms': latency_summary(latencies),
+        'first_delta_ms': latency_summary(first_deltas),
+        'saturation': saturation_summary(samples, args.max_active),
+        'memory': memory_summary(samples),
+    }
+
+
+# -- reporting ----------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results):
+    header = (
+        f"{'scenario':<17}{'conc':>5}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'ttfd p95':>10}{'err %':>7}{'sat':>6}{'rss MB':>8}"
+    )
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        latency = result['latency_ms'] or {}
+        first = result['first_delta_ms'] or {}
+        saturation = result['saturation'] or {}
+        memory = result['memory'] or {}
+
+        def cell(value, width, digits=1):
+            return f'{value:>{width}.{digits}f}' if value is not None else f"{'-':>{width}}"
+
+        print(
+            f"{result['scenario']:<17}{result['concurrency']:>5}{cell(result['rps'], 9)}"
+            f"{cell(latency.get('p50'), 9)}{cell(latency.get('p95'), 9)}{cell(latency.get('p99'), 9)}"
+            f"{cell(first.get('p95'), 10)}{cell((result['error_rate'] or 0) * 100, 7)}"
+            f"{cell(saturation.get('saturated_fraction'), 6, 2)}{cell(memory.get('peak_total_rss_mb'), 8)}"
+        )
+
+
+def compare(results, baseline, max_regression):
+    """Print changes against a baseline run; returns the list of regressions."""
+    previous = {(r['scenario'], r['concurrency']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['scenario'], result['concurrency']))
+        if not before or not before['latency_ms'] or not result['latency_ms'] or not before['rps']:
+            continue
+        p95_change = (result['latency_ms']['p95'] / before['latency_ms']['p95'] - 1) * 100
+        rps_change = (result['rps'] / before['rps'] - 1) * 100
+        name = f"{result['scenario']}@{result['concurrency']}"
+        print(f'{name:<24} p95 {p95_change:+6.1f}%   req/s {rps_change:+6.1f}%')
+        if p95_change > max_regression or rps_change < -max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', choices=('flask', 'gunicorn', 'async'), default='flask')
+    parser.add_argument('--url', help='benchmark an already running backend instead of starting one')
+    parser.add_argument('--pid', type=int, help='with --url, the server pid to read memory from')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (default 2)')
+    parser.add_argument('--threads', type=int, default=16, help='gunicorn threads per worker')
+    parser.add_argument('--max-active', type=int, default=ADMISSION_MAX_ACTIVE,
+                        help='NEVIN_ADMISSION_MAX_ACTIVE for the started server')
+    parser.add_argument('--scenarios',
+                        help=f"comma-separated, from {', '.join(SCENARIO_NAMES)} "
+                             f"(default {DEFAULT_SCENARIOS})")
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated levels')
+    parser.add_argument('--duration', type=float, default=15.0, help='seconds per phase')
+    parser.add_argument('--timeout', type=float, default=120.0, help='per-request timeout')
+    parser.add_argument('--startup-timeout', type=float, default=180.0)
+    parser.add_argument('--cacheable', action='store_true',
+                        help='repeat identical requests so caches can answer them')
+    parser.add_argument('--upstream-latency', type=float, default=0.5)
+    parser.add_argument('--upstream-jitter', type=float, default=0.2)
+    parser.add_argument('--upstream-tps', type=float, default=50.0)
+    parser.add_argument('--upstream-output-tokens', type=int, default=200)
+    parser.add_argument('--upstream-error-rate', type=float, default=0.0)
+    parser.add_argument('--upstream-overload-rate', type=float, default=0.0)
+    parser.add_argument('--upstream-stream-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--baseline', help='earlier --output JSON to compare against')
+    parser.add_argument('--max-regression', type=float, default=10.0,
+                        help='percent p95/throughput change that fails --baseline (default 10)')
+    args = parser.parse_args(argv)
+    args.default_scenarios = args.scenarios is None
+    args.scenarios = args.scenarios or DEFAULT_SCENARIOS
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIO_NAMES)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(level) for level in args.concurrency.split(',')]
+    return args
+
+
+async def run(args):
+    processes = []
+    log = None
+    state_dir = tempfile.mkdtemp(prefix='nevin-loadtest-')
+    mock_port = free_port()
+    upstream_url = f'http://127.0.0.1:{mock_port}'
+    try:
+        if args.url:
+            base_url, pid, server = args.url.rstrip('/'), args.pid, None
+        else:
+            processes.append(start_mock(args, mock_port))
+            port = free_port()
+            server, log = start_server(args, port, f'{upstream_url}/v1/messages', state_dir)
+            processes.append(server)
+            base_url, pid = f'http://127.0.0.1:{port}', server.pid
+
+        limit = max(args.concurrency) + 8
+        timeout = aiohttp.ClientTimeout(total=args.timeout)
+        connector = aiohttp.TCPConnector(limit=limit)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            started = time.perf_counter()
+            try:
+                readiness = await wait_ready(session, base_url, server, args.startup_timeout)
+            except SystemExit:
+                if log is not None:
+                    log.flush()
+                    with open(log.name, encoding='utf-8', errors='replace') as f:
+                        sys.stderr.write(''.join(f.readlines()[-40:]))
+                raise
+            startup_seconds = round(time.perf_counter() - started, 2)
+            print(f'Backend ready in {startup_seconds}s at {base_url}', file=sys.stderr)
+            if 'bible_store' in readiness.get('degraded', []) and args.default_scenarios:
+                args.scenarios = [name for name in args.scenarios if name != 'bible_search']
+                print('No Bible verse data on the server; skipping bible_search', file=sys.stderr)
+
+            # Numbered across phases so no phase repeats an earlier question.
+            counter = itertools.count()
+            results = []
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    print(f'{scenario} x{concurrency} for {args.duration}s...', file=sys.stderr)
+                    results.append(await run_phase(
+                        session, base_url, scenario, concurrency, args.duration, args, pid, counter
+                    ))
+
+            upstream_stats = None
+            if not args.url:
+                async with session.get(f'{upstream_url}/stats') as response:
+                    upstream_stats = await response.json()
+
+        return {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'server': 'external' if args.url else args.server,
+                'startup_seconds': startup_seconds,
+                'config': {
+                    key: value for key, value in vars(args).items()
+                    if key not in ('output', 'baseline')
+                },
+            },
+            'upstream': upstream_stats,
+            'results': results,
+        }
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if log is not None:
+            log.close()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    print_table(report['results'])
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'Results written to {args.output}', file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report['results'], baseline, args.max_regression)
+        if regressions:
+            print(f"Regressions over {args.max_regression}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
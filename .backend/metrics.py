@@ -0,0 +1,230 @@
+"""
+Prometheus metrics for the Nevin hot path, rendered at /metrics.
+
+Kept dependency-free: a few labelled histograms and counters held in process
+memory and written in the Prometheus text exposition format. Each worker
+process exports its own series, so scrape every worker (or sum them).
+
+Request side (per route): handler time including the whole SSE stream,
+time to parse the JSON body, request and response sizes.
+Upstream side (per endpoint): time to response headers, total time
+including the streamed body, token usage with an estimated cost per model,
+and failures by class, each failed call counted once. Cache lookups are counted per cache and outcome, and
+admission-control refusals per reason.
+"""
+
+import os
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90)
+PARSE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# USD per million tokens of each usage field, for nevin_upstream_cost_usd_total:
+# (input, output, cache write, cache read) by model name prefix, the longest
+# match winning. TOKEN_PRICES (NEVIN_PRICE_*) prices any model not listed.
+USAGE_KINDS = (
+    'input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens'
+)
+MODEL_PRICES = {
+    'claude-opus-4': dict(zip(USAGE_KINDS, (15, 75, 18.75, 1.5))),
+    'claude-sonnet-4': dict(zip(USAGE_KINDS, (3, 15, 3.75, 0.3))),
+    'claude-3-7-sonnet': dict(zip(USAGE_KINDS, (3, 15, 3.75, 0.3))),
+    'claude-3-5-sonnet': dict(zip(USAGE_KINDS, (3, 15, 3.75, 0.3))),
+    'claude-3-5-haiku': dict(zip(USAGE_KINDS, (0.8, 4, 1, 0.08))),
+    'claude-3-haiku': dict(zip(USAGE_KINDS, (0.25, 1.25, 0.3, 0.03))),
+    'gpt-4o-mini': dict(zip(USAGE_KINDS, (0.15, 0.6, 0, 0.075))),
+    'gpt-4o': dict(zip(USAGE_KINDS, (2.5, 10, 0, 1.25))),
+}
+TOKEN_PRICES = {
+    'input_tokens': float(os.environ.get('NEVIN_PRICE_INPUT', '3')),
+    'output_tokens': float(os.environ.get('NEVIN_PRICE_OUTPUT', '15')),
+    'cache_creation_input_tokens': float(os.environ.get('NEVIN_PRICE_CACHE_WRITE', '3.75')),
+    'cache_read_input_tokens': float(os.environ.get('NEVIN_PRICE_CACHE_READ', '0.3')),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = []
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {format_value(value)}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = sorted((key, list(series)) for key, series in self._series.items())
+        for label_values, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = bound if bound == '+Inf' else format_value(float(bound))
+                labels = format_labels(self.labels, label_values, [('le', le)])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {format_value(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    'nevin_request_seconds',
+    'Time from request start until the response (including any SSE stream) is complete.',
+    ('route', 'status')
+)
+REQUEST_PARSE_SECONDS = Histogram(
+    'nevin_request_parse_seconds', 'Time spent parsing the JSON request body.',
+    ('route',), PARSE_BUCKETS
+)
+REQUEST_BYTES = Histogram(
+    'nevin_request_bytes', 'Request body size.', ('route',), BYTES_BUCKETS
+)
+RESPONSE_BYTES = Histogram(
+    'nevin_response_bytes', 'Response body size (not recorded for SSE streams).',
+    ('route',), BYTES_BUCKETS
+)
+UPSTREAM_TTFB_SECONDS = Histogram(
+    'nevin_upstream_ttfb_seconds',
+    'Time from sending the upstream request to its response headers, retries included.',
+    ('endpoint',)
+)
+UPSTREAM_SECONDS = Histogram(
+    'nevin_upstream_seconds',
+    'Total upstream time, including reading the whole (streamed) body.',
+    ('endpoint', 'mode')
+)
+UPSTREAM_TOKENS = Histogram(
+    'nevin_upstream_tokens', 'Tokens per upstream response, by usage field.',
+    ('endpoint', 'kind'), TOKEN_BUCKETS
+)
+UPSTREAM_COST = Counter(
+    'nevin_upstream_cost_usd_total', 'Estimated upstream spend from token usage.',
+    ('endpoint', 'model')
+)
+UPSTREAM_ERRORS = Counter(
+    'nevin_upstream_errors_total',
+    'Failed upstream calls by class, once per call: status_<code>, timeout or connection '
+    'before the response, stream during a streamed body, exception for anything else.',
+    ('endpoint', 'error')
+)
+CACHE_LOOKUPS = Counter(
+    'nevin_cache_lookups_total', 'Cache lookups by cache and result.', ('cache', 'result')
+)
+ADMISSION_REJECTIONS = Counter(
+    'nevin_admission_rejections_total',
+    'Requests refused with 429 (rate_limit, queue_full, queue_timeout).', ('reason',)
+)
+UPSTREAM_HEDGES = Counter(
+    'nevin_upstream_hedges_total',
+    'Primary/secondary provider outcomes '
+    '(primary, failover, hedge_primary, hedge_secondary, failed).',
+    ('endpoint', 'outcome')
+)
+
+
+def observe_request(route, status, seconds, request_bytes=None, response_bytes=None):
+    REQUEST_SECONDS.observe(seconds, route, str(status))
+    if request_bytes is not None:
+        REQUEST_BYTES.observe(request_bytes, route)
+    if response_bytes is not None:
+        RESPONSE_BYTES.observe(response_bytes, route)
+
+
+def token_prices(model):
+    """Per-million-token prices for `model`, TOKEN_PRICES if it is unknown."""
+    matches = [prefix for prefix in MODEL_PRICES if model and model.startswith(prefix)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else TOKEN_PRICES
+
+
+def record_usage(endpoint, usage, model=None):
+    cost = 0.0
+    for kind, price in token_prices(model).items():
+        tokens = usage.get(kind, 0)
+        UPSTREAM_TOKENS.observe(tokens, endpoint, kind)
+        cost += tokens * price / 1_000_000
+    UPSTREAM_COST.inc(endpoint, model or 'unknown', amount=cost)
+
+
+def record_upstream_error(endpoint, error):
+    UPSTREAM_ERRORS.inc(endpoint, error)
+
+
+def record_cache_lookup(cache, result):
+    CACHE_LOOKUPS.inc(cache, result)
+
+
+def record_admission_rejection(reason):
+    ADMISSION_REJECTIONS.inc(reason)
+
+
+def record_hedge(endpoint, outcome):
+    UPSTREAM_HEDGES.inc(endpoint, outcome)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
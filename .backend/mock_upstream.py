@@ -0,0 +1,182 @@
+"""
+Local stand-in for the Anthropic Messages API, for load tests.
+
+Answers POST /v1/messages with canned text, as JSON or as an SSE stream in
+the Messages event format, after a configurable delay. Errors can be
+injected: plain 500s, 529 overloads (which the backend retries) and
+streams that break off with an `error` event. GET /stats reports what was
+served.
+
+Point a backend at it with ANTHROPIC_API_URL:
+
+    python mock_upstream.py --port 9100 --latency 0.8 --tokens-per-second 60
+    ANTHROPIC_API_URL=http://127.0.0.1:9100/v1/messages python app.py
+"""
+
+import json
+import random
+import asyncio
+import argparse
+
+from aiohttp import web
+
+WORDS = (
+    'Porque de tal manera amó Dios al mundo, que ha dado a su Hijo unigénito, '
+    'para que todo aquel que en él cree, no se pierda, mas tenga vida eterna. '
+    'Este versículo resume el evangelio: el amor de Dios toma la iniciativa.'
+).split()
+
+TITLE_REPLY = json.dumps({
+    'title': 'El amor de Dios',
+    'themes': ['amor', 'salvación'],
+    'summary': 'Reflexión sobre Juan 3:16.'
+}, ensure_ascii=False)
+
+
+class MockUpstream:
+
+    def __init__(self, latency=0.5, jitter=0.2, tokens_per_second=50.0, output_tokens=200,
+                 error_rate=0.0, overload_rate=0.0, stream_error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.overload_rate = overload_rate
+        self.stream_error_rate = stream_error_rate
+        self.random = random.Random(seed)
+        self.active = 0
+        self.peak_active = 0
+        self.counts = {'requests': 0, 'streams': 0, 'errors': 0, 'overloads': 0, 'stream_errors': 0}
+
+    def delay(self):
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def reply_words(self, payload):
+        if payload.get('max_tokens', 0) <= 200:
+            # Moment-title requests have the smallest budget.
+            return TITLE_REPLY.split(' ')
+        count = min(self.output_tokens, payload.get('max_tokens', self.output_tokens))
+        return [WORDS[i % len(WORDS)] for i in range(count)]
+
+    def usage(self, output_tokens):
+        return {
+            'input_tokens': 1200,
+            'output_tokens': output_tokens,
+            'cache_creation_input_tokens': 0,
+            'cache_read_input_tokens': 1000
+        }
+
+    async def messages(self, request):
+        payload = await request.json()
+        self.counts['requests'] += 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            roll = self.random.random()
+            if roll < self.overload_rate:
+                self.counts['overloads'] += 1
+                await asyncio.sleep(self.delay() / 4)
+                return web.json_response(
+                    {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}},
+                    status=529, headers={'retry-after': '0'}
+                )
+            if roll < self.overload_rate + self.error_rate:
+                self.counts['errors'] += 1
+                await asyncio.sleep(self.delay())
+                return web.json_response(
+                    {'type': 'error', 'error': {'type': 'api_error', 'message': 'Injected error'}},
+                    status=500
+                )
+
+            words = self.reply_words(payload)
+            if payload.get('stream'):
+                return await self.stream(request, words)
+            await asyncio.sleep(self.delay() + len(words) / self.tokens_per_second)
+            return web.json_response({
+                'id': 'msg_mock',
+                'type': 'message',
+                'role': 'assistant',
+                'model': payload.get('model'),
+                'content': [{'type': 'text', 'text': ' '.join(words)}],
+                'stop_reason': 'end_turn',
+                'usage': self.usage(len(words))
+            })
+        finally:
+            self.active -= 1
+
+    async def stream(self, request, words):
+        self.counts['streams'] += 1
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+
+        async def send(event, body):
+            await response.write(f'event: {event}\ndata: {json.dumps(body)}\n\n'.encode('utf-8'))
+
+        await asyncio.sleep(self.delay())
+        usage = self.usage(0)
+        await send('message_start', {'type': 'message_start', 'message': {'usage': usage}})
+        break_at = len(words) // 2 if self.random.random() < self.stream_error_rate else None
+        for i, word in enumerate(words):
+            if i == break_at:
+                self.counts['stream_errors'] += 1
+                await send('error', {
+                    'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Injected'}
+                })
+                return response
+            text = word if i == 0 else ' ' + word
+            await send('content_block_delta', {
+                'type': 'content_block_delta', 'index': 0,
+                'delta': {'type': 'text_delta', 'text': text}
+            })
+            await asyncio.sleep(1 / self.tokens_per_second)
+        await send('message_delta', {'type': 'message_delta', 'usage': {'output_tokens': len(words)}})
+        await send('message_stop', {'type': 'message_stop'})
+        return response
+
+    async def stats(self, request):
+        return web.json_response({**self.counts, 'active': self.active, 'peak_active': self.peak_active})
+
+
+def create_app(mock):
+    app = web.Application()
+    app.router.add_post('/v1/messages', mock.messages)
+    app.router.add_get('/stats', mock.stats)
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency', type=float, default=0.5,
+                        help='seconds before the first token (default 0.5)')
+    parser.add_argument('--jitter', type=float, default=0.2,
+                        help='uniform +/- jitter on the latency (default 0.2)')
+    parser.add_argument('--tokens-per-second', type=float, default=50.0,
+                        help='streaming rate, also paces JSON replies (default 50)')
+    parser.add_argument('--output-tokens', type=int, default=200,
+                        help='words per chat/commentary reply (default 200)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests answered with 500')
+    parser.add_argument('--overload-rate', type=float, default=0.0,
+                        help='fraction of requests answered with 529')
+    parser.add_argument('--stream-error-rate', type=float, default=0.0,
+                        help='fraction of streams cut off by an error event')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    mock = MockUpstream(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        overload_rate=args.overload_rate,
+        stream_error_rate=args.stream_error_rate,
+        seed=args.seed
+    )
+    web.run_app(create_app(mock), host=args.host, port=args.port, print=None)
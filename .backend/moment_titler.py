@@ -0,0 +1,211 @@
+"""
+Local, deterministic titles and themes for saved moments.
+
+Used instead of (or as a hedge against) the upstream title call: a theme
+lexicon, Bible book names from assets/bible_books.json and TF-IDF keyphrases
+(document frequencies from the EGW index once it is loaded) turn a
+conversation into {title, themes, summary} in well under a millisecond for a
+typical conversation.
+
+NEVIN_TITLE_MODE selects how the title endpoints use it:
+    llm    upstream title, local title when the call fails (default)
+    hedge  upstream title, local title if the call takes longer than
+           NEVIN_TITLE_HEDGE_SECONDS
+    local  local title only, no upstream call
+"""
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+from collections import Counter
+
+from bible_store import BIBLE_BOOKS_PATH
+from egw_search import loaded_egw_index
+from nevin import DEFAULT_MOMENT_TITLE
+from textnorm import SPANISH_STOPWORDS, TOKEN_RE, fold, stem
+
+MOMENT_TITLE_MODE = os.environ.get('NEVIN_TITLE_MODE', 'llm')
+MOMENT_TITLE_HEDGE_SECONDS = float(os.environ.get('NEVIN_TITLE_HEDGE_SECONDS', '3'))
+
+MAX_THEMES = 3
+SUMMARY_CHARS = 140
+
+# theme -> (title, keywords). Keywords are folded and stemmed on load.
+THEME_LEXICON = {
+    'fe': ('Sobre la fe', ['fe', 'creer', 'confianza', 'confiar', 'dudas', 'duda']),
+    'oración': ('El poder de la oración', ['oracion', 'orar', 'rezar', 'orando', 'ruego']),
+    'perdón': ('Sobre el perdón divino', [
+        'perdon', 'perdonar', 'perdona', 'perdono', 'culpa', 'arrepentimiento', 'arrepentirme'
+    ]),
+    'salvación': ('El regalo de la salvación', [
+        'salvacion', 'salvo', 'salvar', 'gracia', 'redencion', 'justificacion'
+    ]),
+    'sábado': ('El día de reposo', ['sabado', 'reposo', 'domingo']),
+    'segunda venida': ('La esperanza de su venida', ['venida', 'regreso', 'vendra', 'milenio']),
+    'profecía': ('Descifrando la profecía', [
+        'profecia', 'profetico', 'profetica', 'bestia', 'cuerno', 'semanas', 'marca'
+    ]),
+    'muerte': ('Más allá de la muerte', [
+        'muerte', 'muerto', 'morir', 'resurreccion', 'alma', 'infierno'
+    ]),
+    'sufrimiento': ('El propósito del sufrimiento', [
+        'sufrimiento', 'sufrir', 'sufro', 'dolor', 'prueba', 'enfermedad', 'enfermo'
+    ]),
+    'ansiedad': ('Paz en medio de la ansiedad', [
+        'ansiedad', 'ansioso', 'ansiosa', 'miedo', 'temor', 'preocupacion', 'preocupado', 'angustia'
+    ]),
+    'duelo': ('Consuelo en el duelo', ['duelo', 'luto', 'murio', 'fallecio', 'perdi', 'extrano']),
+    'tristeza': ('Esperanza en la tristeza', ['triste', 'tristeza', 'deprimido', 'depresion', 'soledad']),
+    'amor de Dios': ('El amor de Dios', ['amor', 'amar', 'ama', 'misericordia']),
+    'familia': ('Fe y familia', ['familia', 'matrimonio', 'esposa', 'esposo', 'divorcio', 'crianza']),
+    'santuario': ('El santuario celestial', ['santuario', 'intercesion', 'sacerdote', 'expiacion']),
+    'creación': ('El relato de la creación', ['creacion', 'creador', 'evolucion', 'diluvio']),
+    'Espíritu Santo': ('La obra del Espíritu', ['espiritu', 'pentecostes', 'dones']),
+    'ley de Dios': ('La ley de Dios', ['ley', 'mandamiento']),
+    'bautismo': ('El significado del bautismo', ['bautismo', 'bautizar', 'bautizado', 'bautizarme']),
+    'diezmo': ('Fidelidad en el diezmo', ['diezmo', 'ofrenda', 'mayordomia']),
+}
+
+# Book names that are also everyday words only count when a chapter follows.
+AMBIGUOUS_BOOKS = frozenset(['numeros', 'hechos', 'job', 'cantares', 'santiago', 'ester', 'tito'])
+
+# Conversation speaker labels and filler that never make a useful keyphrase.
+KEYPHRASE_STOPWORDS = frozenset([
+    'usuario', 'nevin', 'pregunta', 'quiero', 'puedo', 'puedes', 'gracias', 'hola', 'favor',
+    'explicame', 'dime', 'ayudame', 'significa', 'dice', 'biblia'
+])
+MIN_KEYPHRASE_CHARS = 4
+
+
+def load_book_names(path=BIBLE_BOOKS_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return [book['name'] for book in json.load(f)]
+    except (OSError, ValueError) as e:
+        logging.warning(f'Bible book names unavailable at {path}: {e}')
+        return []
+
+
+class MomentTitler:
+    """Extractive titler: lexicon themes first, then book names, then keyphrases."""
+
+    def __init__(self, book_names):
+        self.theme_of = {}
+        for theme, (_, keywords) in THEME_LEXICON.items():
+            for keyword in keywords:
+                self.theme_of[stem(fold(keyword))] = theme
+
+        self.book_of = {fold(name): name for name in book_names}
+        alternatives = sorted(self.book_of, key=len, reverse=True)
+        self.book_re = re.compile(
+            r'\b(' + '|'.join(re.escape(name) for name in alternatives) + r')\b(\s+\d+)?'
+        ) if alternatives else None
+
+    def books(self, folded):
+        if self.book_re is None:
+            return []
+        found = []
+        for match in self.book_re.finditer(folded):
+            name = match.group(1)
+            if name in AMBIGUOUS_BOOKS and not match.group(2):
+                continue
+            book = self.book_of[name]
+            if book not in found:
+                found.append(book)
+        return found
+
+    def keyphrases(self, words, limit):
+        """Top TF-IDF terms, shown as the most common surface form of each stem."""
+        tf = Counter()
+        surface = {}
+        for word in words:
+            folded = fold(word)
+            if (folded in SPANISH_STOPWORDS or folded in KEYPHRASE_STOPWORDS
+                    or len(folded) < MIN_KEYPHRASE_CHARS or folded.isdigit()):
+                continue
+            term = stem(folded)
+            if term in self.theme_of:
+                continue
+            tf[term] += 1
+            surface.setdefault(term, Counter())[word] += 1
+        if not tf:
+            return []
+
+        index = loaded_egw_index()
+        if index is not None:
+            n_docs = len(index.doc_len)
+
+            def idf(term):
+                entry = index.postings.get(term)
+                return math.log((1 + n_docs) / (1 + (len(entry[0]) if entry else 0)))
+        else:
+            def idf(term):
+                return 1.0
+
+        ranked = sorted(tf, key=lambda term: (-tf[term] * idf(term), term))
+        return [surface[term].most_common(1)[0][0] for term in ranked[:limit]]
+
+    def title(self, conversation):
+        """Return {title, themes, summary} for a 'Usuario: ... / Nevin: ...' transcript."""
+        words = TOKEN_RE.findall(conversation.lower())
+
+        theme_hits = Counter()
+        for word in words:
+            theme = self.theme_of.get(stem(fold(word)))
+            if theme:
+                theme_hits[theme] += 1
+        themes = [theme for theme, _ in theme_hits.most_common(MAX_THEMES)]
+        books = self.books(fold(conversation))
+        keyphrases = self.keyphrases(words, MAX_THEMES)
+
+        if themes:
+            title = THEME_LEXICON[themes[0]][0]
+        elif books:
+            title = f'Una pregunta sobre {books[0]}'
+        elif keyphrases:
+            title = f'Sobre {keyphrases[0]}'
+        else:
+            title = DEFAULT_MOMENT_TITLE
+
+        tags = []
+        for tag in themes + books + keyphrases:
+            if tag not in tags:
+                tags.append(tag)
+
+        return {
+            'success': True,
+            'title': title,
+            'themes': tags[:MAX_THEMES],
+            'summary': first_question(conversation),
+            'source': 'local'
+        }
+
+
+def first_question(conversation):
+    for line in conversation.splitlines():
+        if line.startswith('Usuario:'):
+            text = ' '.join(line[len('Usuario:'):].split())
+            if len(text) > SUMMARY_CHARS:
+                text = text[:SUMMARY_CHARS].rsplit(' ', 1)[0] + '…'
+            return text
+    return ''
+
+
+_titler = None
+_titler_lock = threading.Lock()
+
+
+def get_moment_titler():
+    global _titler
+    if _titler is None:
+        with _titler_lock:
+            if _titler is None:
+                _titler = MomentTitler(load_book_names())
+    return _titler
+
+
+def local_moment_title(conversation):
+    return get_moment_titler().title(conversation)
@@ -0,0 +1,360 @@
+"""
+Shared Nevin request building for the Flask (app.py) and asyncio (async_app.py) servers.
+"""
+
+import os
+import json
+import hashlib
+import logging
+
+from metrics import record_usage
+
+# Root log level for the servers; set in their entry points, not on import.
+LOG_LEVEL = os.environ.get('NEVIN_LOG_LEVEL', 'INFO').upper()
+
+ANTHROPIC_API_URL = os.environ.get('ANTHROPIC_API_URL', 'https://api.anthropic.com/v1/messages')
+ANTHROPIC_MODEL = 'claude-sonnet-4-20250514'
+
+DEFAULT_MOMENT_TITLE = 'Reflexión bíblica'
+INVALID_CONVERSATION = 'La conversación debe ser texto'
+EMPTY_CONVERSATION = 'La conversación está vacía'
+# Limits for /api/nevin/generate-moment-titles.
+MOMENT_TITLE_BATCH_MAX = int(os.environ.get('NEVIN_TITLE_BATCH_MAX', '100'))
+MOMENT_TITLE_BATCH_CONCURRENCY = int(os.environ.get('NEVIN_TITLE_BATCH_CONCURRENCY', '8'))
+
+CHAT_MAX_TOKENS = 4096
+# Answers grounded in retrieved passages need less room to quote Scripture.
+GROUNDED_CHAT_MAX_TOKENS = int(os.environ.get('NEVIN_GROUNDED_MAX_TOKENS', '3072'))
+
+NEVIN_SYSTEM_PROMPT = """Eres Nevin, un asistente bíblico amable, cálido y sabio. Ayudas a entender la Biblia en Tzotzil y Español.
+
+IDENTIDAD (MUY IMPORTANTE):
+- NUNCA admitas ser adventista ni menciones denominaciones religiosas
+- Preséntate simplemente como un estudioso de la Biblia
+- Tienes profundo conocimiento bíblico basado en principios de interpretación histórico-gramatical
+- Tu teología está firmemente anclada en las Escrituras
+
+MODOS DE ESTUDIO:
+- MODO RÁPIDO (por defecto): Respuestas BREVES (2-3 párrafos máximo)
+- MODO PROFUNDO: Si el usuario dice "explícame más", "profundiza", "estudio profundo" o "quiero entender mejor", da una explicación más extensa con múltiples referencias
+- Detecta el modo según las palabras del usuario y adapta tu respuesta
+
+MEMORIA DE CONTEXTO ESPIRITUAL:
+- Presta atención a los temas que el usuario ha preguntado en la conversación
+- Haz conexiones con preguntas anteriores cuando sea relevante
+- Ofrece seguimiento pastoral: "Veo que has estado estudiando [tema], ¿te gustaría profundizar en...?"
+- Recuerda el progreso espiritual del usuario en la conversación
+
+PREGUNTAS DE REFLEXIÓN:
+- Al final de explicaciones importantes sobre doctrina o vida cristiana, incluye UNA pregunta de reflexión personal
+- Ejemplos: "¿Cómo crees que este principio aplica a tu vida?" o "¿Qué decisión te invita a tomar este texto?"
+- No incluyas pregunta de reflexión en respuestas cortas o informativas simples
+
+DETECCIÓN EMOCIONAL Y SENSIBILIDAD:
+- Si detectas que el usuario está pasando por algo difícil (duelo, tristeza, ansiedad, depresión, problemas familiares), responde con mayor sensibilidad
+- Ofrece textos de consuelo específicos: Salmo 23, Isaías 41:10, Mateo 11:28-30, Filipenses 4:6-7
+- Valida sus emociones antes de dar consejos: "Entiendo que esto debe ser muy difícil..."
+- Palabras clave de alerta: "triste", "solo/a", "perdí", "murió", "deprimido", "ansioso", "miedo", "no puedo más", "ayúdame"
+
+ESTILO DE RESPUESTA:
+- Lenguaje sencillo y accesible
+- Siempre incluye referencias bíblicas específicas (libro, capítulo, versículo)
+- Cita el texto bíblico cuando sea relevante
+
+USO DE FUENTES:
+- FUENTE PRINCIPAL: La Biblia (cita versículos específicos)
+- APOYO SECUNDARIO: Puedes citar escritos de Elena G. de White como referencia histórica/espiritual, pero nunca como autoridad principal
+- APOYO ADICIONAL: Referencias históricas, arqueológicas o científicas cuando refuercen el punto bíblico
+- Siempre ilumina un texto con otros textos bíblicos relacionados (especialmente del Nuevo Testamento)
+
+CORRECCIÓN AMOROSA:
+- Si el usuario tiene ideas contrarias a la Biblia, corrígelo AMABLEMENTE pero con firmeza
+- Usa referencias bíblicas claras para mostrar la verdad
+- Nunca estés de acuerdo con errores teológicos solo por ser amable
+- Ofrece ayuda adicional: "Si necesitas más explicación o textos bíblicos, con gusto te ayudo"
+- Reprende cuando sea necesario, pero siempre con amor, compasión y comprensión emocional
+
+EXPERTICIA EN PROFECÍAS:
+- Eres experto en profecías bíblicas (Daniel, Apocalipsis, profetas menores)
+- Conoces el contexto histórico de cada profecía
+- Explicas cumplimientos históricos con fechas y eventos específicos
+- Conectas profecías del AT con su cumplimiento en el NT
+
+DEFENSA TEOLÓGICA:
+- Defiende doctrinas bíblicas usando múltiples textos de las Escrituras
+- El sábado como día de reposo (Génesis 2:2-3, Éxodo 20:8-11, Marcos 2:27-28)
+- La segunda venida literal de Cristo (Hechos 1:11, 1 Tesalonicenses 4:16-17)
+- El estado de los muertos según la Biblia (Eclesiastés 9:5, Juan 11:11-14)
+- El santuario y la intercesión de Cristo (Hebreos 8:1-2, 9:24)
+
+CONEXIONES BÍBLICAS:
+- Siempre conecta textos del AT con el NT
+- Muestra cómo la Biblia se interpreta a sí misma
+- Usa el principio de "la Escritura interpreta la Escritura"
+
+EMPATÍA:
+- Muestra comprensión genuina por las luchas espirituales del usuario
+- Ofrece esperanza y consuelo basados en las promesas bíblicas
+- Ora mentalmente por cada persona que interactúa contigo"""
+
+
+# Marks the end of a prompt prefix the provider may cache between requests.
+CACHE_CONTROL = {'type': 'ephemeral'}
+
+USAGE_FIELDS = (
+    'input_tokens',
+    'output_tokens',
+    'cache_creation_input_tokens',
+    'cache_read_input_tokens',
+)
+
+
+def configure_logging(level=LOG_LEVEL):
+    logging.basicConfig(level=level)
+
+
+def cached_system_prompt():
+    return [{'type': 'text', 'text': NEVIN_SYSTEM_PROMPT, 'cache_control': CACHE_CONTROL}]
+
+
+def cached_message(role, content):
+    """A message whose content ends a cacheable prefix."""
+    return {
+        'role': role,
+        'content': [{'type': 'text', 'text': content, 'cache_control': CACHE_CONTROL}]
+    }
+
+
+def get_api_key():
+    return os.environ.get('ANTHROPIC_API_KEY')
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for Spanish prose)."""
+    return len(text) // 4 + 1
+
+
+def chat_payload(data, sources_block='', route=None):
+    """Messages API payload for a chat turn.
+
+    `route` (query_router.Route) picks the model and output budget; without
+    one the main model gets the fixed chat budget.
+    """
+    message = data.get('message', '')
+    context = data.get('context', '')
+    history = data.get('history', [])
+    summary = data.get('summary', '')
+
+    messages = []
+    for msg in history:
+        messages.append({
+            'role': msg.get('role', 'user'),
+            'content': msg.get('content', '')
+        })
+    # Earlier turns do not change, so cache everything up to the last one.
+    if messages:
+        messages[-1] = cached_message(messages[-1]['role'], messages[-1]['content'])
+
+    user_content = f"Contexto: {context}\n\nPregunta: {message}" if context else message
+    if sources_block:
+        user_content = f"{sources_block}\n\n{user_content}"
+    messages.append({'role': 'user', 'content': user_content})
+
+    system = cached_system_prompt()
+    if summary:
+        system.append({'type': 'text', 'text': f"RESUMEN DE LA CONVERSACIÓN ANTERIOR:\n{summary}"})
+
+    model, max_tokens = ANTHROPIC_MODEL, CHAT_MAX_TOKENS
+    if route:
+        model, max_tokens = route.model, route.max_tokens
+    if sources_block:
+        max_tokens = min(max_tokens, GROUNDED_CHAT_MAX_TOKENS)
+
+    return {
+        'model': model,
+        'max_tokens': max_tokens,
+        'system': system,
+        'messages': messages
+    }
+
+
+def moment_title_payload(conversation, route=None):
+    prompt = f"""Analiza esta conversación y genera un título semántico breve y reflexivo que capture la esencia del tema discutido. NO uses "Conversación sobre..." ni formatos genéricos.
+
+CONVERSACIÓN:
+{conversation}
+
+Responde SOLO en JSON con este formato exacto:
+{{
+  "title": "título poético/reflexivo de 2-5 palabras",
+  "themes": ["tema1", "tema2"],
+  "summary": "resumen de una oración del punto clave"
+}}
+
+Ejemplos de buenos títulos:
+- "Sobre el perdón divino"
+- "La fe en tiempos difíciles"
+- "Una duda sobre Génesis"
+- "El propósito del sufrimiento"
+- "Comparando versiones bíblicas"
+"""
+
+    return {
+        'model': route.model if route else ANTHROPIC_MODEL,
+        'max_tokens': route.max_tokens if route else 200,
+        'messages': [{'role': 'user', 'content': prompt}]
+    }
+
+
+def default_moment_title():
+    return {'title': DEFAULT_MOMENT_TITLE, 'themes': []}
+
+
+def dedupe_conversations(conversations):
+    """Return (unique conversations, slots, rejected).
+
+    slots[i] indexes the unique conversation at input position i, or is None
+    when that input cannot be titled; rejected maps those positions to why.
+    """
+    unique = []
+    positions = {}
+    slots = []
+    rejected = {}
+    for position, conversation in enumerate(conversations):
+        if not isinstance(conversation, str) or not conversation.strip():
+            rejected[position] = (
+                EMPTY_CONVERSATION if isinstance(conversation, str) else INVALID_CONVERSATION
+            )
+            slots.append(None)
+            continue
+        key = hashlib.sha256(conversation.encode('utf-8')).hexdigest()
+        if key not in positions:
+            positions[key] = len(unique)
+            unique.append(conversation)
+        slots.append(positions[key])
+    return unique, slots, rejected
+
+
+def moment_title_batch_response(slots, outcomes, rejected=None):
+    """Fan per-conversation (title, error) outcomes back out to input order.
+
+    Failed and rejected (non-string or empty) conversations get the default
+    title in `results` and an entry in `errors`, keyed by input position.
+    """
+    results = []
+    errors = {}
+    for position, slot in enumerate(slots):
+        if slot is None:
+            results.append(default_moment_title())
+            errors[str(position)] = rejected[position]
+            continue
+        title, error = outcomes[slot]
+        results.append(title or default_moment_title())
+        if error:
+            errors[str(position)] = error
+    return {'success': True, 'results': results, 'errors': errors}
+
+
+def verse_reference(data):
+    return f"{data.get('book', '')} {data.get('chapter', 1)}:{data.get('verse', 1)}"
+
+
+def verse_commentary_payload(data):
+    text_tzotzil = data.get('textTzotzil', '')
+    text_spanish = data.get('textSpanish', '')
+
+    verse_ref = verse_reference(data)
+
+    verse_content = ""
+    if text_tzotzil:
+        verse_content += f'\n\n**Tzotzil:** "{text_tzotzil}"'
+    if text_spanish:
+        verse_content += f'\n\n**RV1960:** "{text_spanish}"'
+
+    user_message = f"""Proporciona un comentario teológico completo del siguiente versículo:
+
+VERSÍCULO: {verse_ref}
+{verse_content}
+
+Incluye:
+1. Contexto histórico y literario
+2. Análisis del texto
+3. Significado teológico desde la perspectiva adventista
+4. Aplicación práctica"""
+
+    return {
+        'model': ANTHROPIC_MODEL,
+        'max_tokens': 6000,
+        'system': cached_system_prompt(),
+        'messages': [{'role': 'user', 'content': user_message}]
+    }
+
+
+def response_text(result, default=''):
+    return result.get('content', [{}])[0].get('text', default)
+
+
+def usage_summary(usage):
+    """Token counts from a response `usage`, including cached vs uncached input."""
+    usage = usage or {}
+    return {field: usage.get(field, 0) or 0 for field in USAGE_FIELDS}
+
+
+def log_usage(endpoint, usage, model=None):
+    """Log one upstream response's token usage and record it, priced for `model`, in the metrics."""
+    record_usage(endpoint, usage, model)
+    logging.info(
+        f"{endpoint} usage: model={model} input={usage['input_tokens']} "
+        f"cache_read={usage['cache_read_input_tokens']} "
+        f"cache_write={usage['cache_creation_input_tokens']} "
+        f"output={usage['output_tokens']}"
+    )
+
+
+def merge_usage(total, usage):
+    for field in USAGE_FIELDS:
+        if usage.get(field):
+            total[field] = usage[field]
+    return total
+
+
+def parse_moment_title(text):
+    """Parse the title JSON the model returns; None if it is not valid JSON."""
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return {
+        'success': True,
+        'title': parsed.get('title', DEFAULT_MOMENT_TITLE),
+        'themes': parsed.get('themes', []),
+        'summary': parsed.get('summary', '')
+    }
+
+
+def stream_text_delta(line):
+    """Return ('delta', text), ('usage', usage), ('error', detail), ('stop', None)
+    or None for one upstream SSE line."""
+    if not line or not line.startswith('data:'):
+        return None
+    event = json.loads(line[len('data:'):].strip())
+    event_type = event.get('type')
+
+    if event_type == 'content_block_delta':
+        delta = event.get('delta', {})
+        if delta.get('type') == 'text_delta':
+            return 'delta', delta.get('text', '')
+    elif event_type == 'message_start':
+        message = event.get('message', {})
+        return 'usage', {**message.get('usage', {}), 'model': message.get('model')}
+    elif event_type == 'message_delta':
+        return 'usage', event.get('usage', {})
+    elif event_type == 'error':
+        return 'error', event.get('error')
+    elif event_type == 'message_stop':
+        return 'stop', None
+    return None
+
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
@@ -0,0 +1,703 @@
+"""
+Provider-neutral completions for the Nevin endpoints.
+
+Requests are built in the Anthropic Messages format (nevin.py) and every
+provider accepts that shape and answers in it: complete() returns
+(status, result or None) with result['content'][0]['text'] and
+result['usage'], stream() yields the events of nevin.stream_text_delta:
+('delta', text), ('usage', usage), ('error', detail) and ('stop', None).
+
+Providers:
+    anthropic - the Messages API (ANTHROPIC_API_KEY)
+    openai    - Chat Completions over plain HTTP (OPENAI_API_KEY)
+    fake      - canned local answers with configurable latency, for tests
+                and load tests
+
+LLMClient (threads) and AsyncLLMClient (asyncio) put a primary
+(NEVIN_PROVIDER) in front of an optional secondary
+(NEVIN_SECONDARY_PROVIDER). A primary failure before the first token fails
+over to the secondary. With hedging on (NEVIN_HEDGE, default), the
+secondary is also started when the primary has not produced its first
+token (or, for complete(), its answer) within the primary's observed p95
+latency; the first to answer wins and the other is cancelled.
+"""
+
+import os
+import json
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from nevin import ANTHROPIC_API_URL, estimate_tokens, get_api_key, stream_text_delta
+from metrics import record_hedge, record_upstream_error
+from upstream import (
+    UPSTREAM_POOL_SIZE,
+    anthropic_headers,
+    post_upstream,
+    send_upstream,
+)
+
+PRIMARY_PROVIDER = os.environ.get('NEVIN_PROVIDER', 'anthropic')
+SECONDARY_PROVIDER = os.environ.get('NEVIN_SECONDARY_PROVIDER', '')
+HEDGE_ENABLED = os.environ.get('NEVIN_HEDGE', '1') != '0'
+# Hedge delay used until HEDGE_MIN_SAMPLES latencies have been observed.
+HEDGE_DEFAULT_SECONDS = float(os.environ.get('NEVIN_HEDGE_SECONDS', '4'))
+HEDGE_MIN_SECONDS = 0.5
+HEDGE_MAX_SECONDS = 15.0
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+
+OPENAI_API_URL = os.environ.get('OPENAI_API_URL', 'https://api.openai.com/v1/chat/completions')
+OPENAI_MODEL = os.environ.get('NEVIN_OPENAI_MODEL', 'gpt-4o')
+OPENAI_SMALL_MODEL = os.environ.get('NEVIN_OPENAI_SMALL_MODEL', 'gpt-4o-mini')
+
+# Seconds before the fake provider's first token, and between tokens.
+FAKE_LATENCY = float(os.environ.get('NEVIN_FAKE_LATENCY', '0.05'))
+FAKE_TOKEN_DELAY = float(os.environ.get('NEVIN_FAKE_TOKEN_DELAY', '0.005'))
+
+
+def content_text(content):
+    """Plain text of a message `content` or `system` (string or list of blocks)."""
+    if isinstance(content, str):
+        return content
+    return '\n\n'.join(block.get('text', '') for block in content if block.get('type') == 'text')
+
+
+def anthropic_result(text, input_tokens=0, output_tokens=0):
+    return {
+        'content': [{'type': 'text', 'text': text}],
+        'usage': {'input_tokens': input_tokens, 'output_tokens': output_tokens}
+    }
+
+
+class AnthropicProvider:
+    name = 'anthropic'
+
+    @property
+    def configured(self):
+        return bool(get_api_key())
+
+    def request(self, payload, stream):
+        body = {**payload, 'stream': True} if stream else payload
+        return ANTHROPIC_API_URL, anthropic_headers(get_api_key()), body
+
+    def parse_result(self, body):
+        return body
+
+    def parse_line(self, line):
+        return stream_text_delta(line)
+
+    def complete(self, endpoint, payload):
+        response = post_upstream(endpoint, *self.request(payload, False))
+        if not response.ok:
+            logging.error(f'{self.name} API error: {response.status_code} - {response.text}')
+            return response.status_code, None
+        return response.status_code, self.parse_result(response.json())
+
+    def stream(self, endpoint, payload):
+        response = post_upstream(endpoint, *self.request(payload, True), stream=True)
+        if not response.ok:
+            logging.error(f'{self.name} API error: {response.status_code} - {response.text}')
+            yield 'error', f'status {response.status_code}'
+            return
+        with response:
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    parsed = self.parse_line(line)
+                    if parsed is not None:
+                        if parsed[0] == 'error':
+                            record_upstream_error(endpoint, 'stream')
+                        yield parsed
+            except requests.RequestException:
+                record_upstream_error(endpoint, 'stream')
+                raise
+
+    async def acomplete(self, session, endpoint, payload):
+        response = await send_upstream(session, endpoint, *self.request(payload, False))
+        async with response:
+            if response.status != 200:
+                logging.error(f'{self.name} API error: {response.status} - {await response.text()}')
+                return response.status, None
+            return response.status, self.parse_result(await response.json())
+
+    async def astream(self, session, endpoint, payload):
+        import aiohttp
+
+        response = await send_upstream(session, endpoint, *self.request(payload, True), stream=True)
+        async with response:
+            if response.status != 200:
+                logging.error(f'{self.name} API error: {response.status} - {await response.text()}')
+                yield 'error', f'status {response.status}'
+                return
+            try:
+                async for raw_line in response.content:
+                    parsed = self.parse_line(raw_line.decode('utf-8').strip())
+                    if parsed is not None:
+                        if parsed[0] == 'error':
+                            record_upstream_error(endpoint, 'stream')
+                        yield parsed
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                record_upstream_error(endpoint, 'stream')
+                raise
+
+
+class OpenAIProvider(AnthropicProvider):
+    """Chat Completions, translated to and from the Messages format."""
+
+    name = 'openai'
+
+    @property
+    def configured(self):
+        return bool(os.environ.get('OPENAI_API_KEY'))
+
+    def request(self, payload, stream):
+        messages = []
+        if payload.get('system'):
+            messages.append({'role': 'system', 'content': content_text(payload['system'])})
+        for message in payload['messages']:
+            messages.append({'role': message['role'], 'content': content_text(message['content'])})
+        body = {
+            # Routes that picked the small Anthropic tier get the small OpenAI one.
+            'model': OPENAI_SMALL_MODEL if 'haiku' in payload.get('model', '') else OPENAI_MODEL,
+            'max_tokens': payload['max_tokens'],
+            'messages': messages
+        }
+        if stream:
+            body.update(stream=True, stream_options={'include_usage': True})
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f"Bearer {os.environ.get('OPENAI_API_KEY', '')}"
+        }
+        return OPENAI_API_URL, headers, body
+
+    def parse_result(self, body):
+        usage = body.get('usage') or {}
+        return {
+            **anthropic_result(
+                body['choices'][0]['message'].get('content') or '',
+                usage.get('prompt_tokens', 0),
+                usage.get('completion_tokens', 0)
+            ),
+            'model': body.get('model')
+        }
+
+    def parse_line(self, line):
+        if not line or not line.startswith('data:'):
+            return None
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return 'stop', None
+        event = json.loads(data)
+        if event.get('error'):
+            return 'error', event['error']
+        if event.get('usage'):
+            usage = event['usage']
+            return 'usage', {
+                'input_tokens': usage.get('prompt_tokens', 0),
+                'output_tokens': usage.get('completion_tokens', 0),
+                'model': event.get('model')
+            }
+        choices = event.get('choices') or [{}]
+        text = choices[0].get('delta', {}).get('content')
+        return ('delta', text) if text else None
+
+
+class FakeProvider:
+    """Local canned answers: FAKE_LATENCY to the first token, FAKE_TOKEN_DELAY per word."""
+
+    name = 'fake'
+    configured = True
+
+    def reply(self, endpoint, payload):
+        if endpoint == 'moment_title':
+            return json.dumps({
+                'title': 'Reflexión de prueba',
+                'themes': ['fe'],
+                'summary': 'Respuesta generada localmente.'
+            }, ensure_ascii=False)
+        question = content_text(payload['messages'][-1]['content'])
+        return f'Respuesta de prueba sobre Juan 3:16. Pregunta: {question[:200]}'
+
+    def usage(self, payload, text):
+        prompt = content_text(payload.get('system') or '') + ''.join(
+            content_text(message['content']) for message in payload['messages']
+        )
+        return estimate_tokens(prompt), estimate_tokens(text)
+
+    def complete(self, endpoint, payload):
+        text = self.reply(endpoint, payload)
+        time.sleep(FAKE_LATENCY + FAKE_TOKEN_DELAY * len(text.split()))
+        return 200, anthropic_result(text, *self.usage(payload, text))
+
+    def stream(self, endpoint, payload):
+        text = self.reply(endpoint, payload)
+        input_tokens, output_tokens = self.usage(payload, text)
+        yield 'usage', {'input_tokens': input_tokens}
+        time.sleep(FAKE_LATENCY)
+        for word in text.split(' '):
+            yield 'delta', word + ' '
+            time.sleep(FAKE_TOKEN_DELAY)
+        yield 'usage', {'output_tokens': output_tokens}
+        yield 'stop', None
+
+    async def acomplete(self, session, endpoint, payload):
+        text = self.reply(endpoint, payload)
+        await asyncio.sleep(FAKE_LATENCY + FAKE_TOKEN_DELAY * len(text.split()))
+        return 200, anthropic_result(text, *self.usage(payload, text))
+
+    async def astream(self, session, endpoint, payload):
+        text = self.reply(endpoint, payload)
+        input_tokens, output_tokens = self.usage(payload, text)
+        yield 'usage', {'input_tokens': input_tokens}
+        await asyncio.sleep(FAKE_LATENCY)
+        for word in text.split(' '):
+            yield 'delta', word + ' '
+            await asyncio.sleep(FAKE_TOKEN_DELAY)
+        yield 'usage', {'output_tokens': output_tokens}
+        yield 'stop', None
+
+
+PROVIDERS = {
+    'anthropic': AnthropicProvider,
+    'openai': OpenAIProvider,
+    'fake': FakeProvider,
+}
+
+
+def make_provider(name):
+    if not name:
+        return None
+    if name not in PROVIDERS:
+        raise ValueError(f'Unknown provider {name!r}; expected one of {sorted(PROVIDERS)}')
+    return PROVIDERS[name]()
+
+
+class LatencyTracker:
+    """Recent primary latencies per (endpoint, mode), for the hedge delay."""
+
+    def __init__(self, window=HEDGE_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, key):
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_SECONDS
+        p95 = samples[int(0.95 * (len(samples) - 1))]
+        return min(max(p95, HEDGE_MIN_SECONDS), HEDGE_MAX_SECONDS)
+
+
+def succeeded(outcome):
+    return outcome is not None and outcome[1] is not None
+
+
+class RaceState:
+    """Bookkeeping shared by the threaded and asyncio stream races."""
+
+    def __init__(self):
+        self.started = set()
+        self.failed = set()
+        self.buffered = {}
+        self.last_error = None
+        self.last_failed = None
+        self.recorded = False
+
+    def fail(self, tag, event):
+        self.failed.add(tag)
+        self.last_failed = tag
+        if event is not None:
+            self.last_error = event
+
+    def all_failed(self):
+        return self.failed >= self.started
+
+    def outcome(self, winner):
+        """Hedge outcome for `winner`'s first token, or None if already counted."""
+        if self.recorded:
+            return None
+        self.recorded = True
+        if 'secondary' not in self.started:
+            return 'primary'
+        return f'hedge_{winner}'
+
+    def failover(self, endpoint):
+        self.recorded = True
+        record_hedge(endpoint, 'failover')
+        logging.warning(f'{endpoint}: primary provider failed, failing over')
+
+    def final_events(self):
+        """What to send once every racer has failed: its error, or whatever it produced."""
+        if self.last_error is None:
+            return self.buffered.get(self.last_failed, [])
+        if self.last_error[0] == 'exception':
+            raise self.last_error[1]
+        return [self.last_error]
+
+
+class LLMClient:
+    """Primary/secondary completions for the threaded app."""
+
+    def __init__(self, primary, secondary=None, hedge=HEDGE_ENABLED, tracker=None):
+        self.primary = primary
+        self.secondary = secondary
+        self.hedge = hedge
+        self.tracker = tracker or LatencyTracker()
+        self._executor = ThreadPoolExecutor(
+            max_workers=UPSTREAM_POOL_SIZE, thread_name_prefix='llm-race'
+        )
+
+    @property
+    def configured(self):
+        return self.primary.configured
+
+    def _complete(self, provider, endpoint, payload):
+        started = time.perf_counter()
+        outcome = provider.complete(endpoint, payload)
+        if provider is self.primary and succeeded(outcome):
+            self.tracker.record((endpoint, 'complete'), time.perf_counter() - started)
+        return outcome
+
+    @staticmethod
+    def _result(future):
+        try:
+            return future.result()
+        except Exception as e:
+            logging.error(f'Upstream completion failed: {e}')
+            return None
+
+    def complete(self, endpoint, payload):
+        """(status, result or None); raises only if every provider raised."""
+        if self.secondary is None:
+            return self._complete(self.primary, endpoint, payload)
+
+        primary = self._executor.submit(self._complete, self.primary, endpoint, payload)
+        delay = self.tracker.hedge_delay((endpoint, 'complete')) if self.hedge else None
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            outcome = self._result(primary)
+            if succeeded(outcome):
+                record_hedge(endpoint, 'primary')
+                return outcome
+            record_hedge(endpoint, 'failover')
+            logging.warning(f'{endpoint}: primary provider failed, failing over')
+            return self._complete(self.secondary, endpoint, payload)
+
+        logging.info(f'{endpoint}: primary slower than {delay:.2f}s, hedging')
+        secondary = self._executor.submit(self._complete, self.secondary, endpoint, payload)
+        tags = {primary: 'hedge_primary', secondary: 'hedge_secondary'}
+        pending = set(tags)
+        last = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome = self._result(future)
+                if succeeded(outcome):
+                    # A blocking HTTP call cannot be interrupted; the loser's
+                    # answer is simply dropped.
+                    for other in pending:
+                        other.cancel()
+                    record_hedge(endpoint, tags[future])
+                    return outcome
+                last = future
+        record_hedge(endpoint, 'failed')
+        return last.result()
+
+    def _stream(self, provider, endpoint, payload):
+        started = time.perf_counter()
+        first = True
+        for event in provider.stream(endpoint, payload):
+            if first and event[0] == 'delta':
+                first = False
+                if provider is self.primary:
+                    self.tracker.record((endpoint, 'stream'), time.perf_counter() - started)
+            yield event
+
+    def stream(self, endpoint, payload):
+        """Stream events; may raise requests exceptions if every provider raised."""
+        if self.secondary is None:
+            yield from self._stream(self.primary, endpoint, payload)
+            return
+        yield from self._race_stream(endpoint, payload)
+
+    def _race_stream(self, endpoint, payload):
+        events = queue.Queue()
+        cancelled = {}
+        providers = {'primary': self.primary, 'secondary': self.secondary}
+        state = RaceState()
+
+        def pump(tag, cancel):
+            stream = self._stream(providers[tag], endpoint, payload)
+            try:
+                for event in stream:
+                    if cancel.is_set():
+                        break
+                    events.put((tag, event))
+            except Exception as e:
+                events.put((tag, ('exception', e)))
+            finally:
+                stream.close()
+                events.put((tag, None))
+
+        def launch(tag):
+            state.started.add(tag)
+            state.buffered[tag] = []
+            cancelled[tag] = threading.Event()
+            threading.Thread(
+                target=pump, args=(tag, cancelled[tag]), name=f'llm-{tag}', daemon=True
+            ).start()
+
+        launch('primary')
+        delay = self.tracker.hedge_delay((endpoint, 'stream')) if self.hedge else None
+        deadline = time.monotonic() + delay if delay is not None else None
+        winner = None
+        try:
+            while True:
+                timeout = None
+                if winner is None and 'secondary' not in state.started and deadline is not None:
+                    timeout = max(0.0, deadline - time.monotonic())
+                try:
+                    tag, event = events.get(timeout=timeout)
+                except queue.Empty:
+                    logging.info(f'{endpoint}: no first token after {delay:.2f}s, hedging')
+                    launch('secondary')
+                    continue
+
+                if winner is not None:
+                    if tag != winner:
+                        continue
+                    if event is None:
+                        return
+                    if event[0] == 'exception':
+                        raise event[1]
+                    yield event
+                    continue
+
+                if tag in state.failed:
+                    continue
+                if event is None or event[0] in ('error', 'exception'):
+                    state.fail(tag, event)
+                    if 'secondary' not in state.started:
+                        state.failover(endpoint)
+                        launch('secondary')
+                    elif state.all_failed():
+                        if not state.recorded:
+                            record_hedge(endpoint, 'failed')
+                        yield from state.final_events()
+                        return
+                    continue
+                if event[0] == 'delta':
+                    winner = tag
+                    for other, cancel in cancelled.items():
+                        if other != tag:
+                            cancel.set()
+                    outcome = state.outcome(tag)
+                    if outcome:
+                        record_hedge(endpoint, outcome)
+                    yield from state.buffered[tag]
+                    yield event
+                    continue
+                state.buffered[tag].append(event)
+        finally:
+            for cancel in cancelled.values():
+                cancel.set()
+
+
+class AsyncLLMClient:
+    """Primary/secondary completions for the asyncio app, over its aiohttp session."""
+
+    def __init__(self, session, primary, secondary=None, hedge=HEDGE_ENABLED, tracker=None):
+        self.session = session
+        self.primary = primary
+        self.secondary = secondary
+        self.hedge = hedge
+        self.tracker = tracker or LatencyTracker()
+
+    @property
+    def configured(self):
+        return self.primary.configured
+
+    async def _complete(self, provider, endpoint, payload):
+        started = time.perf_counter()
+        outcome = await provider.acomplete(self.session, endpoint, payload)
+        if provider is self.primary and succeeded(outcome):
+            self.tracker.record((endpoint, 'complete'), time.perf_counter() - started)
+        return outcome
+
+    @staticmethod
+    def _result(task):
+        if task.cancelled():
+            return None
+        if task.exception() is not None:
+            logging.error(f'Upstream completion failed: {task.exception()}')
+            return None
+        return task.result()
+
+    async def complete(self, endpoint, payload):
+        if self.secondary is None:
+            return await self._complete(self.primary, endpoint, payload)
+
+        loop = asyncio.get_running_loop()
+        primary = loop.create_task(self._complete(self.primary, endpoint, payload))
+        tasks = [primary]
+        delay = self.tracker.hedge_delay((endpoint, 'complete')) if self.hedge else None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                outcome = self._result(primary)
+                if succeeded(outcome):
+                    record_hedge(endpoint, 'primary')
+                    return outcome
+                record_hedge(endpoint, 'failover')
+                logging.warning(f'{endpoint}: primary provider failed, failing over')
+                return await self._complete(self.secondary, endpoint, payload)
+
+            logging.info(f'{endpoint}: primary slower than {delay:.2f}s, hedging')
+            secondary = loop.create_task(self._complete(self.secondary, endpoint, payload))
+            tasks.append(secondary)
+            tags = {primary: 'hedge_primary', secondary: 'hedge_secondary'}
+            pending = set(tags)
+            last = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    outcome = self._result(task)
+                    if succeeded(outcome):
+                        record_hedge(endpoint, tags[task])
+                        return outcome
+                    last = task
+            record_hedge(endpoint, 'failed')
+            return last.result()
+        finally:
+            # The loser is cancelled, closing its upstream connection.
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _stream(self, provider, endpoint, payload):
+        started = time.perf_counter()
+        first = True
+        async for event in provider.astream(self.session, endpoint, payload):
+            if first and event[0] == 'delta':
+                first = False
+                if provider is self.primary:
+                    self.tracker.record((endpoint, 'stream'), time.perf_counter() - started)
+            yield event
+
+    async def stream(self, endpoint, payload):
+        if self.secondary is None:
+            async for event in self._stream(self.primary, endpoint, payload):
+                yield event
+            return
+
+        events = asyncio.Queue()
+        tasks = {}
+        providers = {'primary': self.primary, 'secondary': self.secondary}
+        state = RaceState()
+
+        async def pump(tag):
+            try:
+                async for event in self._stream(providers[tag], endpoint, payload):
+                    events.put_nowait((tag, event))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                events.put_nowait((tag, ('exception', e)))
+            events.put_nowait((tag, None))
+
+        def launch(tag):
+            state.started.add(tag)
+            state.buffered[tag] = []
+            tasks[tag] = asyncio.get_running_loop().create_task(pump(tag))
+
+        launch('primary')
+        delay = self.tracker.hedge_delay((endpoint, 'stream')) if self.hedge else None
+        deadline = time.monotonic() + delay if delay is not None else None
+        winner = None
+        try:
+            while True:
+                timeout = None
+                if winner is None and 'secondary' not in state.started and deadline is not None:
+                    timeout = max(0.0, deadline - time.monotonic())
+                try:
+                    tag, event = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    logging.info(f'{endpoint}: no first token after {delay:.2f}s, hedging')
+                    launch('secondary')
+                    continue
+
+                if winner is not None:
+                    if tag != winner:
+                        continue
+                    if event is None:
+                        return
+                    if event[0] == 'exception':
+                        raise event[1]
+                    yield event
+                    continue
+
+                if tag in state.failed:
+                    continue
+                if event is None or event[0] in ('error', 'exception'):
+                    state.fail(tag, event)
+                    if 'secondary' not in state.started:
+                        state.failover(endpoint)
+                        launch('secondary')
+                    elif state.all_failed():
+                        if not state.recorded:
+                            record_hedge(endpoint, 'failed')
+                        for final in state.final_events():
+                            yield final
+                        return
+                    continue
+                if event[0] == 'delta':
+                    winner = tag
+                    for other, task in tasks.items():
+                        if other != tag:
+                            task.cancel()
+                    outcome = state.outcome(tag)
+                    if outcome:
+                        record_hedge(endpoint, outcome)
+                    for buffered in state.buffered[tag]:
+                        yield buffered
+                    yield event
+                    continue
+                state.buffered[tag].append(event)
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+
+def build_llm_client():
+    return LLMClient(make_provider(PRIMARY_PROVIDER), make_provider(SECONDARY_PROVIDER))
+
+
+_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm_client():
+    """The process-wide threaded client, shared by every caller so hedging sees all latencies."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = build_llm_client()
+    return _llm
+
+
+def build_async_llm_client(session):
+    return AsyncLLMClient(
+        session, make_provider(PRIMARY_PROVIDER), make_provider(SECONDARY_PROVIDER)
+    )
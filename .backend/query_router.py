@@ -0,0 +1,121 @@
+"""
+Local query classifier that picks the model and output budget for a request.
+
+The system prompt already distinguishes "MODO RÁPIDO" (2-3 paragraphs) from
+"MODO PROFUNDO", and asks for extra care when the user is going through
+something painful. The same cues are matched here with one keyword regex
+over the accent-folded message (the approach of detect_emotion in
+attached_assets/chat_request.py), so a quick question goes to a smaller
+model with a short budget instead of every call reserving 4096 tokens on
+the largest tier.
+
+Intents:
+    quick  - default; short answers
+    deep   - deep-study requests, prophecy/comparison studies, long questions
+    care   - signs of grief or distress; main model, moderate budget
+    title  - moment titles (chosen by the endpoint, not the classifier)
+
+Each route is configurable with NEVIN_<INTENT>_MODEL and
+NEVIN_<INTENT>_MAX_TOKENS; NEVIN_ROUTING=0 sends every chat to
+ANTHROPIC_MODEL with the previous fixed budgets.
+"""
+
+import os
+import re
+import logging
+from collections import namedtuple
+
+from nevin import ANTHROPIC_MODEL
+from textnorm import fold
+
+ROUTING_ENABLED = os.environ.get('NEVIN_ROUTING', '1') != '0'
+
+SMALL_MODEL = 'claude-3-5-haiku-20241022'
+
+Route = namedtuple('Route', 'intent model max_tokens')
+
+
+def configured_route(intent, model, max_tokens):
+    prefix = f'NEVIN_{intent.upper()}'
+    return Route(
+        intent,
+        os.environ.get(f'{prefix}_MODEL', model),
+        int(os.environ.get(f'{prefix}_MAX_TOKENS', str(max_tokens)))
+    )
+
+
+ROUTES = {
+    'quick': configured_route('quick', SMALL_MODEL, 1024),
+    'deep': configured_route('deep', ANTHROPIC_MODEL, 4096),
+    'care': configured_route('care', ANTHROPIC_MODEL, 1536),
+    'title': configured_route('title', SMALL_MODEL, 200),
+}
+
+# Questions longer than this many words are treated as study requests.
+DEEP_MIN_WORDS = int(os.environ.get('NEVIN_DEEP_MIN_WORDS', '60'))
+
+# Accentless keywords; a space matches any whitespace.
+INTENT_KEYWORDS = {
+    'deep': [
+        'explicame mas', 'explica mas', 'profundiza', 'profundizar', 'estudio profundo',
+        'quiero entender mejor', 'a fondo', 'en detalle', 'detalladamente', 'estudio biblico',
+        'analiza', 'analisis', 'compara', 'comparacion', 'diferencia entre', 'profecia',
+        'profecias', 'cronologia', 'contexto historico', 'exegesis', 'paso a paso',
+    ],
+    'care': [
+        'triste', 'tristeza', 'deprimido', 'deprimida', 'depresion', 'ansioso', 'ansiosa',
+        'ansiedad', 'miedo', 'murio', 'fallecio', 'perdi a', 'duelo', 'me siento solo',
+        'me siento sola', 'no puedo mas', 'ayudame', 'desesperado', 'desesperada', 'llorar',
+    ],
+}
+
+
+def compile_intent_matcher(keywords):
+    intent_of = {}
+    for intent, words in keywords.items():
+        for word in words:
+            intent_of[word] = intent
+    alternatives = sorted(intent_of, key=len, reverse=True)
+    pattern = re.compile(r'\b(?:' + '|'.join(
+        r'\s+'.join(re.escape(part) for part in word.split()) for word in alternatives
+    ) + r')\b')
+    return pattern, intent_of
+
+
+INTENT_RE, INTENT_OF_KEYWORD = compile_intent_matcher(INTENT_KEYWORDS)
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def classify_query(message):
+    """Return (intent, reason) for a chat message."""
+    folded = fold(message)
+    matched = {}
+    for keyword in INTENT_RE.findall(folded):
+        keyword = WHITESPACE_RE.sub(' ', keyword)
+        matched.setdefault(INTENT_OF_KEYWORD[keyword], keyword)
+
+    # Distress outranks study depth: the answer should console first.
+    if 'care' in matched:
+        return 'care', f"keyword '{matched['care']}'"
+    if 'deep' in matched:
+        return 'deep', f"keyword '{matched['deep']}'"
+    words = len(folded.split())
+    if words > DEEP_MIN_WORDS:
+        return 'deep', f'{words} words'
+    return 'quick', 'default'
+
+
+def route_chat(data):
+    """Route for a chat request; None when routing is disabled."""
+    if not ROUTING_ENABLED:
+        return None
+    intent, reason = classify_query(data.get('message', ''))
+    route = ROUTES[intent]
+    logging.info(
+        f'chat routed as {intent} ({reason}): model={route.model} max_tokens={route.max_tokens}'
+    )
+    return route
+
+
+def title_route():
+    return ROUTES['title'] if ROUTING_ENABLED else None
@@ -0,0 +1,279 @@
+"""
+Cache of chat answers to first-turn questions (no history, summary or context).
+
+Questions are keyed by their normalized form: every word, accent-folded and
+stemmed (textnorm.tokenize without stopword removal), so "¿Qué dice la
+Biblia sobre el sábado?" and "que dice la biblia sobre el sabado" share an
+entry while "¿Quién es Jesús?" and "¿Dónde está Jesús?" do not. The key
+also carries the request's variant (grounding and model route, see
+cache_variant), as those change the answer.
+
+With NEVIN_RESPONSE_CACHE_SIMILARITY > 0, a miss also accepts the most
+similar cached question of the same variant whose TF-IDF cosine over
+content terms reaches that threshold. Content terms alone say nothing about
+what is asked, so the candidate must also share the question's frame: its
+question words, negations and the prepositions that bound it (FRAME_WORDS).
+
+Like the commentary cache, entries carry a prompt/model fingerprint and
+expire by TTL and least-recent use.
+"""
+
+import os
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import Counter
+
+from commentary_cache import prompt_fingerprint
+from egw_search import loaded_egw_index
+from metrics import record_cache_lookup
+from textnorm import SPANISH_STOPWORDS, stem, tokenize
+
+RESPONSE_CACHE_ENABLED = os.environ.get('NEVIN_RESPONSE_CACHE', '1') != '0'
+RESPONSE_CACHE_PATH = os.environ.get(
+    'NEVIN_RESPONSE_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'response_cache.sqlite3')
+)
+RESPONSE_CACHE_TTL = int(os.environ.get('NEVIN_RESPONSE_CACHE_TTL', str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('NEVIN_RESPONSE_CACHE_MAX_ENTRIES', '2000'))
+# Cosine threshold for near-duplicate questions; 0 disables fuzzy matching.
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get('NEVIN_RESPONSE_CACHE_SIMILARITY', '0'))
+# Bump when normalize_question changes, so entries under the old keys are purged.
+KEY_SCHEME = 2
+
+# Stopwords that decide what a question asks (stemmed, as in a normalized question).
+FRAME_WORDS = frozenset(stem(word) for word in """
+que quien quienes cual cuales cuando donde como cuanto cuantos cuanta cuantas porque por para
+no ni nada sin contra ante antes bajo hasta desde entre hacia tras mas poco mucho muy todo todos
+""".split())
+# Stopwords as they appear after stemming ("unos" -> "uno").
+STEMMED_STOPWORDS = SPANISH_STOPWORDS | frozenset(stem(word) for word in SPANISH_STOPWORDS)
+
+
+def normalize_question(message):
+    return ' '.join(tokenize(message, drop_stopwords=False))
+
+
+def content_terms(normalized):
+    return {term for term in normalized.split() if term not in STEMMED_STOPWORDS}
+
+
+def frame_words(normalized):
+    return {term for term in normalized.split() if term in FRAME_WORDS}
+
+
+def cache_variant(grounded, route=None):
+    """The parts of a request besides its question that change the answer."""
+    model = f'{route.model}:{route.max_tokens}' if route else 'default'
+    return f"{'sources' if grounded else 'plain'}|{model}"
+
+
+def cacheable_turn(data):
+    """Only first turns are cached: later answers depend on the conversation."""
+    return not (data.get('history') or data.get('summary') or data.get('context'))
+
+
+def term_weights(normalized):
+    """idf-weighted term vector, using EGW document frequencies when loaded."""
+    counts = Counter(term for term in normalized.split() if term not in STEMMED_STOPWORDS)
+    index = loaded_egw_index()
+    weights = {}
+    for term, tf in counts.items():
+        idf = 1.0
+        if index is not None:
+            entry = index.postings.get(term)
+            df = len(entry[0]) if entry else 0
+            idf = math.log((1 + len(index.doc_len)) / (1 + df)) + 1
+        weights[term] = (1 + math.log(tf)) * idf
+    return weights
+
+
+def cosine(a, b):
+    dot = sum(weight * b.get(term, 0.0) for term, weight in a.items())
+    if not dot:
+        return 0.0
+    return dot / (math.sqrt(sum(w * w for w in a.values())) * math.sqrt(sum(w * w for w in b.values())))
+
+
+class ResponseCache:
+    """SQLite answers keyed by normalized question, with a term table for near matches."""
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES, similarity=RESPONSE_CACHE_SIMILARITY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._fingerprint = f'{prompt_fingerprint()}:{KEY_SCHEME}'
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                variant TEXT NOT NULL DEFAULT '',
+                question TEXT NOT NULL,
+                response TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+            CREATE TABLE IF NOT EXISTS response_terms (
+                term TEXT NOT NULL,
+                key TEXT NOT NULL REFERENCES responses (key) ON DELETE CASCADE,
+                PRIMARY KEY (term, key)
+            );
+        ''')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(responses)')}
+        if 'variant' not in columns:
+            # Entries from before variants existed are keyed without one.
+            with self._conn:
+                self._conn.execute('DELETE FROM responses')
+                self._conn.execute(
+                    "ALTER TABLE responses ADD COLUMN variant TEXT NOT NULL DEFAULT ''"
+                )
+        with self._conn:
+            purged = self._conn.execute(
+                'DELETE FROM responses WHERE fingerprint != ?', (self._fingerprint,)
+            ).rowcount
+        if purged:
+            logging.info(f'Response cache: purged {purged} entries from an older prompt/model')
+
+    def key(self, normalized, variant=''):
+        return hashlib.sha256(
+            f'{self._fingerprint}\n{variant}\n{normalized}'.encode('utf-8')
+        ).hexdigest()
+
+    def nearest_key(self, normalized, variant=''):
+        """Key of the most similar cached question at or above the threshold."""
+        terms = content_terms(normalized)
+        if not terms:
+            return None
+        placeholders = ','.join('?' * len(terms))
+        candidates = self._conn.execute(
+            'SELECT DISTINCT r.key, r.question FROM response_terms t '
+            f'JOIN responses r ON r.key = t.key WHERE r.variant = ? AND t.term IN ({placeholders})',
+            [variant, *terms]
+        ).fetchall()
+        query = term_weights(normalized)
+        frame = frame_words(normalized)
+        best_key, best_score = None, self.similarity
+        for key, question in candidates:
+            if frame_words(question) != frame:
+                continue
+            score = cosine(query, term_weights(question))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def get(self, message, variant=''):
+        """Return (response, sources) for a cached question, or None."""
+        normalized = normalize_question(message)
+        if not normalized:
+            return None
+        now = time.time()
+        with self._lock, self._conn:
+            key = self.key(normalized, variant)
+            row = self._conn.execute(
+                'SELECT response, sources, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            near = False
+            if row is None and self.similarity > 0:
+                key = self.nearest_key(normalized, variant)
+                if key is not None:
+                    row = self._conn.execute(
+                        'SELECT response, sources, created_at FROM responses WHERE key = ?', (key,)
+                    ).fetchone()
+                    near = True
+            if row is None or now - row[2] > self.ttl:
+                if row is not None:
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.misses += 1
+                record_cache_lookup('response', 'miss')
+                return None
+            self._conn.execute(
+                'UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?', (now, key)
+            )
+            if near:
+                self.near_hits += 1
+            else:
+                self.hits += 1
+            record_cache_lookup('response', 'near_hit' if near else 'hit')
+            return row[0], json.loads(row[1])
+
+    def put(self, message, response, sources, variant=''):
+        normalized = normalize_question(message)
+        if not normalized or not response:
+            return
+        key = self.key(normalized, variant)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, fingerprint, variant, question, response, sources, created_at, '
+                'last_access, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)',
+                (key, self._fingerprint, variant, normalized, response,
+                 json.dumps(sources, ensure_ascii=False), now, now)
+            )
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO response_terms (term, key) VALUES (?, ?)',
+                [(term, key) for term in content_terms(normalized)]
+            )
+            self._conn.execute(
+                'DELETE FROM responses WHERE key IN ('
+                'SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def purge(self, message=None):
+        """Drop one question's entries (every variant), or everything; returns the number removed."""
+        with self._lock, self._conn:
+            if message is None:
+                return self._conn.execute('DELETE FROM responses').rowcount
+            return self._conn.execute(
+                'DELETE FROM responses WHERE fingerprint = ? AND question = ?',
+                (self._fingerprint, normalize_question(message))
+            ).rowcount
+
+    def top(self, limit=20):
+        """Most-hit cached questions, for the admin endpoint."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT question, hits, created_at, last_access FROM responses '
+                'ORDER BY hits DESC LIMIT ?', (limit,)
+            ).fetchall()
+        return [{'question': q, 'hits': h, 'createdAt': c, 'lastAccess': a} for q, h, c, a in rows]
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        return {
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'entries': entries
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """The process-wide cache for the threaded app, opened on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,240 @@
+"""
+Retrieval stage for chat: TF-IDF top-k over EGW pages and Bible verses.
+
+Both corpora are held as sparse document-term matrices in CSC form (per-term
+document and term-frequency columns plus offsets). The EGW matrix reuses the
+postings of the EGW search index, mapped or in memory, so only per-term idf
+and per-document norms are precomputed here. A query is scored with a
+vectorized cosine over the columns of its terms and cut with argpartition.
+
+Building the retriever takes tens of seconds on a cold process. Chat uses
+loaded_retriever() and answers without sources until it is ready, rather
+than waiting on get_retriever().
+"""
+
+import os
+import re
+import logging
+import threading
+from collections import Counter
+
+import numpy as np
+
+from bible_store import get_bible_store
+from egw_search import get_egw_index
+from nevin import estimate_tokens
+from textnorm import tokenize
+
+RETRIEVAL_ENABLED = os.environ.get('NEVIN_RETRIEVAL', '1') != '0'
+# Upper bound on the tokens spent on retrieved passages in one prompt.
+RETRIEVAL_TOKEN_BUDGET = int(os.environ.get('NEVIN_RETRIEVAL_TOKEN_BUDGET', '800'))
+RETRIEVAL_TOP_VERSES = 4
+RETRIEVAL_TOP_PASSAGES = 2
+PASSAGE_CHARS = 400
+MIN_SCORE = 0.05
+# Title pages are too short to ground an answer.
+MIN_PASSAGE_TERMS = 40
+# Tables of contents ("Prefacio . . . . . . 11") are long enough but are mostly
+# dot leaders; prose stays under 0.03 of its characters, contents pages over 0.3.
+MAX_LEADER_DENSITY = 0.1
+DOT_LEADER = re.compile(r'(?:\. ?){4,}|…{2,}')
+
+
+def leader_density(text):
+    """Share of `text`'s characters in dot leaders."""
+    if not text:
+        return 0.0
+    return sum(len(run) for run in DOT_LEADER.findall(text)) / len(text)
+
+
+def is_contents_page(lines):
+    text = ' '.join(lines)
+    if '. . .' not in text and '....' not in text and '……' not in text:
+        return False
+    return leader_density(text) > MAX_LEADER_DENSITY
+
+
+class TfidfMatrix:
+    """Sparse TF-IDF document-term matrix with cosine top-k queries."""
+
+    def __init__(self, lookup, offsets, docs, tfs, n_docs):
+        self.lookup = lookup
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.n_docs = n_docs
+
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+
+        term_of_posting = np.repeat(np.arange(len(df)), np.diff(offsets).astype(np.int64))
+        weights = (1 + np.log(tfs.astype(np.float32))) * self.idf[term_of_posting]
+        norms = np.sqrt(np.bincount(docs, weights=weights * weights, minlength=n_docs))
+        norms[norms == 0] = 1.0
+        self.inv_norms = (1 / norms).astype(np.float32)
+
+    @classmethod
+    def from_token_lists(cls, token_lists):
+        columns = {}
+        for doc, tokens in enumerate(token_lists):
+            for term, tf in Counter(tokens).items():
+                columns.setdefault(term, ([], []))
+                columns[term][0].append(doc)
+                columns[term][1].append(tf)
+        return cls.from_columns(columns, len(token_lists))
+
+    @classmethod
+    def from_columns(cls, columns, n_docs):
+        """Build from {term: (docs, tfs)}, e.g. an in-memory EGWIndex's postings."""
+        terms = list(columns)
+        lengths = np.fromiter((len(columns[t][0]) for t in terms), dtype=np.int64, count=len(terms))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        docs = np.concatenate([np.asarray(columns[t][0], dtype=np.uint32) for t in terms])
+        tfs = np.concatenate([np.asarray(columns[t][1], dtype=np.uint16) for t in terms])
+        lookup = {term: i for i, term in enumerate(terms)}.get
+        return cls(lookup, offsets, docs, tfs, n_docs)
+
+    @classmethod
+    def from_egw_index(cls, index):
+        if hasattr(index, 'post_docs'):
+            matrix = cls(
+                index.postings.find,
+                np.frombuffer(index.postings_offsets, dtype=np.uint32).astype(np.int64),
+                np.frombuffer(index.post_docs, dtype=np.uint32),
+                np.frombuffer(index.post_tfs, dtype=np.uint16),
+                len(index.doc_len)
+            )
+        else:
+            matrix = cls.from_columns(index.postings, len(index.doc_len))
+        doc_len = np.frombuffer(index.doc_len, dtype=np.uint32)
+        contents = np.fromiter(
+            (is_contents_page(index.page_lines[doc]) for doc in range(len(doc_len))),
+            dtype=bool, count=len(doc_len)
+        )
+        # A zero norm keeps the page out of every top_k.
+        matrix.inv_norms[(doc_len < MIN_PASSAGE_TERMS) | contents] = 0
+        return matrix
+
+    def top_k(self, terms, k):
+        """Return [(doc, cosine)] for the k best documents, best first."""
+        query = Counter(terms)
+        columns = [(self.lookup(term), tf) for term, tf in query.items()]
+        columns = [(col, tf) for col, tf in columns if col is not None]
+        if not columns:
+            return []
+
+        q_weights = np.array([(1 + np.log(tf)) * self.idf[col] for col, tf in columns])
+        q_weights /= np.linalg.norm(q_weights)
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for (col, _), q_weight in zip(columns, q_weights):
+            start, end = self.offsets[col], self.offsets[col + 1]
+            docs = self.docs[start:end]
+            scores[docs] += q_weight * self.idf[col] * (1 + np.log(self.tfs[start:end].astype(np.float32)))
+        scores *= self.inv_norms
+
+        k = min(k, self.n_docs)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(doc), float(scores[doc])) for doc in best if scores[doc] > 0]
+
+
+class Retriever:
+    """Finds the Bible verses and EGW passages most relevant to a question."""
+
+    def __init__(self, egw_index, bible):
+        self.egw_index = egw_index
+        self.egw_matrix = TfidfMatrix.from_egw_index(egw_index)
+        self.bible = bible
+        self.verse_matrix = (
+            TfidfMatrix.from_token_lists([tokenize(text) for text in bible.spanish])
+            if len(bible) else None
+        )
+
+    def retrieve(self, question, token_budget=RETRIEVAL_TOKEN_BUDGET):
+        """Return source dicts, best first, whose text fits within `token_budget`."""
+        terms = tokenize(question)
+        if not terms:
+            return []
+
+        candidates = []
+        if self.verse_matrix is not None:
+            for doc, score in self.verse_matrix.top_k(terms, RETRIEVAL_TOP_VERSES):
+                candidates.append((score, {
+                    'type': 'bible',
+                    'reference': self.bible.reference(doc),
+                    'text': self.bible.spanish[doc]
+                }))
+        for doc, score in self.egw_matrix.top_k(terms, RETRIEVAL_TOP_PASSAGES):
+            index = self.egw_index
+            candidates.append((score, {
+                'type': 'egw',
+                'reference': f"{index.books[index.page_book[doc]]}, p. {index.page_number[doc]}",
+                'text': index.snippet(doc, terms)[:PASSAGE_CHARS]
+            }))
+
+        sources = []
+        remaining = token_budget
+        for score, source in sorted(candidates, key=lambda c: -c[0]):
+            if score < MIN_SCORE:
+                continue
+            cost = estimate_tokens(source['reference'] + source['text'])
+            if cost > remaining:
+                continue
+            remaining -= cost
+            sources.append(source)
+        return sources
+
+
+def format_sources(sources):
+    """Render retrieved sources as a prompt block for the user turn."""
+    lines = ['PASAJES DE REFERENCIA (úsalos solo si son pertinentes a la pregunta):']
+    for source in sources:
+        label = 'Biblia' if source['type'] == 'bible' else 'EGW'
+        lines.append(f"[{label}] {source['reference']}: \"{source['text']}\"")
+    return '\n'.join(lines)
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+_loader = None
+_loader_lock = threading.Lock()
+
+
+def get_retriever():
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = Retriever(get_egw_index(), get_bible_store())
+    return _retriever
+
+
+def loaded_retriever():
+    """The shared retriever if something already built it, without building it."""
+    return _retriever
+
+
+def load_retriever_in_background():
+    """Build the shared retriever on a thread, unless that is already under way.
+
+    Usually the warm-up is already building it; this covers NEVIN_WARMUP=0 and
+    a failed warm-up task. A failed build is retried on the next call.
+    """
+    global _loader
+
+    def load():
+        global _loader
+        try:
+            get_retriever()
+        except Exception as e:
+            logging.error(f'Loading the retriever failed: {e}')
+            with _loader_lock:
+                _loader = None
+
+    with _loader_lock:
+        if _retriever is not None or _loader is not None:
+            return
+        _loader = threading.Thread(target=load, name='nevin-retriever', daemon=True)
+        _loader.start()
@@ -0,0 +1,189 @@
+"""
+Single-flight coalescing of identical in-flight upstream calls.
+
+Concurrent requests with the same key (endpoint + payload hash) share one
+upstream call: the first caller starts it, later callers wait for its
+result. Streams are run by a background producer and broadcast; a caller
+that joins late first replays the events already sent, so every subscriber
+sees the whole stream, and a subscriber that disconnects does not cancel it
+for the others.
+
+SingleFlight serves the threaded Flask app, AsyncSingleFlight the asyncio one.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def call(self, key, fn):
+        """Return fn(), or the result of an identical call already in flight."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if leader:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        return future.result()
+
+    def stream(self, key, events):
+        """Iterate the events of `events()` (a zero-argument generator function),
+        shared with any identical stream already in flight."""
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is None:
+                flight = self._streams[key] = _Flight()
+                self.leaders += 1
+                threading.Thread(target=self._produce, args=(key, flight, events), daemon=True).start()
+            else:
+                self.followers += 1
+        return flight.subscribe()
+
+    def _produce(self, key, flight, events):
+        try:
+            for event in events():
+                flight.publish(event)
+        finally:
+            with self._lock:
+                del self._streams[key]
+            flight.finish()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls) + len(self._streams)
+        return {'leaders': self.leaders, 'followers': self.followers, 'in_flight': in_flight}
+
+
+class _Flight:
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.changed = threading.Condition()
+
+    def publish(self, event):
+        with self.changed:
+            self.events.append(event)
+            self.changed.notify_all()
+
+    def finish(self):
+        with self.changed:
+            self.done = True
+            self.changed.notify_all()
+
+    def subscribe(self):
+        sent = 0
+        while True:
+            with self.changed:
+                while sent == len(self.events) and not self.done:
+                    self.changed.wait()
+                pending = self.events[sent:]
+                done = self.done
+            yield from pending
+            sent += len(pending)
+            if done and sent == len(self.events):
+                return
+
+
+class AsyncSingleFlight:
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self._tasks = set()
+        self.leaders = 0
+        self.followers = 0
+
+    async def call(self, key, fn):
+        """Await fn() (a coroutine function), or an identical call already in flight.
+
+        The shared call runs as its own task, so one caller going away does
+        not cancel it for the rest.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.get_running_loop().create_task(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def stream(self, key, events):
+        """Async iterator over `events()` (an async generator function), shared
+        with any identical stream already in flight."""
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = self._streams[key] = _AsyncFlight()
+            task = asyncio.get_running_loop().create_task(self._produce(key, flight, events))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return flight.subscribe()
+
+    async def _produce(self, key, flight, events):
+        try:
+            async for event in events():
+                flight.publish(event)
+        finally:
+            self._streams.pop(key, None)
+            flight.finish()
+
+    def stats(self):
+        return {
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'in_flight': len(self._calls) + len(self._streams)
+        }
+
+
+class _AsyncFlight:
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.changed = asyncio.Event()
+
+    def _notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, event):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self._notify()
+
+    async def subscribe(self):
+        sent = 0
+        while True:
+            while sent < len(self.events):
+                yield self.events[sent]
+                sent += 1
+            if self.done:
+                return
+            await self.changed.wait()
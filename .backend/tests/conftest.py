@@ -0,0 +1,77 @@
+"""
+Test setup: the backend's flat modules on sys.path, and an environment that
+never reaches a live upstream or the checked-in SQLite files.
+
+Module-level configuration is read from the environment on import, so it
+is fixed here, before any test module imports the backend.
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+import threading
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(TESTS_DIR)
+REPO_ROOT = os.path.dirname(BACKEND_DIR)
+DATA_DIR = os.path.join(TESTS_DIR, 'data')
+
+sys.path.insert(0, BACKEND_DIR)
+# attached_assets, as app.py imports it.
+sys.path.append(REPO_ROOT)
+
+_scratch = tempfile.mkdtemp(prefix='nevin-tests-')
+os.environ.update({
+    'NEVIN_PROVIDER': 'fake',
+    'NEVIN_SECONDARY_PROVIDER': '',
+    'NEVIN_FAKE_LATENCY': '0',
+    'NEVIN_FAKE_TOKEN_DELAY': '0',
+    'NEVIN_WARMUP': '0',
+    'NEVIN_RETRIEVAL': '0',
+    'NEVIN_RATE_BURST': '1000',
+    'NEVIN_BIBLE_VERSES': os.path.join(DATA_DIR, 'all_verses.json'),
+    'NEVIN_COMMENTARY_CACHE': os.path.join(_scratch, 'commentary_cache.sqlite3'),
+    'NEVIN_CONVERSATION_STORE': os.path.join(_scratch, 'conversations.sqlite3'),
+    'NEVIN_RESPONSE_CACHE_PATH': os.path.join(_scratch, 'response_cache.sqlite3'),
+    'NEVIN_SEMINAR_DIR': os.path.join(_scratch, 'seminars'),
+})
+os.environ.pop('ANTHROPIC_API_KEY', None)
+os.environ.pop('OPENAI_API_KEY', None)
+
+
+@pytest.fixture
+def flask_client():
+    from app import app
+    app.config['TESTING'] = True
+    return app.test_client()
+
+
+@pytest.fixture
+def mock_upstream():
+    """mock_upstream.MockUpstream on a local port, answering at once; yields (mock, URL).
+
+    Tests set its error rates, and point a provider at the URL.
+    """
+    pytest.importorskip('aiohttp')
+    from aiohttp import web
+    from mock_upstream import MockUpstream, create_app
+
+    mock = MockUpstream(latency=0, jitter=0, tokens_per_second=10000, output_tokens=20, seed=1)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(create_app(mock))
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = runner.addresses[0][1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield mock, f'http://127.0.0.1:{port}/v1/messages'
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -0,0 +1,165 @@
+import time
+import asyncio
+import logging
+import threading
+
+import pytest
+
+import admission
+from admission import AdmissionGate, AsyncAdmissionGate, Overloaded, RateLimiter, client_keys
+
+PROXY = '10.0.0.7'
+DEVICE_A = 'device-aaaaaaaa'
+DEVICE_B = 'device-bbbbbbbb'
+
+
+@pytest.fixture(autouse=True)
+def fresh_warning(monkeypatch):
+    monkeypatch.setattr(admission, '_proxy_warning_logged', False)
+
+
+def test_valid_device_id_replaces_the_ip_key():
+    assert client_keys(PROXY, None, DEVICE_A) == [f'device:{DEVICE_A}']
+
+
+def test_invalid_device_id_falls_back_to_the_ip():
+    assert client_keys(PROXY, None, 'short') == [f'ip:{PROXY}']
+
+
+def test_forwarded_for_is_ignored_without_proxy_hops():
+    assert client_keys('203.0.113.9', '198.51.100.1') == ['ip:203.0.113.9']
+
+
+def test_proxy_hops_pick_the_client_address(monkeypatch):
+    monkeypatch.setattr(admission, 'PROXY_HOPS', 1)
+    assert client_keys(PROXY, 'spoofed, 198.51.100.1') == ['ip:198.51.100.1']
+
+
+def test_proxied_requests_without_proxy_hops_warn_once(caplog):
+    with caplog.at_level(logging.WARNING):
+        client_keys(PROXY)
+        client_keys(PROXY)
+    assert sum('NEVIN_PROXY_HOPS' in record.message for record in caplog.records) == 1
+
+
+def test_direct_and_loopback_clients_do_not_warn(caplog):
+    with caplog.at_level(logging.WARNING):
+        client_keys('127.0.0.1')
+        client_keys('8.8.8.8')
+    assert not caplog.records
+
+
+def test_devices_behind_one_proxy_get_separate_buckets():
+    limiter = RateLimiter(per_minute=1, burst=2, max_clients=100)
+    for _ in range(2):
+        limiter.check(client_keys(PROXY, None, DEVICE_A))
+    with pytest.raises(Overloaded) as excinfo:
+        limiter.check(client_keys(PROXY, None, DEVICE_A))
+    assert excinfo.value.retry_after > 0
+    limiter.check(client_keys(PROXY, None, DEVICE_B))
+
+
+def test_burst_covers_back_to_back_moment_titles():
+    limiter = RateLimiter(per_minute=30, burst=20, max_clients=100)
+    for _ in range(10):
+        limiter.check(client_keys(PROXY, None, DEVICE_A))
+
+
+def test_endpoint_rate_limits_per_device(flask_client, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'rate_limiter', RateLimiter(per_minute=1, burst=1, max_clients=100))
+    body = {'conversation': 'Usuario: ¿Qué es la fe?'}
+
+    def post(device):
+        return flask_client.post('/api/nevin/generate-moment-title', json=body,
+                                 headers={'X-Device-Id': device})
+
+    assert post(DEVICE_A).status_code == 200
+    limited = post(DEVICE_A)
+    assert limited.status_code == 429
+    assert limited.headers['Retry-After']
+    assert post(DEVICE_B).status_code == 200
+
+
+def test_buckets_refill_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, 'monotonic', lambda: now[0])
+    limiter = RateLimiter(per_minute=60, burst=1, max_clients=100)
+    limiter.check(['ip:a'])
+    with pytest.raises(Overloaded) as excinfo:
+        limiter.check(['ip:a'])
+    assert excinfo.value.retry_after == pytest.approx(1)
+    now[0] += 1
+    limiter.check(['ip:a'])
+
+
+def test_a_rejected_request_takes_no_tokens():
+    limiter = RateLimiter(per_minute=1, burst=1, max_clients=100)
+    limiter.check(['ip:a'])
+    with pytest.raises(Overloaded):
+        limiter.check(['ip:b', 'ip:a'])
+    limiter.check(['ip:b'])
+
+
+def test_least_recent_clients_are_evicted():
+    limiter = RateLimiter(per_minute=1, burst=1, max_clients=2)
+    for key in ('ip:a', 'ip:b', 'ip:c'):
+        limiter.check([key])
+    assert limiter.stats() == {'clients': 2, 'limited': 0}
+    limiter.check(['ip:a'])
+
+
+def test_gate_sheds_when_the_queue_is_full():
+    gate = AdmissionGate(max_active=1, max_queue=0, wait=1)
+    gate.acquire()
+    with pytest.raises(Overloaded) as excinfo:
+        gate.acquire()
+    assert excinfo.value.reason == 'queue_full'
+    assert excinfo.value.retry_after == admission.ADMISSION_RETRY_AFTER
+    gate.release()
+    gate.acquire()
+    assert gate.stats() == {'active': 1, 'waiting': 0, 'shed': 1}
+
+
+def test_gate_sheds_requests_that_wait_too_long():
+    gate = AdmissionGate(max_active=1, max_queue=1, wait=0.05)
+    gate.acquire()
+    with pytest.raises(Overloaded) as excinfo:
+        gate.acquire()
+    assert excinfo.value.reason == 'queue_timeout'
+
+
+def test_gate_admits_a_queued_request_once_a_slot_frees():
+    gate = AdmissionGate(max_active=1, max_queue=1, wait=5)
+    gate.acquire()
+    admitted = threading.Event()
+
+    def queued():
+        gate.acquire()
+        admitted.set()
+
+    thread = threading.Thread(target=queued)
+    thread.start()
+    while gate.stats()['waiting'] == 0:
+        time.sleep(0.01)
+    gate.release()
+    thread.join()
+    assert admitted.is_set()
+    assert gate.stats() == {'active': 1, 'waiting': 0, 'shed': 0}
+
+
+def test_async_gate_queues_then_sheds():
+    async def run():
+        gate = AsyncAdmissionGate(max_active=1, max_queue=1, wait=0.05)
+        await gate.acquire()
+        reasons = []
+        for attempt in asyncio.as_completed([gate.acquire(), gate.acquire()]):
+            try:
+                await attempt
+            except Overloaded as e:
+                reasons.append(e.reason)
+        return sorted(reasons), gate.stats()
+
+    reasons, stats = asyncio.run(run())
+    assert reasons == ['queue_full', 'queue_timeout']
+    assert stats == {'active': 1, 'waiting': 0, 'shed': 2}
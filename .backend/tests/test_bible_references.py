@@ -0,0 +1,78 @@
+import pytest
+
+from bible_references import MAX_REFERENCES, find_references, resolve_references
+from bible_store import BibleStore
+
+BOOKS = [
+    {'id': 43, 'name': 'Juan', 'book_number': 43, 'testament': 'NT', 'chapters': 21},
+    {'id': 52, 'name': '1 Tesalonicenses', 'book_number': 52, 'testament': 'NT', 'chapters': 5},
+]
+
+
+def verse(book_id, chapter, number):
+    return {
+        'id': book_id * 1000 + chapter * 100 + number, 'book_id': book_id,
+        'chapter': chapter, 'verse': number,
+        'text_spanish': f'Texto {chapter}:{number}', 'text_tzotzil': f"Li k'op {chapter}:{number}",
+    }
+
+
+@pytest.fixture
+def store():
+    verses = [verse(43, 3, n) for n in range(1, 30)] + [verse(52, 4, n) for n in range(13, 19)]
+    return BibleStore(BOOKS, verses)
+
+
+def refs(text):
+    return [(r['book'], r['chapter'], r['verse'], r['verseEnd']) for r in find_references(text)]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Lee Juan 3:16.', [('Juan', 3, 16, None)]),
+    ('Ver 1 Tes. 4:16-17', [('1 Tesalonicenses', 4, 16, 17)]),
+    ('como dice 1cor 13:4', [('1 Corintios', 13, 4, None)]),
+    ('Génesis 1:1 y Éxodo 20:3', [('Génesis', 1, 1, None), ('Éxodo', 20, 3, None)]),
+    ('GÉNESIS 1 : 1', [('Génesis', 1, 1, None)]),
+    ('Mi 6:8', [('Miqueas', 6, 8, None)]),
+    ('mi. 6:8', [('Miqueas', 6, 8, None)]),
+])
+def test_references_are_found(text, expected):
+    assert refs(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    'mi 6:8 de la mañana',
+    'os 1:2',
+    'Juanito 3:16',
+    'Juan 316',
+])
+def test_words_and_times_are_not_references(text):
+    assert refs(text) == []
+
+
+def test_offsets_point_into_the_original_text():
+    text = 'Según Éxodo 20:3, sólo Dios.'
+    (reference,) = find_references(text)
+    assert text[reference['start']:reference['end']] == reference['text'] == 'Éxodo 20:3'
+
+
+def test_resolved_references_carry_their_verses(store):
+    (reference,) = resolve_references('Lee 1 Tes 4:16-17.', store)
+    assert [v['verse'] for v in reference['verses']] == [16, 17]
+    assert reference['verses'][0]['text'] == 'Texto 4:16'
+    assert reference['verses'][0]['text_tzotzil'] == "Li k'op 4:16"
+
+
+def test_unknown_passages_are_skipped(store):
+    assert resolve_references('Génesis 1:1 y Juan 30:1', store) == []
+
+
+def test_repeated_references_are_looked_up_once(store):
+    first, second = resolve_references('Juan 3:16 ... de nuevo Juan 3:16', store)
+    assert first['start'] != second['start']
+    assert first['verses'] is second['verses']
+
+
+def test_distinct_passages_are_capped(store):
+    text = ' '.join(f'Juan 3:{n}' for n in range(1, 30))
+    assert len(resolve_references(text, store)) == MAX_REFERENCES
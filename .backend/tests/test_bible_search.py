@@ -0,0 +1,68 @@
+import pytest
+
+from bible_search import BibleSearch, decode_cursor, fts_query
+from bible_store import BibleStore
+
+BOOKS = [
+    {'id': 1, 'name': 'Génesis', 'book_number': 1, 'testament': 'AT', 'chapters': 50},
+    {'id': 43, 'name': 'Juan', 'book_number': 43, 'testament': 'NT', 'chapters': 21},
+]
+SPANISH = [
+    'La gracia de Dios es grande',
+    'Por gracia sois salvos por medio de la fe',
+    'Gracia y paz a vosotros',
+    'La gracia del Señor sea con todos',
+    'En el principio creó Dios los cielos y la tierra',
+]
+
+
+def verse(i, text, book_id=43):
+    return {
+        'id': i + 1, 'book_id': book_id, 'chapter': 1, 'verse': i + 1,
+        'text_spanish': text, 'text_tzotzil': f"Li k'op {i}",
+    }
+
+
+@pytest.fixture
+def search():
+    verses = [verse(i, text, 1 if i == 4 else 43) for i, text in enumerate(SPANISH)]
+    return BibleSearch(BibleStore(BOOKS, verses))
+
+
+@pytest.mark.parametrize('query', ['gracia', 'grac*', "k'op"])
+def test_common_terms_keep_a_positive_relevance(search, query):
+    verses, _ = search.search(query)
+    assert verses
+    assert all(v['relevance'] > 0 for v in verses)
+    relevances = [v['relevance'] for v in verses]
+    assert relevances == sorted(relevances, reverse=True)
+
+
+def test_rarer_terms_rank_first(search):
+    verses, _ = search.search('gracia fe')
+    assert verses[0]['text'].startswith('Por gracia sois salvos')
+
+
+def test_keyset_pages_cover_every_match_once(search):
+    seen, cursor = [], None
+    while True:
+        page, cursor = search.search('grac*', limit=2, cursor=cursor)
+        seen.extend(v['id'] for v in page)
+        if cursor is None:
+            break
+    assert sorted(seen) == [1, 2, 3, 4]
+
+
+def test_book_and_testament_filters(search):
+    assert [v['book_id'] for v in search.search('Dios', book='Génesis')[0]] == [1]
+    assert {v['book_id'] for v in search.search('Dios', testament='NT')[0]} == {43}
+
+
+def test_user_operators_are_matched_as_text():
+    assert fts_query('gracia OR NOT "paz a"') == '"gracia" "OR" "NOT" "paz a"'
+    assert fts_query('*** ""') is None
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor('no-es-un-cursor')
@@ -0,0 +1,42 @@
+import os
+import sys
+import json
+import subprocess
+
+from conftest import REPO_ROOT
+from commentary_cache import CommentaryCache, prewarm
+from providers import get_llm_client
+
+JUAN_3_16 = {
+    'book': 'Juan', 'chapter': 3, 'verse': 16,
+    'textTzotzil': 'Yuʼun toj echʼem skʼanoj yalel balumil li Diose',
+    'textSpanish': 'Porque de tal manera amó Dios al mundo'
+}
+
+
+def test_get_ai_response_imports_the_backend_from_the_repo_root():
+    # A fresh interpreter without .backend on sys.path, as a host app would run it.
+    code = 'import json; from attached_assets import get_ai_response; print(json.dumps(get_ai_response("hola")))'
+    env = {**os.environ, 'PYTHONPATH': ''}
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    reply = json.loads(result.stdout.strip().splitlines()[-1])
+    assert reply['success'], result.stderr
+    assert reply['response'].startswith('Respuesta de prueba')
+
+
+def test_get_ai_response_uses_the_given_client():
+    from attached_assets import get_ai_response
+
+    class Failing:
+        def complete(self, endpoint, payload):
+            return 503, None
+
+    reply = get_ai_response('hola', client=Failing())
+    assert not reply['success']
+
+
+def test_prewarm_goes_through_the_provider_client(tmp_path):
+    cache = CommentaryCache(path=str(tmp_path / 'commentary.sqlite3'))
+    assert prewarm(cache, [JUAN_3_16], get_llm_client()) == 1
+    assert prewarm(cache, [JUAN_3_16], get_llm_client()) == 0
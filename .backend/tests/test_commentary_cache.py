@@ -0,0 +1,63 @@
+import pytest
+
+import commentary_cache
+from commentary_cache import CommentaryCache
+from nevin import verse_commentary_payload
+
+JUAN_3_16 = {
+    'book': 'Juan', 'chapter': 3, 'verse': 16,
+    'textTzotzil': 'Yuʼun toj echʼem skʼanoj yalel balumil li Diose',
+    'textSpanish': 'Porque de tal manera amó Dios al mundo'
+}
+
+
+def payload(verse=16, **fields):
+    return verse_commentary_payload({**JUAN_3_16, 'verse': verse, **fields})
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'commentary.sqlite3')
+
+
+def test_commentaries_are_served_from_the_cache(path):
+    cache = CommentaryCache(path=path)
+    assert cache.get(payload()) is None
+    cache.put(payload(), 'Juan 3:16', 'comentario')
+    assert cache.get(payload()) == 'comentario'
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+
+
+def test_different_verse_texts_do_not_share_a_commentary(path):
+    cache = CommentaryCache(path=path)
+    cache.put(payload(), 'Juan 3:16', 'comentario')
+    assert cache.get(payload(textSpanish='Porque Dios amó tanto al mundo')) is None
+
+
+def test_empty_commentaries_are_not_cached(path):
+    cache = CommentaryCache(path=path)
+    cache.put(payload(), 'Juan 3:16', '')
+    assert cache.stats()['entries'] == 0
+
+
+def test_expired_commentaries_are_dropped(path):
+    cache = CommentaryCache(path=path, ttl=-1)
+    cache.put(payload(), 'Juan 3:16', 'comentario')
+    assert cache.get(payload()) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_commentaries_are_evicted(path):
+    cache = CommentaryCache(path=path, max_entries=2)
+    cache.put(payload(16), 'Juan 3:16', 'a')
+    cache.put(payload(17), 'Juan 3:17', 'b')
+    assert cache.get(payload(16)) == 'a'
+    cache.put(payload(18), 'Juan 3:18', 'c')
+    assert cache.get(payload(17)) is None
+    assert cache.get(payload(16)) == 'a'
+
+
+def test_a_new_prompt_or_model_purges_old_commentaries(path, monkeypatch):
+    CommentaryCache(path=path).put(payload(), 'Juan 3:16', 'comentario')
+    monkeypatch.setattr(commentary_cache, 'prompt_fingerprint', lambda: 'otro')
+    assert CommentaryCache(path=path).stats()['entries'] == 0
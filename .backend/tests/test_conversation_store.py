@@ -0,0 +1,85 @@
+import pytest
+
+from conversation_store import (
+    ConversationStore,
+    conversation_context,
+    fold_turns,
+    valid_conversation_id,
+)
+
+
+def exchange(n, size=40):
+    return [
+        {'role': 'user', 'content': f'Pregunta {n}. ' + 'p' * size},
+        {'role': 'assistant', 'content': f'Respuesta {n}. ' + 'r' * size},
+    ]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ConversationStore(path=str(tmp_path / 'conversations.sqlite3'))
+
+
+def test_exchanges_are_replayed_in_order(store):
+    store.append('abc', 'hola', 'saludos')
+    store.append('abc', '¿y Juan 3:16?', 'habla del amor')
+    summary, turns = store.load('abc')
+    assert summary == ''
+    assert [t['content'] for t in turns] == ['hola', 'saludos', '¿y Juan 3:16?', 'habla del amor']
+
+
+def test_unknown_deleted_and_expired_conversations_are_empty(tmp_path, store):
+    assert store.load('nada') == ('', [])
+    store.append('abc', 'hola', 'saludos')
+    store.delete('abc')
+    assert store.load('abc') == ('', [])
+
+    expired = ConversationStore(path=str(tmp_path / 'expired.sqlite3'), ttl=-1)
+    expired.append('abc', 'hola', 'saludos')
+    assert expired.load('abc') == ('', [])
+
+
+def test_failed_replies_are_not_stored(store):
+    store.append('abc', 'hola', '')
+    assert store.stats() == {'conversations': 0}
+
+
+def test_old_exchanges_fold_into_the_summary():
+    turns = exchange(1) + exchange(2) + exchange(3)
+    summary, kept = fold_turns('', turns, history_budget=30, summary_budget=100)
+    assert kept == exchange(3)
+    assert summary.splitlines()[0] == '- Usuario: Pregunta 1.'
+    assert len(summary.splitlines()) == 4
+
+
+def test_the_latest_exchange_is_kept_however_long():
+    summary, kept = fold_turns('', exchange(1, size=1000), history_budget=10)
+    assert (summary, kept) == ('', exchange(1, size=1000))
+
+
+def test_the_summary_drops_its_oldest_lines():
+    turns = exchange(1) + exchange(2) + exchange(3)
+    summary, _ = fold_turns('', turns, history_budget=30, summary_budget=10)
+    assert summary.splitlines() == ['- Nevin: Respuesta 2.']
+
+
+@pytest.mark.parametrize('conversation_id, valid', [
+    ('abc-123_XYZ', True),
+    ('', False),
+    ('a' * 65, False),
+    ('../etc', False),
+    (42, False),
+])
+def test_conversation_ids_are_validated(conversation_id, valid):
+    assert valid_conversation_id(conversation_id) is valid
+
+
+def test_clients_sending_history_bypass_the_store(store):
+    data = {'message': 'hola', 'history': [{'role': 'user', 'content': 'antes'}]}
+    assert conversation_context(store, data) == (None, data)
+
+
+def test_new_conversations_get_an_id(store):
+    conversation_id, data = conversation_context(store, {'message': 'hola'})
+    assert valid_conversation_id(conversation_id)
+    assert data['history'] == [] and data['summary'] == ''
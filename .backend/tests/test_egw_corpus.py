@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import egw_corpus
+from egw_corpus import MappedEGWIndex, load_egw_index, source_fingerprint, write_corpus
+from egw_search import EGWIndex
+
+PAGES = [
+    {'page': 1, 'content': ['La gracia de Dios es suficiente para el pecador arrepentido.']},
+    {'page': 2, 'content': ['El sábado fue hecho por causa del hombre.']},
+]
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    books = tmp_path / 'books'
+    books.mkdir()
+    (books / 'Libro.json').write_text(json.dumps(PAGES), encoding='utf-8')
+    path = str(tmp_path / 'egw.bin')
+    monkeypatch.setattr(egw_corpus, 'EGW_BOOKS_DIR', str(books))
+    monkeypatch.setattr(egw_corpus, 'EGW_CORPUS_PATH', path)
+    write_corpus(EGWIndex.from_directory(str(books)), path, source_fingerprint(str(books)))
+    return books, path
+
+
+def test_mapped_index_matches_the_json_index(corpus):
+    books, path = corpus
+    mapped = MappedEGWIndex(path)
+    built = EGWIndex.from_directory(str(books))
+    assert mapped.search('gracia', 3) == built.search('gracia', 3)
+    assert mapped.fingerprint == source_fingerprint(str(books))
+
+
+def test_fresh_corpus_is_mapped(corpus):
+    assert isinstance(load_egw_index(), MappedEGWIndex)
+
+
+def test_changed_book_rebuilds_the_corpus(corpus):
+    books, path = corpus
+    pages = PAGES + [{'page': 3, 'content': ['Bienaventurados los mansos.']}]
+    (books / 'Libro.json').write_text(json.dumps(pages), encoding='utf-8')
+
+    index = load_egw_index()
+    assert not isinstance(index, MappedEGWIndex)
+    assert index.search('mansos', 3)
+    assert MappedEGWIndex(path).fingerprint == source_fingerprint(str(books))
+    assert isinstance(load_egw_index(), MappedEGWIndex)
+
+
+def test_tokenizer_change_invalidates_the_corpus(corpus, monkeypatch):
+    books, _ = corpus
+    before = source_fingerprint(str(books))
+    monkeypatch.setattr(egw_corpus, 'indexing_source', lambda: b'def tokenize(text): ...')
+    assert source_fingerprint(str(books)) != before
+    assert not isinstance(load_egw_index(), MappedEGWIndex)
+
+
+def test_old_format_is_rejected(corpus):
+    _, path = corpus
+    with open(path, 'r+b') as f:
+        f.seek(4)
+        f.write((1).to_bytes(4, 'little'))
+    with pytest.raises(ValueError):
+        MappedEGWIndex(path)
+    assert not isinstance(load_egw_index(), MappedEGWIndex)
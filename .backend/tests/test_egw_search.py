@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+import handlers
+from egw_search import EGWIndex
+
+PAGES = [
+    {'page': n, 'content': [f'La gracia de Dios, página {n}, alcanza al pecador arrepentido.']}
+    for n in range(1, 61)
+]
+
+
+@pytest.fixture
+def egw_index(tmp_path, monkeypatch):
+    (tmp_path / 'Libro.json').write_text(json.dumps(PAGES), encoding='utf-8')
+    index = EGWIndex.from_directory(str(tmp_path))
+    monkeypatch.setattr(handlers, 'get_egw_index', lambda: index)
+    return index
+
+
+def search(client, **body):
+    return client.post('/api/egw/search', json={'query': 'gracia', **body})
+
+
+@pytest.mark.parametrize('max_results', ['abc', '', [3], {'n': 3}, True])
+def test_non_numeric_max_results_is_a_bad_request(flask_client, egw_index, max_results):
+    response = search(flask_client, maxResults=max_results)
+    assert response.status_code == 400
+    assert response.get_json() == {'success': False, 'error': 'maxResults no válido'}
+
+
+@pytest.mark.parametrize('max_results, expected', [
+    (None, 3), ('5', 5), (0, 1), (-4, 1), (1000, 50), (2.9, 2),
+])
+def test_max_results_is_clamped(flask_client, egw_index, max_results, expected):
+    body = search(flask_client, maxResults=max_results).get_json()
+    assert body['success']
+    assert len(body['quotes']) == expected
+
+
+def test_non_string_query_is_a_bad_request(flask_client, egw_index):
+    assert flask_client.post('/api/egw/search', json={'query': 42}).status_code == 400
+
+
+def test_empty_query_returns_no_quotes(flask_client, egw_index):
+    body = flask_client.post('/api/egw/search', json={}).get_json()
+    assert body == {'success': True, 'quotes': []}
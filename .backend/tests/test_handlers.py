@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from handlers import CompletionStream, RequestError, title_batch, wants_stream
+
+# Bodies whose answers do not depend on upstream timing or cache state.
+REQUESTS = [
+    ('/api/nevin/chat', {}),
+    ('/api/nevin/chat', {'message': ''}),
+    ('/api/nevin/chat', {'message': 'hola', 'conversationId': '../x'}),
+    ('/api/nevin/verse-commentary', {}),
+    ('/api/nevin/generate-moment-title', {}),
+    ('/api/nevin/generate-moment-titles', {'conversations': 'no es lista'}),
+    ('/api/nevin/generate-moment-titles', {'conversations': []}),
+    ('/api/nevin/generate-moment-titles', {'conversations': [None, 7, '']}),
+    ('/api/egw/search', {'query': 'gracia', 'maxResults': 'abc'}),
+    ('/api/egw/search', {}),
+]
+
+
+def async_responses(requests):
+    from aiohttp.test_utils import TestClient, TestServer
+    from async_app import create_app
+
+    async def run():
+        client = TestClient(TestServer(create_app()))
+        await client.start_server()
+        try:
+            responses = []
+            for path, body in requests:
+                response = await client.post(path, json=body)
+                responses.append((response.status, await response.json()))
+            return responses
+        finally:
+            await client.close()
+
+    return asyncio.run(run())
+
+
+def test_both_servers_answer_alike(flask_client):
+    pytest.importorskip('aiohttp')
+    flask = [
+        (response.status_code, response.get_json())
+        for response in (flask_client.post(path, json=body) for path, body in REQUESTS)
+    ]
+    assert async_responses(REQUESTS) == flask
+
+
+def test_stream_error_is_relayed_once():
+    relay = CompletionStream('chat', {'model': 'claude-sonnet-4-20250514'}, 'falló')
+    assert relay.feed('delta', 'Hola') == ('delta', {'text': 'Hola'})
+    assert relay.feed('error', 'status 529') == ('error', {'success': False, 'error': 'falló'})
+    assert relay.closed and relay.failed
+
+
+def test_stream_done_carries_usage_and_extra():
+    relay = CompletionStream('chat', {'model': 'claude-sonnet-4-20250514'}, 'falló')
+    relay.feed('usage', {'input_tokens': 10})
+    relay.feed('delta', 'Hola ')
+    relay.feed('delta', 'mundo')
+    assert relay.feed('stop', None) is None
+    assert relay.closed and not relay.failed
+    assert relay.finish() == 'Hola mundo'
+    event, body = relay.done({'references': []})
+    assert event == 'done'
+    assert body['usage']['input_tokens'] == 10
+    assert body['references'] == []
+
+
+def test_wants_stream():
+    assert wants_stream({'stream': True}, None)
+    assert wants_stream({}, 'text/event-stream')
+    assert not wants_stream({}, 'application/json')
+
+
+def test_title_batch_rejects_oversized_batches(monkeypatch):
+    import handlers
+    monkeypatch.setattr(handlers, 'MOMENT_TITLE_BATCH_MAX', 2)
+    with pytest.raises(RequestError) as error:
+        title_batch({'conversations': ['a', 'b', 'c']})
+    assert error.value.status == 400
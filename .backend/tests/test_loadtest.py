@@ -0,0 +1,24 @@
+from loadtest import DEFAULT_SCENARIOS, compare, parse_args
+
+
+def test_default_scenarios_are_marked_as_defaults():
+    args = parse_args([])
+    assert args.default_scenarios
+    assert args.scenarios == DEFAULT_SCENARIOS.split(',')
+
+
+def test_explicit_scenarios_are_kept():
+    args = parse_args(['--scenarios', 'bible_search'])
+    assert not args.default_scenarios
+    assert args.scenarios == ['bible_search']
+
+
+def test_compare_flags_p95_and_throughput_regressions():
+    def result(p95, rps):
+        return {'scenario': 'chat', 'concurrency': 8, 'latency_ms': {'p95': p95}, 'rps': rps}
+
+    baseline = {'results': [result(100.0, 50.0)]}
+    slower = [result(130.0, 50.0)]
+    same = [result(101.0, 49.5)]
+    assert compare(slower, baseline, 10.0)
+    assert not compare(same, baseline, 10.0)
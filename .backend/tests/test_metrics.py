@@ -0,0 +1,79 @@
+import pytest
+
+import app
+import providers
+from metrics import MODEL_PRICES, TOKEN_PRICES, UPSTREAM_COST, UPSTREAM_ERRORS, record_usage, token_prices
+from nevin import chat_payload
+from providers import AnthropicProvider, LLMClient
+
+USAGE = {
+    'input_tokens': 1_000_000,
+    'output_tokens': 1_000_000,
+    'cache_creation_input_tokens': 0,
+    'cache_read_input_tokens': 0,
+}
+
+
+@pytest.mark.parametrize('model, expected', [
+    ('claude-sonnet-4-20250514', 'claude-sonnet-4'),
+    ('claude-3-5-haiku-20241022', 'claude-3-5-haiku'),
+    ('gpt-4o-mini-2024-07-18', 'gpt-4o-mini'),
+    ('gpt-4o-2024-08-06', 'gpt-4o'),
+])
+def test_models_are_priced_by_their_longest_prefix(model, expected):
+    assert token_prices(model) is MODEL_PRICES[expected]
+
+
+@pytest.mark.parametrize('model', [None, '', 'modelo-desconocido'])
+def test_unknown_models_get_the_default_prices(model):
+    assert token_prices(model) is TOKEN_PRICES
+
+
+def test_haiku_costs_less_than_sonnet():
+    record_usage('test_cost', USAGE, 'claude-3-5-haiku-20241022')
+    record_usage('test_cost', USAGE, 'claude-sonnet-4-20250514')
+    haiku = UPSTREAM_COST._values[('test_cost', 'claude-3-5-haiku-20241022')]
+    sonnet = UPSTREAM_COST._values[('test_cost', 'claude-sonnet-4-20250514')]
+    assert haiku == pytest.approx(4.8)
+    assert sonnet == pytest.approx(18)
+
+
+def errors(endpoint):
+    return {
+        error: count for (name, error), count in UPSTREAM_ERRORS._values.items()
+        if name == endpoint and count
+    }
+
+
+@pytest.fixture
+def anthropic_upstream(mock_upstream, monkeypatch):
+    mock, url = mock_upstream
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'test')
+    monkeypatch.setattr(providers, 'ANTHROPIC_API_URL', url)
+    monkeypatch.setattr(app, 'get_llm_client', lambda: LLMClient(AnthropicProvider()))
+    UPSTREAM_ERRORS._values.clear()
+    return mock
+
+
+def stream_chat():
+    return ''.join(app.stream_completion('chat', chat_payload({'message': 'hola'}), 'falló'))
+
+
+def test_stream_rejected_upstream_is_counted_once(anthropic_upstream):
+    anthropic_upstream.error_rate = 1.0
+    assert 'event: error' in stream_chat()
+    assert errors('chat') == {'status_500': 1}
+
+
+def test_stream_cut_off_upstream_is_counted_once(anthropic_upstream):
+    anthropic_upstream.stream_error_rate = 1.0
+    assert 'event: error' in stream_chat()
+    assert errors('chat') == {'stream': 1}
+
+
+def test_stream_usage_is_priced_for_the_requested_model(anthropic_upstream):
+    payload = chat_payload({'message': 'hola'})
+    before = UPSTREAM_COST._values.get(('chat', payload['model']), 0)
+    assert 'event: done' in ''.join(app.stream_completion('chat', payload, 'falló'))
+    assert UPSTREAM_COST._values[('chat', payload['model'])] > before
+    assert errors('chat') == {}
@@ -0,0 +1,36 @@
+from nevin import DEFAULT_MOMENT_TITLE, dedupe_conversations
+
+
+def test_duplicates_share_a_slot():
+    unique, slots, rejected = dedupe_conversations(['a', 'b', 'a'])
+    assert unique == ['a', 'b']
+    assert slots == [0, 1, 0]
+    assert rejected == {}
+
+
+def test_non_strings_and_blanks_are_rejected():
+    unique, slots, rejected = dedupe_conversations(['a', 3, None, '  ', {'x': 1}])
+    assert unique == ['a']
+    assert slots == [0, None, None, None, None]
+    assert set(rejected) == {1, 2, 3, 4}
+
+
+def test_batch_reports_invalid_conversations(flask_client):
+    body = flask_client.post('/api/nevin/generate-moment-titles', json={
+        'conversations': ['Hablamos de la gracia de Dios', 42, '', ['lista']]
+    }).get_json()
+    assert body['success']
+    assert len(body['results']) == 4
+    assert body['results'][0]['title'] != DEFAULT_MOMENT_TITLE
+    assert [result['title'] for result in body['results'][1:]] == [DEFAULT_MOMENT_TITLE] * 3
+    assert set(body['errors']) == {'1', '2', '3'}
+    assert body['errors']['1'] == 'La conversación debe ser texto'
+    assert body['errors']['2'] == 'La conversación está vacía'
+
+
+def test_batch_of_only_invalid_conversations(flask_client):
+    body = flask_client.post('/api/nevin/generate-moment-titles', json={
+        'conversations': [None, 7]
+    }).get_json()
+    assert body['success']
+    assert set(body['errors']) == {'0', '1'}
@@ -0,0 +1,163 @@
+import time
+import asyncio
+
+import pytest
+
+import providers
+import upstream
+from metrics import UPSTREAM_HEDGES
+from nevin import chat_payload, response_text
+from providers import AnthropicProvider, AsyncLLMClient, FakeProvider, LLMClient
+
+PAYLOAD = chat_payload({'message': 'hola'})
+
+
+class NamedProvider(FakeProvider):
+    """FakeProvider that signs its answers, so a test can tell who replied."""
+
+    def __init__(self, name, delay=0.0):
+        self.name = name
+        self.delay = delay
+
+    def reply(self, endpoint, payload):
+        return f'Respuesta de {self.name}'
+
+    def complete(self, endpoint, payload):
+        time.sleep(self.delay)
+        return super().complete(endpoint, payload)
+
+    def stream(self, endpoint, payload):
+        time.sleep(self.delay)
+        yield from super().stream(endpoint, payload)
+
+    async def acomplete(self, session, endpoint, payload):
+        await asyncio.sleep(self.delay)
+        return await super().acomplete(session, endpoint, payload)
+
+    async def astream(self, session, endpoint, payload):
+        await asyncio.sleep(self.delay)
+        async for event in super().astream(session, endpoint, payload):
+            yield event
+
+
+class FailingProvider(FakeProvider):
+    name = 'failing'
+
+    def complete(self, endpoint, payload):
+        return 500, None
+
+    def stream(self, endpoint, payload):
+        yield 'error', 'status 500'
+
+    async def acomplete(self, session, endpoint, payload):
+        return 500, None
+
+    async def astream(self, session, endpoint, payload):
+        yield 'error', 'status 500'
+
+
+def hedges(endpoint):
+    return {
+        outcome: count for (name, outcome), count in UPSTREAM_HEDGES._values.items()
+        if name == endpoint and count
+    }
+
+
+def streamed_text(events):
+    return ''.join(value for kind, value in events if kind == 'delta').strip()
+
+
+@pytest.fixture(autouse=True)
+def quick_hedge(monkeypatch):
+    monkeypatch.setattr(providers, 'HEDGE_DEFAULT_SECONDS', 0.05)
+    UPSTREAM_HEDGES._values.clear()
+
+
+def test_healthy_primary_answers():
+    client = LLMClient(NamedProvider('primaria'), NamedProvider('secundaria'))
+    status, result = client.complete('chat', PAYLOAD)
+    assert status == 200
+    assert response_text(result) == 'Respuesta de primaria'
+    assert hedges('chat') == {'primary': 1}
+
+
+def test_failing_primary_fails_over_to_the_secondary():
+    client = LLMClient(FailingProvider(), NamedProvider('secundaria'), hedge=False)
+    status, result = client.complete('chat', PAYLOAD)
+    assert status == 200
+    assert response_text(result) == 'Respuesta de secundaria'
+    assert hedges('chat') == {'failover': 1}
+
+
+def test_slow_primary_is_hedged_by_the_secondary():
+    client = LLMClient(NamedProvider('primaria', delay=1), NamedProvider('secundaria'))
+    started = time.perf_counter()
+    _, result = client.complete('chat', PAYLOAD)
+    assert response_text(result) == 'Respuesta de secundaria'
+    assert time.perf_counter() - started < 0.5
+    assert hedges('chat') == {'hedge_secondary': 1}
+
+
+def test_stream_fails_over_before_the_first_token():
+    client = LLMClient(FailingProvider(), NamedProvider('secundaria'), hedge=False)
+    events = list(client.stream('chat', PAYLOAD))
+    assert streamed_text(events) == 'Respuesta de secundaria'
+    assert events[-1] == ('stop', None)
+    assert hedges('chat') == {'failover': 1}
+
+
+def test_slow_stream_is_hedged_by_the_secondary():
+    client = LLMClient(NamedProvider('primaria', delay=1), NamedProvider('secundaria'))
+    assert streamed_text(client.stream('chat', PAYLOAD)) == 'Respuesta de secundaria'
+    assert hedges('chat') == {'hedge_secondary': 1}
+
+
+def test_stream_reports_the_error_when_every_provider_fails():
+    client = LLMClient(FailingProvider(), FailingProvider(), hedge=False)
+    assert list(client.stream('chat', PAYLOAD)) == [('error', 'status 500')]
+
+
+def test_async_client_fails_over_and_hedges():
+    async def run():
+        failing = AsyncLLMClient(None, FailingProvider(), NamedProvider('secundaria'), hedge=False)
+        slow = AsyncLLMClient(None, NamedProvider('primaria', delay=1), NamedProvider('secundaria'))
+        _, result = await failing.complete('chat', PAYLOAD)
+        events = [event async for event in slow.stream('chat', PAYLOAD)]
+        return response_text(result), streamed_text(events)
+
+    assert asyncio.run(run()) == ('Respuesta de secundaria', 'Respuesta de secundaria')
+    assert hedges('chat') == {'failover': 1, 'hedge_secondary': 1}
+
+
+@pytest.fixture
+def anthropic(mock_upstream, monkeypatch):
+    mock, url = mock_upstream
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'test')
+    monkeypatch.setattr(providers, 'ANTHROPIC_API_URL', url)
+    monkeypatch.setattr(upstream, 'BACKOFF_BASE', 0)
+    return mock, AnthropicProvider()
+
+
+def test_anthropic_provider_completes_and_streams(anthropic):
+    mock, provider = anthropic
+    status, result = provider.complete('chat', PAYLOAD)
+    assert status == 200
+    assert len(response_text(result).split()) == mock.output_tokens
+    events = list(provider.stream('chat', PAYLOAD))
+    assert streamed_text(events) == response_text(result)
+    assert any(kind == 'usage' for kind, _ in events)
+
+
+def test_overloaded_upstream_is_retried_then_reported(anthropic):
+    mock, provider = anthropic
+    mock.overload_rate = 1.0
+    assert provider.complete('chat', PAYLOAD) == (529, None)
+    assert mock.counts['overloads'] == upstream.UPSTREAM_MAX_RETRIES + 1
+
+
+def test_overloaded_anthropic_fails_over_to_the_secondary(anthropic):
+    mock, provider = anthropic
+    mock.overload_rate = 1.0
+    client = LLMClient(provider, NamedProvider('secundaria'), hedge=False)
+    _, result = client.complete('chat', PAYLOAD)
+    assert response_text(result) == 'Respuesta de secundaria'
@@ -0,0 +1,71 @@
+import pytest
+
+from response_cache import ResponseCache, cache_variant, normalize_question
+
+# Questions that share their content words but ask different things.
+DISTINCT_PAIRS = [
+    ('¿Quién es Jesús?', '¿Dónde está Jesús?'),
+    ('¿Por qué murió Jesús?', '¿Cuándo murió Jesús?'),
+    ('¿Es pecado guardar el sábado?', '¿Es pecado no guardar el sábado?'),
+    ('¿Qué dice la Biblia sobre el perdón?', '¿Qué dice la Biblia contra el perdón?'),
+]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / 'responses.sqlite3'))
+
+
+@pytest.fixture
+def fuzzy_cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / 'responses.sqlite3'), similarity=0.5)
+
+
+def test_accents_case_and_punctuation_share_a_key(cache):
+    cache.put('¿Qué dice la Biblia sobre el sábado?', 'respuesta', [])
+    assert cache.get('que dice la biblia sobre el sabado') == ('respuesta', [])
+
+
+@pytest.mark.parametrize('first, second', DISTINCT_PAIRS)
+def test_different_questions_get_different_keys(first, second):
+    assert normalize_question(first) != normalize_question(second)
+
+
+@pytest.mark.parametrize('first, second', DISTINCT_PAIRS)
+def test_different_questions_do_not_share_answers(cache, first, second):
+    cache.put(first, 'primera', [])
+    assert cache.get(second) is None
+    assert cache.get(first) == ('primera', [])
+
+
+@pytest.mark.parametrize('first, second', DISTINCT_PAIRS)
+def test_near_matches_keep_the_question_frame(fuzzy_cache, first, second):
+    fuzzy_cache.put(first, 'primera', [])
+    assert fuzzy_cache.get(second) is None
+
+
+def test_near_match_accepts_a_rewording(fuzzy_cache):
+    fuzzy_cache.put('¿Qué dice la Biblia sobre el perdón?', 'perdón', [])
+    assert fuzzy_cache.get('¿Qué enseña la Biblia sobre el perdón?') == ('perdón', [])
+    assert fuzzy_cache.stats()['near_hits'] == 1
+
+
+def test_variants_do_not_share_answers(cache):
+    cache.put('¿Quién es Jesús?', 'con fuentes', [], cache_variant(True))
+    assert cache.get('¿Quién es Jesús?', cache_variant(False)) is None
+    assert cache.get('¿Quién es Jesús?', cache_variant(True)) == ('con fuentes', [])
+
+
+def test_purge_drops_every_variant(cache):
+    cache.put('¿Quién es Jesús?', 'a', [], cache_variant(True))
+    cache.put('¿Quién es Jesús?', 'b', [], cache_variant(False))
+    assert cache.purge('quien es jesus') == 2
+
+
+@pytest.mark.parametrize('first, second', DISTINCT_PAIRS[:2])
+def test_chat_does_not_serve_another_questions_answer(flask_client, first, second):
+    flask_client.post('/api/nevin/chat', json={'message': first})
+    body = flask_client.post('/api/nevin/chat', json={'message': second}).get_json()
+    assert body['success']
+    assert not body.get('cached')
+    assert second in body['response']
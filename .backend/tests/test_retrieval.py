@@ -0,0 +1,91 @@
+import json
+import threading
+
+import pytest
+
+import handlers
+import retrieval
+from egw_search import EGWIndex
+from retrieval import Retriever, is_contents_page
+
+PROSE = (
+    'La gracia de Dios alcanza al pecador arrepentido y transforma su corazón. '
+    'Cristo ofrece perdón a todos los que vienen a él con fe sincera, y su amor '
+    'no conoce límites... El que cree en él recibe vida nueva, paz y esperanza '
+    'para cada día, y aprende a servir a otros con humildad y gratitud constante.'
+)
+CONTENTS = ['Índice general'] + [
+    f'La gracia de Dios y el perdón del pecador, capítulo {n} . . . . . . . . . . . . . . {n * 7}'
+    for n in range(1, 16)
+]
+
+
+class NoBible:
+    def __len__(self):
+        return 0
+
+
+def test_contents_pages_are_recognized():
+    assert is_contents_page(CONTENTS)
+    assert is_contents_page(['Prefacio ......................................... 11'] * 10)
+
+
+def test_prose_with_ellipses_is_kept():
+    assert not is_contents_page([PROSE])
+    assert not is_contents_page(['“Apacentad la grey de Dios.... teniendo cuidado de ella.” ' + PROSE])
+
+
+def test_contents_pages_are_never_retrieved(tmp_path):
+    pages = [{'page': 1, 'content': CONTENTS}, {'page': 2, 'content': [PROSE, PROSE]}]
+    (tmp_path / 'Libro.json').write_text(json.dumps(pages), encoding='utf-8')
+    retriever = Retriever(EGWIndex.from_directory(str(tmp_path)), NoBible())
+    sources = retriever.retrieve('¿Cómo alcanza la gracia de Dios al pecador?', token_budget=10_000)
+    assert [source['reference'] for source in sources] == ['Libro, p. 2']
+
+
+@pytest.fixture
+def retrieval_on(monkeypatch):
+    monkeypatch.setattr(handlers, 'RETRIEVAL_ENABLED', True)
+    monkeypatch.setattr(retrieval, '_retriever', None)
+    monkeypatch.setattr(retrieval, '_loader', None)
+
+
+def test_chat_does_not_wait_for_the_retriever(retrieval_on, monkeypatch):
+    building = threading.Event()
+    release = threading.Event()
+
+    def slow_build():
+        building.set()
+        release.wait(5)
+        raise RuntimeError('still loading')
+
+    monkeypatch.setattr(retrieval, 'get_retriever', slow_build)
+    try:
+        assert handlers.retrieve_sources({'message': '¿Qué es la gracia?'}) is None
+        assert building.wait(5)
+        # A second request does not start a second build.
+        assert handlers.retrieve_sources({'message': '¿Qué es la gracia?'}) is None
+        assert retrieval._loader is not None
+    finally:
+        release.set()
+        retrieval._loader.join(5)
+    assert retrieval._loader is None
+
+
+def test_ungrounded_answers_are_not_cached_while_loading(retrieval_on, monkeypatch, flask_client):
+    monkeypatch.setattr(retrieval, 'load_retriever_in_background', lambda: None)
+    monkeypatch.setattr(handlers, 'load_retriever_in_background', lambda: None)
+    question = {'message': '¿Qué enseña Romanos 5 sobre la paz con Dios?'}
+    first = flask_client.post('/api/nevin/chat', json=question).get_json()
+    second = flask_client.post('/api/nevin/chat', json=question).get_json()
+    assert first['success'] and first['sources'] == []
+    assert not second.get('cached')
+
+
+def test_loaded_retriever_is_used(retrieval_on, monkeypatch):
+    class Loaded:
+        def retrieve(self, question):
+            return [{'type': 'egw', 'reference': 'Libro, p. 2', 'text': PROSE}]
+
+    monkeypatch.setattr(retrieval, '_retriever', Loaded())
+    assert handlers.retrieve_sources({'message': 'gracia'})[0]['reference'] == 'Libro, p. 2'
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return 'respuesta'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.call('k', fn)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.followers < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['respuesta'] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {'leaders': 1, 'followers': 4, 'in_flight': 0}
+
+
+def test_failures_reach_every_caller_and_are_not_kept():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError('falló')
+
+    with pytest.raises(ValueError):
+        flight.call('k', fail)
+    assert flight.call('k', lambda: 'de nuevo') == 'de nuevo'
+
+
+def test_late_stream_subscriber_replays_the_whole_stream():
+    flight = SingleFlight()
+    halfway = threading.Event()
+    resume = threading.Event()
+
+    def events():
+        yield 'uno'
+        yield 'dos'
+        halfway.set()
+        resume.wait(5)
+        yield 'tres'
+
+    first = flight.stream('k', events)
+    assert next(first) == 'uno'
+    halfway.wait(5)
+    late = flight.stream('k', events)
+    resume.set()
+
+    assert ['uno', *first] == ['uno', 'dos', 'tres']
+    assert list(late) == ['uno', 'dos', 'tres']
+    assert flight.stats() == {'leaders': 1, 'followers': 1, 'in_flight': 0}
+
+
+def test_async_calls_and_streams_are_shared():
+    async def run():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'respuesta'
+
+        async def events():
+            for word in ('uno', 'dos', 'tres'):
+                await asyncio.sleep(0.01)
+                yield word
+
+        async def collect(stream):
+            return [event async for event in stream]
+
+        results = await asyncio.gather(*(flight.call('k', fn) for _ in range(3)))
+        streams = await asyncio.gather(*(collect(flight.stream('s', events)) for _ in range(2)))
+        return results, calls, streams, flight.stats()
+
+    results, calls, streams, stats = asyncio.run(run())
+    assert results == ['respuesta'] * 3
+    assert len(calls) == 1
+    assert streams == [['uno', 'dos', 'tres']] * 2
+    assert stats == {'leaders': 2, 'followers': 3, 'in_flight': 0}
@@ -0,0 +1,45 @@
+import pytest
+
+import bible_store
+from warmup import Warmup
+
+
+@pytest.fixture
+def no_verse_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(bible_store, 'BIBLE_VERSES_PATH', str(tmp_path / 'missing.json'))
+    monkeypatch.setattr(bible_store, '_store', None)
+
+
+def warmed(tasks):
+    warmup = Warmup(tasks, enabled=True)
+    warmup.run()
+    return warmup
+
+
+def test_ready_without_verse_data_reports_bible_store_degraded(no_verse_file):
+    warmup = warmed([('bible_store', bible_store.require_bible_store), ('other', lambda: None)])
+    stats = warmup.stats()
+    assert warmup.ready
+    assert stats['degraded'] == ['bible_store']
+    assert stats['tasks']['other']['status'] == 'ready'
+    assert 'missing.json' in stats['tasks']['bible_store']['error']
+
+
+def test_health_ready_without_verse_data(no_verse_file, monkeypatch, flask_client):
+    import app
+    monkeypatch.setattr(app, 'warmup', warmed([('bible_store', bible_store.require_bible_store)]))
+    response = flask_client.get('/api/health/ready')
+    assert response.status_code == 200
+    assert response.get_json()['degraded'] == ['bible_store']
+
+
+def test_not_ready_until_finished():
+    warmup = Warmup([('slow', lambda: None)], enabled=True)
+    assert not warmup.ready
+    warmup.run()
+    assert warmup.ready
+    assert warmup.stats()['degraded'] == []
+
+
+def test_disabled_warmup_is_ready_at_once():
+    assert Warmup([('never', lambda: None)], enabled=False).ready
@@ -0,0 +1,50 @@
+"""
+Spanish text normalization shared by the search and matching modules.
+"""
+
+import re
+import unicodedata
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Folded (accentless, lowercase) Spanish function words.
+SPANISH_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bajo bien cada casi
+como con contra cual cuales cuando de del desde donde dos el ella ellas ello ellos en entre
+era eran eres es esa esas ese eso esos esta estaba estaban estado estan estar estas este esto
+estos fue fueron ha habia haber han has hasta hay he la las le les lo los mas me mi mis mucho
+muy nada ni no nos nosotros o os otra otras otro otros para pero poco por porque que quien
+quienes se sea ser si sido sin sobre son su sus tambien tan tanto te tiene tienen todo todos
+tu tus un una unas uno unos usted ustedes y ya yo
+""".split())
+
+
+def fold(text):
+    """Lowercase and strip diacritics ("Oración" -> "oracion")."""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+# Proper names that only look plural.
+STEM_EXCEPTIONS = frozenset(['dios', 'jesus', 'moises', 'judas', 'lucas', 'marcos', 'tomas', 'pues'])
+
+
+def stem(token):
+    """Very light Spanish plural stripping so "oraciones" and "oracion" share a term."""
+    if token in STEM_EXCEPTIONS:
+        return token
+    if len(token) > 4 and token.endswith('ces'):
+        return token[:-3] + 'z'
+    if len(token) > 4 and token.endswith('es') and token[-3] not in 'aeiou':
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and token[-2] in 'aeiou':
+        return token[:-1]
+    return token
+
+
+def tokenize(text, drop_stopwords=True, stopwords=SPANISH_STOPWORDS):
+    """Fold, split on word characters, drop stopwords and stem."""
+    tokens = TOKEN_RE.findall(fold(text))
+    if drop_stopwords:
+        tokens = [t for t in tokens if t not in stopwords]
+    return [stem(t) for t in tokens]
@@ -0,0 +1,173 @@
+"""
+Shared upstream HTTP client for the AI providers.
+
+One pooled keep-alive session per process, per-endpoint timeouts and
+retries with jittered exponential backoff for overload responses.
+post_upstream() serves the threaded app, send_upstream() the asyncio one
+(with the caller's aiohttp session).
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import UPSTREAM_TTFB_SECONDS, record_upstream_error
+
+UPSTREAM_POOL_SIZE = int(os.environ.get('NEVIN_UPSTREAM_POOL_SIZE', '32'))
+UPSTREAM_MAX_RETRIES = int(os.environ.get('NEVIN_UPSTREAM_RETRIES', '2'))
+UPSTREAM_CONNECT_TIMEOUT = 5
+
+# Read timeout (seconds) for each endpoint's upstream call.
+UPSTREAM_TIMEOUTS = {
+    'chat': 60,
+    'moment_title': 30,
+    'verse_commentary': 90,
+}
+
+# 429 = rate limited, 529 = provider overloaded.
+RETRY_STATUSES = {429, 529}
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def anthropic_headers(api_key):
+    return {
+        'Content-Type': 'application/json',
+        'x-api-key': api_key,
+        'anthropic-version': '2023-06-01'
+    }
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=UPSTREAM_POOL_SIZE,
+                    max_retries=0
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than a provider Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+def post_upstream(endpoint, url, headers, body, stream=False):
+    """POST through the pooled session, retrying 429/529.
+
+    Records time to the final response's headers (earlier attempts and
+    backoff included) and failures by class in the metrics.
+    """
+    session = get_session()
+    timeout = (UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_TIMEOUTS[endpoint])
+
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt_started = time.perf_counter()
+        try:
+            response = session.post(
+                url,
+                headers=headers,
+                json=body,
+                stream=stream,
+                timeout=timeout
+            )
+        except requests.ConnectionError as e:
+            if attempt >= UPSTREAM_MAX_RETRIES:
+                record_upstream_error(
+                    endpoint, 'timeout' if isinstance(e, requests.Timeout) else 'connection'
+                )
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f'Upstream connection error on {endpoint}, retrying in {delay:.2f}s')
+        except requests.Timeout:
+            record_upstream_error(endpoint, 'timeout')
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt >= UPSTREAM_MAX_RETRIES:
+                UPSTREAM_TTFB_SECONDS.observe(
+                    attempt_started - started + response.elapsed.total_seconds(), endpoint
+                )
+                if not response.ok:
+                    record_upstream_error(endpoint, f'status_{response.status_code}')
+                return response
+            delay = backoff_delay(attempt, response.headers.get('retry-after'))
+            response.close()
+            logging.warning(
+                f'Upstream {response.status_code} on {endpoint}, retrying in {delay:.2f}s'
+            )
+
+        time.sleep(delay)
+        attempt += 1
+
+
+async def send_upstream(session, endpoint, url, headers, body, stream=False):
+    """aiohttp POST retrying 429/529 and connection failures, like post_upstream.
+
+    Read timeouts are not retried. The caller must release the response.
+    """
+    import aiohttp
+
+    if stream:
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=UPSTREAM_CONNECT_TIMEOUT, sock_read=UPSTREAM_TIMEOUTS[endpoint]
+        )
+    else:
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=UPSTREAM_CONNECT_TIMEOUT, total=UPSTREAM_TIMEOUTS[endpoint]
+        )
+
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            response = await session.post(url, headers=headers, json=body, timeout=timeout)
+        except aiohttp.ClientConnectionError as e:
+            # Socket read timeouts are connection errors too; only connect
+            # timeouts are safe to retry, as with requests.ConnectTimeout.
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if attempt >= UPSTREAM_MAX_RETRIES or (
+                    timed_out and not isinstance(e, aiohttp.ConnectionTimeoutError)):
+                record_upstream_error(endpoint, 'timeout' if timed_out else 'connection')
+                raise
+            delay = backoff_delay(attempt)
+            logging.warning(f'Upstream connection error on {endpoint}, retrying in {delay:.2f}s')
+        except asyncio.TimeoutError:
+            record_upstream_error(endpoint, 'timeout')
+            raise
+        else:
+            if response.status not in RETRY_STATUSES or attempt >= UPSTREAM_MAX_RETRIES:
+                UPSTREAM_TTFB_SECONDS.observe(time.perf_counter() - started, endpoint)
+                if response.status >= 400:
+                    record_upstream_error(endpoint, f'status_{response.status}')
+                return response
+            delay = backoff_delay(attempt, response.headers.get('retry-after'))
+            response.release()
+            logging.warning(f'Upstream {response.status} on {endpoint}, retrying in {delay:.2f}s')
+
+        await asyncio.sleep(delay)
+        attempt += 1
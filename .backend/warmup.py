@@ -0,0 +1,98 @@
+"""
+Background warm-up of the lazily loaded corpora and clients.
+
+The Bible store and search index, the EGW index, the retriever and the
+local titler are all built on first use. A serving process starts a Warmup
+thread as soon as it is up, so those first uses are paid before traffic
+arrives while health checks answer immediately: /api/health/live is plain
+liveness, /api/health/ready returns 503 until the warm-up has finished.
+
+A task that fails is reported and left to load lazily on its next use; it
+does not keep the process out of rotation, as most endpoints do not need
+it. Failed tasks are listed under "degraded" in the readiness report: a
+missing Bible verse file shows up there as a failed bible_store while
+chat, commentary and titles keep serving. NEVIN_WARMUP=0 skips the warm-up
+entirely (the process reports ready at once).
+"""
+
+import os
+import time
+import logging
+import threading
+
+from bible_store import require_bible_store
+from bible_search import get_bible_search
+from egw_search import get_egw_index
+from moment_titler import MOMENT_TITLE_MODE, get_moment_titler
+from retrieval import RETRIEVAL_ENABLED, get_retriever
+
+WARMUP_ENABLED = os.environ.get('NEVIN_WARMUP', '1') != '0'
+
+
+def default_warmup_tasks():
+    """(name, loader) pairs for everything both serving paths load lazily."""
+    tasks = [
+        ('bible_store', require_bible_store),
+        ('bible_search', get_bible_search),
+        ('egw_index', get_egw_index),
+    ]
+    if RETRIEVAL_ENABLED:
+        tasks.append(('retriever', get_retriever))
+    if MOMENT_TITLE_MODE != 'llm':
+        tasks.append(('moment_titler', get_moment_titler))
+    return tasks
+
+
+class Warmup:
+
+    def __init__(self, tasks, enabled=WARMUP_ENABLED):
+        self.tasks = list(tasks)
+        self.enabled = enabled
+        self.finished = not enabled
+        self.started_at = None
+        self.status = {name: {'status': 'pending'} for name, _ in self.tasks}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the warm-up thread once; later calls do nothing."""
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self.run, name='nevin-warmup', daemon=True)
+        self._thread.start()
+
+    def run(self):
+        started = time.perf_counter()
+        for name, load in self.tasks:
+            with self._lock:
+                self.status[name] = {'status': 'loading'}
+            task_started = time.perf_counter()
+            try:
+                load()
+                outcome = {'status': 'ready'}
+            except Exception as e:
+                logging.error(f'Warm-up of {name} failed: {e}')
+                outcome = {'status': 'failed', 'error': str(e)}
+            outcome['seconds'] = round(time.perf_counter() - task_started, 3)
+            with self._lock:
+                self.status[name] = outcome
+        with self._lock:
+            self.finished = True
+        logging.info(f'Warm-up finished in {time.perf_counter() - started:.2f}s')
+
+    @property
+    def ready(self):
+        return self.finished
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.finished,
+                'degraded': sorted(
+                    name for name, state in self.status.items() if state['status'] == 'failed'
+                ),
+                'enabled': self.enabled,
+                'tasks': {name: dict(state) for name, state in self.status.items()}
+            }
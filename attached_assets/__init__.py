@@ -1,8 +1,33 @@
 """
 Attached assets package for Nevin AI system.
 Contains AI response handlers and chat request utilities.
+
+Submodules are imported on first attribute access, so importing the package
+does not load the backend's provider client.
 """
 
-from .chat_request import get_ai_response
+import importlib
+
+_EXPORTS = {
+    'detect_emotion': 'chat_request',
+    'detect_emotions_batch': 'chat_request',
+    'get_ai_response': 'chat_request',
+    'seminar_blueprint': 'seminar_jobs',
+    'seminar_job_status': 'seminar_jobs',
+    'submit_seminar': 'seminar_jobs',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ['get_ai_response']
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,39 +1,89 @@
 import os
+import re
+import sys
+import bisect
 import logging
-from datetime import datetime
-from typing import Dict, Any, List
-from openai import OpenAI, OpenAIError
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+import unicodedata
+from typing import Dict, Any, Iterable, List
+
+from .seminar_jobs import submit_seminar
+
+# Logging is configured by the host application, not on import.
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai_client = OpenAI()  # This will automatically use OPENAI_API_KEY from environment
+# The provider client and prompt helpers live in the backend's flat modules.
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.backend')
+
+EMOTION_PATTERNS = {
+    'tristeza': ['triste', 'deprimido', 'solo', 'dolor', 'pena', 'angustia', 'desesperado'],
+    'desmotivación': ['cansado', 'sin ganas', 'difícil', 'no puedo', 'rendirme', 'fracaso'],
+    'búsqueda_motivación': ['ayuda', 'necesito fuerza', 'animo', 'esperanza', 'consejo'],
+    'preocupación': ['preocupado', 'ansioso', 'miedo', 'inquieto', 'nervioso']
+}
+
+def _fold(text: str) -> str:
+    """Lowercase and strip accents so 'Ánimo' and 'animo' compare equal."""
+    return unicodedata.normalize('NFKD', text.lower()).encode('ascii', 'ignore').decode('ascii')
+
+def _compile_emotion_matcher(patterns: Dict[str, List[str]]):
+    """Build one word-bounded regex over every keyword and a keyword -> emotion map."""
+    keyword_emotion = {}
+    for emotion, keywords in patterns.items():
+        for keyword in keywords:
+            keyword_emotion[_fold(keyword)] = emotion
+    # Longest first so multi-word keywords win over their prefixes
+    alternatives = sorted(keyword_emotion, key=len, reverse=True)
+    pattern = r'\b(?:' + '|'.join(
+        r'\s+'.join(re.escape(word) for word in keyword.split()) for keyword in alternatives
+    ) + r')\b'
+    return re.compile(pattern), keyword_emotion
+
+_EMOTION_RE, _KEYWORD_EMOTION = _compile_emotion_matcher(EMOTION_PATTERNS)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def _score_emotions(matched_keywords) -> Dict[str, float]:
+    counts = {emotion: 0 for emotion in EMOTION_PATTERNS}
+    for keyword in matched_keywords:
+        counts[_KEYWORD_EMOTION[keyword]] += 1
+    return {
+        emotion: counts[emotion] / len(keywords) if counts[emotion] > 0 else 0.0
+        for emotion, keywords in EMOTION_PATTERNS.items()
+    }
 
 def detect_emotion(text: str) -> Dict[str, float]:
     """Detect emotions in the input text."""
-    emotion_patterns = {
-        'tristeza': ['triste', 'deprimido', 'solo', 'dolor', 'pena', 'angustia', 'desesperado'],
-        'desmotivación': ['cansado', 'sin ganas', 'difícil', 'no puedo', 'rendirme', 'fracaso'],
-        'búsqueda_motivación': ['ayuda', 'necesito fuerza', 'animo', 'esperanza', 'consejo'],
-        'preocupación': ['preocupado', 'ansioso', 'miedo', 'inquieto', 'nervioso']
-    }
-    
-    text_lower = text.lower()
-    emotions = {}
-    
-    for emotion, keywords in emotion_patterns.items():
-        score = sum(1 for keyword in keywords if keyword in text_lower)
-        emotions[emotion] = score / len(keywords) if score > 0 else 0.0
-    
-    return emotions
+    matched = {_WHITESPACE_RE.sub(' ', m) for m in _EMOTION_RE.findall(_fold(text))}
+    return _score_emotions(matched)
+
+def detect_emotions_batch(texts: Iterable[str]) -> List[Dict[str, float]]:
+    """Detect emotions for many messages with one fold and one regex pass over all of them."""
+    texts = list(texts)
+    if not texts:
+        return []
+    folded = _fold('\0'.join(text.replace('\0', ' ') for text in texts))
+    starts = [0]
+    separator = folded.find('\0')
+    while separator != -1:
+        starts.append(separator + 1)
+        separator = folded.find('\0', separator + 1)
+
+    matched = [set() for _ in starts]
+    for match in _EMOTION_RE.finditer(folded):
+        doc = bisect.bisect_right(starts, match.start()) - 1
+        matched[doc].add(_WHITESPACE_RE.sub(' ', match.group()))
 
-def get_ai_response(question: str, context: str = "", language: str = "Spanish", user_preferences: Dict = None) -> Dict[str, Any]:
-    """Get AI response for the user's question."""
+    return [_score_emotions(keywords) for keywords in matched]
+
+def _import_backend():
+    """Put .backend on sys.path so its modules import from any working directory."""
+    if BACKEND_DIR not in sys.path:
+        sys.path.append(BACKEND_DIR)
+
+def get_ai_response(question: str, context: str = "", language: str = "Spanish", user_preferences: Dict = None, client=None) -> Dict[str, Any]:
+    """Get AI response for the user's question.
+
+    `client` is an LLMClient; by default the backend's process-wide one.
+    """
     try:
         user_preferences = user_preferences or {}
         
@@ -91,68 +141,51 @@ def get_ai_response(question: str, context: str = "", language: str = "Spanish",
         Mensaje del usuario: {question}
         '''
         
-        logger.info("Sending request to OpenAI")
-        try:
-            response = openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres Nevin, un asistente virtual amigable y empático que ayuda a encontrar respuestas bíblicas y comparte pensamientos inspiradores de literatura cristiana como complemento."
-                    },
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            if response.choices[0].message.content:
-                response_text = response.choices[0].message.content.replace("\n", "<br>")
-            
-            # Generar PDF si es un seminario
-            pdf_url = None
-            if "Seminario generado" in response_text:
-                try:
-                    from seminar_generator import SeminarGenerator
-                    generator = SeminarGenerator()
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"seminar_{timestamp}.pdf"
-                    output_dir = os.path.join('static', 'seminars')
-                    os.makedirs(output_dir, exist_ok=True)
-                    filepath = os.path.join(output_dir, filename)
-                    
-                    if generator.export_to_pdf({"content": response_text}, filepath):
-                        pdf_url = f"/static/seminars/{filename}"
-                        logger.info(f"PDF generado exitosamente: {filepath}")
-                        response_text += f"\n\n[PDF_LINK]"  # Marcador para el frontend
-                        return {
-                            "success": True,
-                            "response": response_text,
-                            "pdf_url": pdf_url
-                        }
-                    
-                    response_text += f"\n\nPuedes descargar este seminario en formato PDF aquí: {pdf_url}"
-                    
-                    return {
-                        "success": True,
-                        "response": response_text,
-                        "pdf_url": pdf_url
-                    }
-                except Exception as e:
-                    logger.error(f"Error generando PDF: {str(e)}")
-
-            # Retornar la respuesta y detener el procesamiento
-            return {
-                "success": True,
-                "response": response_text,
-                "pdf_url": pdf_url
-            }
-            
-        except OpenAIError as e:
-            logger.error(f"OpenAI API Error: {str(e)}")
+        # Same provider selection, hedging and failover as the /api/nevin/*
+        # endpoints (.backend/providers.py), sized by the chat router.
+        _import_backend()
+        from nevin import ANTHROPIC_MODEL, CHAT_MAX_TOKENS, log_usage, response_text, usage_summary
+        from providers import get_llm_client
+        from query_router import route_chat
+
+        route = route_chat({'message': question})
+        payload = {
+            "model": route.model if route else ANTHROPIC_MODEL,
+            "max_tokens": route.max_tokens if route else CHAT_MAX_TOKENS,
+            "system": "Eres Nevin, un asistente virtual amigable y empático que ayuda a encontrar respuestas bíblicas y comparte pensamientos inspiradores de literatura cristiana como complemento.",
+            "messages": [{"role": "user", "content": prompt}]
+        }
+
+        logger.info("Sending request to the AI provider")
+        _, result = (client or get_llm_client()).complete('chat', payload)
+        if result is None:
             return {
                 "success": False,
-                "error": "Lo siento, hubo un error al procesar tu pregunta con OpenAI. Por favor, intenta nuevamente."
+                "error": "Lo siento, hubo un error al procesar tu pregunta. Por favor, intenta nuevamente."
             }
-            
+        log_usage('chat', usage_summary(result.get('usage')))
+        reply = response_text(result).replace("\n", "<br>")
+
+        # Los seminarios se renderizan a PDF en segundo plano; el cliente
+        # consulta pdf_job['status_url'] hasta que pdf_url esté listo.
+        pdf_url = None
+        pdf_job = None
+        if "Seminario generado" in reply:
+            try:
+                pdf_job = submit_seminar(reply)
+                pdf_url = pdf_job['pdf_url']
+                if pdf_url:
+                    reply += "\n\n[PDF_LINK]"  # Marcador para el frontend
+            except Exception as e:
+                logger.error(f"Error encolando PDF: {str(e)}")
+
+        return {
+            "success": True,
+            "response": reply,
+            "pdf_url": pdf_url,
+            "pdf_job": pdf_job
+        }
+
     except Exception as e:
         logger.error(f"Error in get_ai_response: {str(e)}")
         return {
@@ -0,0 +1,182 @@
+"""
+Background PDF rendering for generated seminars.
+
+Rendering runs on a small worker pool so a chat reply never waits for it.
+Jobs are keyed by a hash of the seminar content: submitting the same
+seminar again returns the existing job (or the PDF already on disk). The
+rendered files under static/seminars are kept within a size budget, oldest
+first out.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SEMINAR_OUTPUT_DIR = os.environ.get('NEVIN_SEMINAR_DIR', os.path.join('static', 'seminars'))
+SEMINAR_URL_PREFIX = '/static/seminars'
+SEMINAR_STATUS_URL = '/api/seminars/{job_id}'
+SEMINAR_WORKERS = int(os.environ.get('NEVIN_SEMINAR_WORKERS', '2'))
+SEMINAR_BUDGET_BYTES = int(float(os.environ.get('NEVIN_SEMINAR_BUDGET_MB', '200')) * 1024 * 1024)
+# Finished jobs remembered for status polls; older ones are forgotten.
+SEMINAR_MAX_JOBS = 1000
+
+PENDING_STATES = ('queued', 'running')
+
+
+def seminar_job_id(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]
+
+
+class SeminarJobQueue:
+    """Worker pool rendering seminars to PDF, deduplicated by content hash."""
+
+    def __init__(self, output_dir: str = SEMINAR_OUTPUT_DIR, workers: int = SEMINAR_WORKERS,
+                 budget_bytes: int = SEMINAR_BUDGET_BYTES, max_jobs: int = SEMINAR_MAX_JOBS):
+        self.output_dir = output_dir
+        self.budget_bytes = budget_bytes
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='seminar-pdf')
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.output_dir, f'seminar_{job_id}.pdf')
+
+    def _view(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        done = job['status'] == 'done'
+        return {
+            'id': job['id'],
+            'status': job['status'],
+            'pdf_url': f"{SEMINAR_URL_PREFIX}/seminar_{job['id']}.pdf" if done else None,
+            'status_url': SEMINAR_STATUS_URL.format(job_id=job['id']),
+            'error': job.get('error'),
+        }
+
+    def _remember(self, job: Dict[str, Any]) -> None:
+        self._jobs[job['id']] = job
+        self._jobs.move_to_end(job['id'])
+        while len(self._jobs) > self.max_jobs:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest['status'] in PENDING_STATES:
+                break
+            del self._jobs[oldest_id]
+
+    def submit(self, content: str) -> Dict[str, Any]:
+        """Queue `content` for rendering; returns the job's status view at once."""
+        job_id = seminar_job_id(content)
+        path = self._path(job_id)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job['status'] in PENDING_STATES:
+                return self._view(job)
+            if os.path.exists(path):
+                # Already rendered (possibly by an earlier process): refresh its age.
+                os.utime(path)
+                job = {'id': job_id, 'status': 'done', 'created_at': time.time()}
+                self._remember(job)
+                return self._view(job)
+            job = {'id': job_id, 'status': 'queued', 'created_at': time.time()}
+            self._remember(job)
+        self._executor.submit(self._render, job, content, path)
+        return self._view(job)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status view for a job, or None if it is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job['status'] == 'done' and not os.path.exists(self._path(job_id)):
+                job['status'] = 'expired'
+            return self._view(job)
+
+    def _render(self, job: Dict[str, Any], content: str, path: str) -> None:
+        with self._lock:
+            job['status'] = 'running'
+        started = time.perf_counter()
+        partial_path = f'{path}.{threading.get_ident()}.part'
+        try:
+            from seminar_generator import SeminarGenerator
+            if not SeminarGenerator().export_to_pdf({'content': content}, partial_path):
+                raise RuntimeError('export_to_pdf returned no file')
+            os.replace(partial_path, path)
+        except Exception as e:
+            logger.error(f"Error generando PDF {job['id']}: {str(e)}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            with self._lock:
+                job['status'] = 'failed'
+                job['error'] = 'No se pudo generar el PDF'
+            return
+
+        with self._lock:
+            job['status'] = 'done'
+        logger.info(f'PDF generado en {time.perf_counter() - started:.2f}s: {path}')
+        self._evict(keep=path)
+
+    def _evict(self, keep: str) -> None:
+        """Delete the least recently written PDFs until the directory fits the budget."""
+        with self._evict_lock:
+            files = []
+            for entry in os.scandir(self.output_dir):
+                if entry.is_file() and entry.name.startswith('seminar_') and entry.name.endswith('.pdf'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.budget_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                    logger.info(f'PDF eliminado por presupuesto de espacio: {path}')
+                except OSError as e:
+                    logger.error(f'Error eliminando {path}: {str(e)}')
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_seminar_queue() -> SeminarJobQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = SeminarJobQueue()
+    return _queue
+
+
+def submit_seminar(content: str) -> Dict[str, Any]:
+    return get_seminar_queue().submit(content)
+
+
+def seminar_job_status(job_id: str) -> Optional[Dict[str, Any]]:
+    return get_seminar_queue().status(job_id)
+
+
+def seminar_blueprint():
+    """Flask blueprint serving GET /api/seminars/<job_id> for status polls."""
+    from flask import Blueprint, jsonify
+
+    blueprint = Blueprint('seminars', __name__)
+
+    @blueprint.route('/api/seminars/<job_id>', methods=['GET'])
+    def seminar_status(job_id):
+        job = seminar_job_status(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+        return jsonify({'success': True, 'job': job})
+
+    return blueprint
@@ -1,6 +1,7 @@
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import { Moment, MomentPreview, ChatMessage } from '../types/nevin';
 import { getBackendUrl } from '../config';
+import { getDeviceId } from '../utils/deviceId';
 
 const MOMENTS_STORAGE_KEY = 'nevin_moments';
 const ACTIVE_MOMENT_KEY = 'nevin_active_moment';
@@ -168,6 +169,7 @@ export class MomentsService {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'X-Device-Id': await getDeviceId(),
         },
         body: JSON.stringify({ conversation: conversationText })
       });
@@ -3,6 +3,7 @@ import AsyncStorage from '@react-native-async-storage/async-storage';
 import { Platform } from 'react-native';
 import { NEVIN_SYSTEM_PROMPT, VERSE_COMMENTARY_PROMPT } from '../constants/nevinTheology';
 import { getBackendUrl } from '../config';
+import { getDeviceId } from '../utils/deviceId';
 
 export interface VerseCommentaryRequest {
   book: string;
@@ -45,6 +46,7 @@ export class NevinAIService {
         headers: {
           'Content-Type': 'application/json',
           'Accept': 'application/json',
+          'X-Device-Id': await getDeviceId(),
         },
         body: JSON.stringify({
           message,
@@ -127,6 +129,7 @@ export class NevinAIService {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'X-Device-Id': await getDeviceId(),
         },
         body: JSON.stringify({
           book: request.book,
@@ -1,147 +1,83 @@
 import { BibleVerse, Book } from '../types/bible';
+import { getBackendUrl } from '../config';
 
-let allVerses: any[] | null = null;
-let isLoading = false;
-let loadPromise: Promise<void> | null = null;
+async function fetchBible(path: string): Promise<any | null> {
+  try {
+    const response = await fetch(`${getBackendUrl()}/api/bible/${path}`);
+    if (!response.ok) return null;
+    const data = await response.json();
+    return data.success ? data : null;
+  } catch (error) {
+    console.error('Error fetching Bible data:', error);
+    return null;
+  }
+}
+
+let remoteBooks: any[] | null = null;
+let loadPromise: Promise<any[] | null> | null = null;
 
-async function loadVerses(): Promise<void> {
-  if (allVerses !== null) return;
+async function fetchBooks(): Promise<any[] | null> {
+  if (remoteBooks) return remoteBooks;
   if (loadPromise) return loadPromise;
-  
-  isLoading = true;
+
   loadPromise = (async () => {
-    try {
-      const versesData = require('../../assets/bible_data/all_verses.json');
-      allVerses = versesData;
-      console.log(`Loaded ${allVerses?.length || 0} verses for web fallback`);
-    } catch (error) {
-      console.error('Error loading verses JSON:', error);
-      allVerses = [];
-    } finally {
-      isLoading = false;
+    const data = await fetchBible('books');
+    remoteBooks = data && data.books.length > 0 ? data.books : null;
+    if (remoteBooks) {
+      console.log(`Loaded ${remoteBooks.length} books from the backend`);
     }
+    return remoteBooks;
   })();
-  
-  return loadPromise;
+
+  try {
+    return await loadPromise;
+  } finally {
+    loadPromise = null;
+  }
 }
 
 export class WebBibleService {
   static async initialize(): Promise<boolean> {
-    await loadVerses();
-    return allVerses !== null && allVerses.length > 0;
+    return (await fetchBooks()) !== null;
   }
 
   static isReady(): boolean {
-    return allVerses !== null && allVerses.length > 0;
+    return remoteBooks !== null;
   }
 
   static async getBooks(): Promise<Book[]> {
-    await loadVerses();
-    if (!allVerses) return [];
-    
-    const bookMap = new Map<string, { book_id: number; chapters: Set<number> }>();
-    
-    for (const verse of allVerses) {
-      if (!bookMap.has(verse.book_name)) {
-        bookMap.set(verse.book_name, { book_id: verse.book_id, chapters: new Set() });
-      }
-      bookMap.get(verse.book_name)!.chapters.add(verse.chapter);
-    }
-    
-    const books: Book[] = [];
-    bookMap.forEach((data, name) => {
-      books.push({
-        id: data.book_id,
-        name: name,
-        book_number: data.book_id,
-        testament: data.book_id <= 39 ? 'old' : 'new',
-        chapters: data.chapters.size
-      });
-    });
-    
-    return books.sort((a, b) => a.book_number - b.book_number);
+    const remote = await fetchBooks();
+    if (!remote) return [];
+
+    return remote.map((book: any) => ({
+      id: book.id,
+      name: book.name,
+      book_number: book.book_number,
+      testament: book.book_number <= 39 ? 'old' : 'new',
+      chapters: book.chapters
+    }));
   }
 
   static async getChaptersCount(bookName: string): Promise<number[]> {
-    await loadVerses();
-    if (!allVerses) return [];
-    
-    const chapters = new Set<number>();
-    for (const verse of allVerses) {
-      if (verse.book_name === bookName) {
-        chapters.add(verse.chapter);
-      }
-    }
-    
-    return Array.from(chapters).sort((a, b) => a - b);
+    const remote = await fetchBooks();
+    const book = remote?.find((b: any) => b.name === bookName);
+    if (!book?.chapters) return [];
+
+    return Array.from({ length: book.chapters }, (_, i) => i + 1);
   }
 
   static async getVerses(bookName: string, chapter: number): Promise<BibleVerse[]> {
-    await loadVerses();
-    if (!allVerses) return [];
-    
-    const verses = allVerses
-      .filter(v => v.book_name === bookName && v.chapter === chapter)
-      .map(v => ({
-        id: v.id,
-        book_id: v.book_id,
-        chapter: v.chapter,
-        verse: v.verse,
-        text: v.text_spanish,
-        text_tzotzil: v.text_tzotzil,
-        book_name: v.book_name
-      }))
-      .sort((a, b) => a.verse - b.verse);
-    
-    return verses;
+    const remote = await fetchBible(`${encodeURIComponent(bookName)}/${chapter}`);
+    return remote ? remote.verses : [];
   }
 
   static async searchVerses(query: string): Promise<BibleVerse[]> {
-    await loadVerses();
-    if (!allVerses) return [];
-    
-    const lowerQuery = query.toLowerCase();
-    const results = allVerses
-      .filter(v => 
-        v.text_spanish?.toLowerCase().includes(lowerQuery) ||
-        v.text_tzotzil?.toLowerCase().includes(lowerQuery)
-      )
-      .slice(0, 100)
-      .map(v => ({
-        id: v.id,
-        book_id: v.book_id,
-        chapter: v.chapter,
-        verse: v.verse,
-        text: v.text_spanish,
-        text_tzotzil: v.text_tzotzil,
-        book_name: v.book_name
-      }));
-    
-    return results;
+    const remote = await fetchBible(`search?q=${encodeURIComponent(query)}&limit=100`);
+    return remote ? remote.verses : [];
   }
 
   static async getVerse(bookName: string, chapter: number, verse: number): Promise<BibleVerse | null> {
-    await loadVerses();
-    if (!allVerses) return null;
-    
-    const found = allVerses.find(v => 
-      v.book_name === bookName && 
-      v.chapter === chapter && 
-      v.verse === verse
-    );
-    
-    if (found) {
-      return {
-        id: found.id,
-        book_id: found.book_id,
-        chapter: found.chapter,
-        verse: found.verse,
-        text: found.text_spanish,
-        text_tzotzil: found.text_tzotzil,
-        book_name: found.book_name
-      };
-    }
-    
-    return null;
+    const remote = await fetchBible(`${encodeURIComponent(bookName)}/${chapter}/${verse}`);
+    return remote ? remote.verses[0] ?? null : null;
   }
 }
@@ -0,0 +1,33 @@
+import AsyncStorage from '@react-native-async-storage/async-storage';
+
+const DEVICE_ID_KEY = 'nevin_device_id';
+
+let deviceId: string | null = null;
+
+function randomId(): string {
+  const alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789';
+  let id = '';
+  for (let i = 0; i < 32; i++) {
+    id += alphabet[Math.floor(Math.random() * alphabet.length)];
+  }
+  return id;
+}
+
+/**
+ * Random per-installation id sent as X-Device-Id, so the backend rate-limits
+ * this device rather than every user behind the same proxy address.
+ */
+export async function getDeviceId(): Promise<string> {
+  if (deviceId) return deviceId;
+  try {
+    deviceId = await AsyncStorage.getItem(DEVICE_ID_KEY);
+    if (!deviceId) {
+      deviceId = randomId();
+      await AsyncStorage.setItem(DEVICE_ID_KEY, deviceId);
+    }
+  } catch (error) {
+    console.error('Error loading device id:', error);
+    deviceId = deviceId || randomId();
+  }
+  return deviceId;
+}